@@ -0,0 +1,225 @@
+import marshal
+import sys
+
+# Slotted AST node classes with integer kinds, and a binary form for caching.
+# Parser still builds dicts, which remain the export format; from_dict/to_dict
+# convert between the two. Nodes also answer node['type'], node['left'],
+# node.get(...) and 'value' in node, so code written against the dict form
+# (Generator, SemanticAnalyzer) works on either.
+
+class Node:
+    __slots__ = ()
+    kind = None
+    type_name = None
+    # Every field in order; optional ones may be left unset, like a missing dict key
+    fields = ()
+    optional = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.type_name
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key == 'type' or hasattr(self, key)
+
+    def get(self, key, default=None):
+        if key == 'type':
+            return self.type_name
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, name, MISSING) == getattr(other, name, MISSING) for name in self.fields)
+
+    def __repr__(self):
+        present = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.fields if hasattr(self, name))
+        return f"{type(self).__name__}({present})"
+
+    def to_dict(self):
+        node = {'type': self.type_name}
+        for name in self.fields:
+            if hasattr(self, name):
+                node[name] = export(getattr(self, name))
+        return node
+
+MISSING = object()
+
+class Number(Node):
+    __slots__ = fields = ('value',)
+    kind, type_name = 0, 'number'
+
+class Variable(Node):
+    __slots__ = fields = ('name', 'slot', 'value')
+    optional = ('slot', 'value')
+    kind, type_name = 1, 'variable'
+
+class Char(Node):
+    __slots__ = fields = ('value',)
+    kind, type_name = 2, 'char'
+
+class String(Node):
+    __slots__ = fields = ('value',)
+    kind, type_name = 3, 'string'
+
+class BinaryOperation(Node):
+    __slots__ = fields = ('operator', 'left', 'right')
+    kind, type_name = 4, 'binary_operation'
+
+class CompoundAssignment(Node):
+    __slots__ = fields = ('operator', 'left', 'right')
+    kind, type_name = 5, 'compound_assignment'
+
+class VariableDeclaration(Node):
+    __slots__ = fields = ('data_type', 'variable', 'slot', 'value', 'expression', 'line', 'column')
+    optional = ('slot', 'value', 'expression', 'line', 'column')
+    kind, type_name = 6, 'variable_declaration'
+
+class VariableAssignment(Node):
+    __slots__ = fields = ('variable', 'slot', 'value', 'expression', 'line', 'column')
+    optional = ('slot', 'value', 'line', 'column')
+    kind, type_name = 7, 'variable_assignment'
+
+class InputStatement(Node):
+    __slots__ = fields = ('variable', 'slot', 'value', 'line', 'column')
+    optional = ('slot', 'value', 'line', 'column')
+    kind, type_name = 8, 'input_statement'
+
+class OutputStatement(Node):
+    __slots__ = fields = ('expressions', 'line', 'column')
+    optional = ('line', 'column')
+    kind, type_name = 9, 'output_statement'
+
+class IfStatement(Node):
+    __slots__ = fields = ('condition', 'body', 'line', 'column')
+    optional = ('line', 'column')
+    kind, type_name = 10, 'if_statement'
+
+class ForStatement(Node):
+    __slots__ = fields = ('condition', 'body', 'line', 'column')
+    optional = ('line', 'column')
+    kind, type_name = 11, 'for_statement'
+
+NODE_CLASSES = (Number, Variable, Char, String, BinaryOperation, CompoundAssignment,
+                VariableDeclaration, VariableAssignment, InputStatement, OutputStatement,
+                IfStatement, ForStatement)
+CLASS_BY_KIND = {cls.kind: cls for cls in NODE_CLASSES}
+CLASS_BY_TYPE = {cls.type_name: cls for cls in NODE_CLASSES}
+
+def export(value):
+    if isinstance(value, Node):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [export(item) for item in value]
+    return value
+
+def from_dict(node):
+    """
+    Convert a dict node (and its children) into node objects.
+    """
+    cls = CLASS_BY_TYPE[node['type']]
+    values = {}
+    for name in cls.fields:
+        if name in node:
+            values[name] = convert(node[name])
+    return cls(**values)
+
+def convert(value):
+    if isinstance(value, dict):
+        return from_dict(value)
+    if isinstance(value, list):
+        return [convert(item) for item in value]
+    return value
+
+def from_dicts(ast):
+    return [from_dict(node) for node in ast]
+
+def to_dicts(ast):
+    return [node.to_dict() for node in ast]
+
+# Binary form: a header followed by the marshalled AST, where each node is the
+# tuple (kind, presence mask of optional fields, *present field values) and
+# lists of nodes are lists. marshal is written in C, so both directions avoid
+# per-byte Python work; the format is tied to the Python version like .pyc files,
+# so the header also names the interpreter and marshal version that wrote it.
+MAGIC = b'CPLAST\x04'
+RUNTIME_TAG = f"{sys.implementation.cache_tag}/{marshal.version}".encode('ascii')
+HEADER = MAGIC + RUNTIME_TAG + b'\n'
+
+def pack(value):
+    if isinstance(value, Node):
+        mask = 0
+        packed = [value.kind, 0]
+        for index, name in enumerate(value.fields):
+            field = getattr(value, name, MISSING)
+            if field is MISSING:
+                continue
+            mask |= 1 << index
+            packed.append(pack(field))
+        packed[1] = mask
+        return tuple(packed)
+    if isinstance(value, list):
+        return [pack(item) for item in value]
+    return value
+
+def unpack(value):
+    if isinstance(value, tuple):
+        cls = CLASS_BY_KIND[value[0]]
+        mask = value[1]
+        node = cls.__new__(cls)
+        position = 2
+        for index, name in enumerate(cls.fields):
+            if mask & (1 << index):
+                setattr(node, name, unpack(value[position]))
+                position += 1
+        return node
+    if isinstance(value, list):
+        return [unpack(item) for item in value]
+    return value
+
+def dumps(ast):
+    """
+    Serialize a list of nodes (objects or dicts) to bytes.
+    """
+    nodes = [from_dict(node) if isinstance(node, dict) else node for node in ast]
+    return HEADER + marshal.dumps([pack(node) for node in nodes])
+
+def loads(data):
+    """
+    Deserialize bytes produced by dumps() into a list of node objects. Data
+    written by another Python is rejected rather than handed to marshal.
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a serialized AST")
+    if not data.startswith(HEADER):
+        tag = data[len(MAGIC):].split(b'\n', 1)[0].decode('ascii', 'replace')
+        raise ValueError(f"Serialized AST was written by {tag}, not {RUNTIME_TAG.decode('ascii')}")
+    return [unpack(node) for node in marshal.loads(data[len(HEADER):])]
+
+def main():
+    import lexer
+    import parser
+
+    input_code = """
+    tally x imbue with 4 augmented by 2;
+    cast spell "x is " spell x;
+    """
+    ast = from_dicts(parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse())
+    data = dumps(ast)
+    print(ast)
+    print(len(data), "bytes")
+    print(loads(data) == ast)
+
+if __name__ == "__main__":
+    main()
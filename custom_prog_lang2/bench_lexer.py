@@ -0,0 +1,50 @@
+import sys
+import time
+
+import lexer
+import scanner
+
+# Compares the regex alternation lexer with the table-driven scanner
+PROGRAM = """tally counter imbue with 0;
+verse greeting imbue with "hello there";
+/* running total
+   across the loop */
+counter imbue with counter augmented by 12 amplified by (3 diminished by 1);
+portion ratio imbue with 12.5 fragmented by 4;
+summon counter; // read it back
+cast spell greeting spell counter;
+"""
+
+def time_best(function, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    text = PROGRAM * copies
+
+    regex_tokens = [(token.type, token.value, token.line, token.column) for token in lexer.iter_tokens(text)]
+    dfa_tokens = [(token.type, token.value, token.line, token.column) for token in scanner.dfa_lexical_analyzer(text)]
+    if regex_tokens != dfa_tokens:
+        raise AssertionError("Scanners disagree")
+
+    print(f"{len(text)} characters, {len(regex_tokens)} tokens, best of {repeat}")
+    results = [
+        ('re.finditer lexer', time_best(lambda source: list(lexer.TOKEN_REGEX.finditer(source)), text, repeat)),
+        ('lexer.scan_tokens', time_best(lambda source: list(lexer.scan_tokens(source)), text, repeat)),
+        ('scanner.scan', time_best(lambda source: list(scanner.scan(source)), text, repeat)),
+        ('list(lexer.iter_tokens)', time_best(lambda source: list(lexer.iter_tokens(source)), text, repeat)),
+        ('scanner.dfa_lexical_analyzer', time_best(scanner.dfa_lexical_analyzer, text, repeat)),
+    ]
+    for name, elapsed in results:
+        print(f"{name:30} {elapsed * 1000:9.2f} ms  {len(regex_tokens) / elapsed / 1e6:6.2f} M tokens/s")
+
+if __name__ == "__main__":
+    main()
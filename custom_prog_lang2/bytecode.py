@@ -0,0 +1,556 @@
+import array
+import sys
+
+import ir
+import lexer
+import parser
+import semantic
+import simulator
+
+# Bytecode backend: compiles a checked AST into a CodeObject, a flat array of
+# opcodes and operands with every variable resolved to its slot, and runs it
+# on a stack VM. Nothing is assembled or simulated, so this is the quick way
+# to run a program, and the reference for what trial and cycle mean:
+#
+# - `trial (c) { body }` runs body once if c is not zero.
+# - `cycle (c) { body }` tests c before every run of body, including the
+#   first, and stops as soon as it is zero.
+# - Variables declared in a body are new each time it runs: a declaration
+#   without an initializer sets its variable to the type's default again.
+#
+# Values follow the generated MIPS: tallies are 32-bit and wrap, division
+# truncates toward zero, portions are single precision and print as MARS
+# prints them, and a verse holds at most VERSE_LIMIT bytes of UTF-8, cut
+# between characters (see fit_verse). and/or
+# evaluate both operands, as `x augment by 1` may store on either side.
+#
+# Dividing a tally by zero stops the program: the VM raises
+# ZeroDivisionError, and the generated MIPS traps with teq before its div
+# (which would otherwise leave an arbitrary result). Dividing a portion by
+# zero does not stop it and gives what div.s gives, Infinity, -Infinity or
+# NaN (see simulator.divide_by_zero).
+
+# Opcodes. Those in OPERAND_OPS are followed by one operand in the code array.
+(
+    CONST, LOAD, STORE, DUP,
+    ADD, SUB, MUL, DIV, FADD, FSUB, FMUL, FDIV, TO_FLOAT,
+    LT, GT, LE, GE, EQ, NE, AND, OR, CONCAT,
+    JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+    PRINT, PRINT_PORTION, READ_TALLY, READ_PORTION, READ_VERSE, HALT,
+) = range(31)
+
+OPCODE_NAMES = (
+    'CONST', 'LOAD', 'STORE', 'DUP',
+    'ADD', 'SUB', 'MUL', 'DIV', 'FADD', 'FSUB', 'FMUL', 'FDIV', 'TO_FLOAT',
+    'LT', 'GT', 'LE', 'GE', 'EQ', 'NE', 'AND', 'OR', 'CONCAT',
+    'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE',
+    'PRINT', 'PRINT_PORTION', 'READ_TALLY', 'READ_PORTION', 'READ_VERSE', 'HALT',
+)
+
+OPERAND_OPS = frozenset((CONST, LOAD, STORE, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+                         READ_TALLY, READ_PORTION, READ_VERSE))
+
+# Opcodes of the arithmetic operators on tallies and on portions, and of the comparisons
+TALLY_OPS = {'augmented by': ADD, 'diminished by': SUB, 'amplified by': MUL, 'fragmented by': DIV}
+PORTION_OPS = {'augmented by': FADD, 'diminished by': FSUB, 'amplified by': FMUL, 'fragmented by': FDIV}
+COMPARISON_OPS = {'falls below': LT, 'exceeds': GT, 'at most': LE, 'at least': GE,
+                  'mirrors': EQ, 'defies': NE, 'and': AND, 'or': OR}
+
+# Compound operators act like their plain forms and store the result
+PLAIN_OPERATORS = {'augment by': 'augmented by', 'diminish by': 'diminished by',
+                   'amplify by': 'amplified by', 'fragment by': 'fragmented by'}
+
+DEFAULT_VALUES = {'tally': 0, 'portion': 0.0, 'rune': '\0', 'verse': ''}
+
+# UTF-8 bytes a verse holds, as many as the generated code's buffers
+VERSE_LIMIT = ir.VERSE_BUFFER_SIZE - 1
+
+TALLY_MIN = -0x80000000
+TALLY_MAX = 0x7FFFFFFF
+
+def fit_verse(text):
+    """
+    text cut to the VERSE_LIMIT bytes of UTF-8 a verse holds, without
+    splitting a character, as the generated code cuts it.
+    """
+    if len(text) * 4 <= VERSE_LIMIT:
+        # No character takes more than four bytes
+        return text
+    data = text.encode('utf-8')
+    if len(data) <= VERSE_LIMIT:
+        return text
+    return simulator.fit_utf8(data, VERSE_LIMIT).decode('utf-8')
+
+class CodeObject:
+    """
+    A compiled program: code is an array of opcodes, each followed by its
+    operand if it has one; constants are what CONST pushes; slots holds the
+    (name, data type) of each variable slot.
+    """
+    __slots__ = ('code', 'constants', 'slots')
+
+    def __init__(self, code, constants, slots):
+        self.code = code
+        self.constants = constants
+        self.slots = slots
+
+    def disassemble(self):
+        lines = []
+        pc = 0
+        while pc < len(self.code):
+            op = self.code[pc]
+            if op in OPERAND_OPS:
+                operand = self.code[pc + 1]
+                if op == CONST:
+                    note = repr(self.constants[operand])
+                elif op in (LOAD, STORE, READ_TALLY, READ_PORTION, READ_VERSE):
+                    note = self.slots[operand][0]
+                else:
+                    note = ''
+                lines.append(f"{pc:5} {OPCODE_NAMES[op]:<14} {operand:<5} {note}".rstrip())
+                pc += 2
+            else:
+                lines.append(f"{pc:5} {OPCODE_NAMES[op]}")
+                pc += 1
+        return '\n'.join(lines)
+
+class Compiler:
+    """
+    Compiles an AST built by Parser(tokens, evaluate=False) and checked by
+    semantic.SemanticAnalyzer into a CodeObject.
+    """
+    def __init__(self):
+        self.code = array.array('i')
+        self.constants = []
+        self.constant_indexes = {}
+        # (name, data type) by slot; variables parsed without slots fall back to their name
+        self.slots = []
+        self.slot_indexes = {}
+        self.handlers = {
+            'variable_declaration': self.compile_variable_declaration,
+            'variable_assignment': self.compile_variable_assignment,
+            'input_statement': self.compile_input_statement,
+            'output_statement': self.compile_output_statement,
+            'if_statement': self.compile_if_statement,
+            'for_statement': self.compile_for_statement,
+        }
+
+    def compile(self, ast):
+        for node in ast:
+            self.compile_statement(node)
+        self.emit(HALT)
+        return CodeObject(self.code, self.constants, self.slots)
+
+    def emit(self, op, operand=None):
+        self.code.append(op)
+        if operand is not None:
+            self.code.append(operand)
+
+    def emit_jump(self, op, target=0):
+        """
+        Emit a jump and return the position of its target, for patch().
+        """
+        self.emit(op, target)
+        return len(self.code) - 1
+
+    def patch(self, position):
+        """
+        Point the jump whose target is at position to the next instruction.
+        """
+        self.code[position] = len(self.code)
+
+    def constant(self, value):
+        # Keyed by type too, so 1 and 1.0 stay apart
+        key = (type(value), value)
+        index = self.constant_indexes.get(key)
+        if index is None:
+            index = self.constant_indexes[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def declare(self, node):
+        key = node['variable'] if node.get('slot') is None else node['slot']
+        self.slot_indexes[key] = len(self.slots)
+        self.slots.append((node['variable'], node['data_type']))
+        return self.slot_indexes[key]
+
+    def lookup(self, slot, name):
+        """
+        The slot index of a variable reference and its data type.
+        """
+        index = self.slot_indexes[name if slot is None else slot]
+        return index, self.slots[index][1]
+
+    def compile_statement(self, node):
+        handler = self.handlers.get(node['type'])
+        if handler is None:
+            raise ValueError(f"Unknown node type: {node['type']}")
+        handler(node)
+
+    def compile_variable_declaration(self, node):
+        # The initializer cannot refer to the variable, so it is compiled first
+        if 'expression' in node:
+            self.compile_value(node['data_type'], node['variable'], node['expression'])
+        else:
+            self.emit(CONST, self.constant(DEFAULT_VALUES[node['data_type']]))
+        self.emit(STORE, self.declare(node))
+
+    def compile_variable_assignment(self, node):
+        index, data_type = self.lookup(node.get('slot'), node['variable'])
+        self.compile_value(data_type, node['variable'], node['expression'])
+        self.emit(STORE, index)
+
+    def compile_value(self, data_type, name, expression):
+        """
+        Compile expression as a value for a variable of data_type.
+        """
+        if data_type == 'rune' and expression['type'] == 'string':
+            # Runes are written as one-character string literals
+            self.emit(CONST, self.constant(simulator.unescape(expression['value'][1:-1])))
+            return
+        self.convert(self.compile_expression(expression), data_type, name)
+
+    def convert(self, value_type, data_type, name):
+        """
+        Emit the conversion of the value on the stack for storing in a variable.
+        """
+        if data_type == 'portion' and value_type == 'tally':
+            self.emit(TO_FLOAT)
+        elif data_type == 'tally' and value_type == 'portion':
+            raise ValueError(f"Cannot store a portion value in tally '{name}'")
+
+    def compile_input_statement(self, node):
+        index, data_type = self.lookup(node.get('slot'), node['variable'])
+        if data_type == 'tally':
+            self.emit(READ_TALLY, index)
+        elif data_type == 'portion':
+            self.emit(READ_PORTION, index)
+        elif data_type == 'verse':
+            self.emit(READ_VERSE, index)
+        else:
+            raise TypeError(f"Unsupported data type: {data_type}")
+
+    def compile_output_statement(self, node):
+        for expression in node['expressions']:
+            if expression['type'] == 'string':
+                self.emit(CONST, self.constant(simulator.unescape(expression['value'][1:-1])))
+                self.emit(PRINT)
+                continue
+            index, data_type = self.lookup(expression.get('slot'), expression['name'])
+            self.emit(LOAD, index)
+            self.emit(PRINT_PORTION if data_type == 'portion' else PRINT)
+
+    def compile_if_statement(self, node):
+        self.compile_expression(node['condition'])
+        end = self.emit_jump(JUMP_IF_FALSE)
+        for statement in node['body']:
+            self.compile_statement(statement)
+        self.patch(end)
+
+    def compile_for_statement(self, node):
+        # Bottom-tested like the generated MIPS: one conditional jump per iteration
+        test = self.emit_jump(JUMP)
+        body = len(self.code)
+        for statement in node['body']:
+            self.compile_statement(statement)
+        self.patch(test)
+        self.compile_expression(node['condition'])
+        self.emit(JUMP_IF_TRUE, body)
+
+    def compile_expression(self, node):
+        """
+        Emit the code pushing the value of an expression; returns its type.
+        """
+        if node['type'] == 'number':
+            if isinstance(node['value'], float):
+                # Rounded as the .float the generator pools it in
+                self.emit(CONST, self.constant(simulator.single(node['value'])))
+                return 'portion'
+            # Wrapped as the li that loads it wraps it
+            self.emit(CONST, self.constant(simulator.wrap(node['value'])))
+            return 'tally'
+        elif node['type'] == 'variable':
+            index, data_type = self.lookup(node.get('slot'), node['name'])
+            self.emit(LOAD, index)
+            return data_type
+        elif node['type'] in ('string', 'char'):
+            text = node['value'][1:-1] if node['type'] == 'string' else node['value']
+            self.emit(CONST, self.constant(fit_verse(simulator.unescape(text))))
+            return 'verse' if node['type'] == 'string' else 'rune'
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            return self.compile_operation(node)
+        raise ValueError(f"Unsupported expression in bytecode compiler: {node['type']}")
+
+    def compile_operation(self, node):
+        operator = PLAIN_OPERATORS.get(node['operator'], node['operator'])
+        left = self.compile_expression(node['left'])
+        # A tally mixed with a portion is converted to one, each as it is pushed
+        left_float = left == 'tally' and self.is_portion(node['right']) and operator not in ('and', 'or')
+        if left_float:
+            self.emit(TO_FLOAT)
+        right = self.compile_expression(node['right'])
+        if right == 'tally' and left == 'portion' and operator not in ('and', 'or'):
+            self.emit(TO_FLOAT)
+
+        if left == 'verse':
+            self.emit(CONCAT)
+            result = 'verse'
+        elif operator in COMPARISON_OPS:
+            self.emit(COMPARISON_OPS[operator])
+            result = 'tally'
+        elif 'portion' in (left, right):
+            self.emit(PORTION_OPS[operator])
+            result = 'portion'
+        else:
+            self.emit(TALLY_OPS[operator])
+            result = 'tally'
+
+        if node['type'] == 'compound_assignment' and node['left']['type'] == 'variable':
+            # `x augment by 1` also stores the result back into x
+            index, data_type = self.lookup(node['left'].get('slot'), node['left']['name'])
+            self.emit(DUP)
+            self.convert(result, data_type, node['left']['name'])
+            self.emit(STORE, index)
+        return result
+
+    def is_portion(self, node):
+        """
+        Whether an expression is a portion, without compiling it.
+        """
+        if node['type'] == 'number':
+            return isinstance(node['value'], float)
+        elif node['type'] == 'variable':
+            return self.lookup(node.get('slot'), node['name'])[1] == 'portion'
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            operator = PLAIN_OPERATORS.get(node['operator'], node['operator'])
+            if operator in COMPARISON_OPS:
+                return False
+            return self.is_portion(node['left']) or self.is_portion(node['right'])
+        return False
+
+class VM:
+    """
+    Runs a CodeObject. run() can be called any number of times; each run
+    starts with every variable at its default.
+    """
+    def __init__(self, code_object):
+        self.code_object = code_object
+        self.stdin = None
+        self.stdout = None
+        self.steps = 0
+
+    def run(self, stdin=None, stdout=None):
+        """
+        Run the program, reading summon input a line at a time from stdin and
+        writing output to stdout (text streams, sys.stdin and sys.stdout by
+        default). Returns the number of instructions executed.
+        """
+        self.stdin = sys.stdin if stdin is None else stdin
+        self.stdout = sys.stdout if stdout is None else stdout
+        code = self.code_object.code
+        constants = self.code_object.constants
+        slots = [DEFAULT_VALUES[data_type] for name, data_type in self.code_object.slots]
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        write = self.stdout.write
+        # Storing into a float array rounds to single precision
+        single = array.array('f', [0.0])
+        steps = 0
+        pc = 0
+        try:
+            while True:
+                op = code[pc]
+                steps += 1
+                if op == LOAD:
+                    push(slots[code[pc + 1]])
+                    pc += 2
+                elif op == CONST:
+                    push(constants[code[pc + 1]])
+                    pc += 2
+                elif op == STORE:
+                    slots[code[pc + 1]] = pop()
+                    pc += 2
+                elif op == ADD:
+                    value = pop()
+                    value += stack[-1]
+                    if not TALLY_MIN <= value <= TALLY_MAX:
+                        value = simulator.wrap(value)
+                    stack[-1] = value
+                    pc += 1
+                elif op == SUB:
+                    value = pop()
+                    value = stack[-1] - value
+                    if not TALLY_MIN <= value <= TALLY_MAX:
+                        value = simulator.wrap(value)
+                    stack[-1] = value
+                    pc += 1
+                elif op == LT:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] < value else 0
+                    pc += 1
+                elif op == JUMP_IF_TRUE:
+                    pc = code[pc + 1] if pop() else pc + 2
+                elif op == JUMP_IF_FALSE:
+                    pc = pc + 2 if pop() else code[pc + 1]
+                elif op == MUL:
+                    value = pop()
+                    value *= stack[-1]
+                    if not TALLY_MIN <= value <= TALLY_MAX:
+                        value = simulator.wrap(value)
+                    stack[-1] = value
+                    pc += 1
+                elif op == DIV:
+                    value = pop()
+                    if value == 0:
+                        raise ZeroDivisionError("Division by zero")
+                    dividend = stack[-1]
+                    quotient = abs(dividend) // abs(value)
+                    if (dividend < 0) != (value < 0):
+                        quotient = -quotient
+                    stack[-1] = quotient if quotient <= TALLY_MAX else simulator.wrap(quotient)
+                    pc += 1
+                elif op == GT:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] > value else 0
+                    pc += 1
+                elif op == LE:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] <= value else 0
+                    pc += 1
+                elif op == GE:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] >= value else 0
+                    pc += 1
+                elif op == EQ:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] == value else 0
+                    pc += 1
+                elif op == NE:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] != value else 0
+                    pc += 1
+                elif op == AND:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] and value else 0
+                    pc += 1
+                elif op == OR:
+                    value = pop()
+                    stack[-1] = 1 if stack[-1] or value else 0
+                    pc += 1
+                elif op == JUMP:
+                    pc = code[pc + 1]
+                elif op == DUP:
+                    push(stack[-1])
+                    pc += 1
+                elif op == FADD:
+                    value = pop()
+                    single[0] = stack[-1] + value
+                    stack[-1] = single[0]
+                    pc += 1
+                elif op == FSUB:
+                    value = pop()
+                    single[0] = stack[-1] - value
+                    stack[-1] = single[0]
+                    pc += 1
+                elif op == FMUL:
+                    value = pop()
+                    single[0] = stack[-1] * value
+                    stack[-1] = single[0]
+                    pc += 1
+                elif op == FDIV:
+                    value = pop()
+                    if value == 0:
+                        stack[-1] = simulator.divide_by_zero(stack[-1], value)
+                    else:
+                        single[0] = stack[-1] / value
+                        stack[-1] = single[0]
+                    pc += 1
+                elif op == TO_FLOAT:
+                    single[0] = stack[-1]
+                    stack[-1] = single[0]
+                    pc += 1
+                elif op == CONCAT:
+                    value = pop()
+                    stack[-1] = fit_verse(stack[-1] + value)
+                    pc += 1
+                elif op == PRINT:
+                    write(str(pop()))
+                    pc += 1
+                elif op == PRINT_PORTION:
+                    write(simulator.format_float(pop()))
+                    pc += 1
+                elif op == READ_TALLY:
+                    slots[code[pc + 1]] = self.read_tally(code[pc + 1])
+                    pc += 2
+                elif op == READ_PORTION:
+                    slots[code[pc + 1]] = self.read_portion(code[pc + 1])
+                    pc += 2
+                elif op == READ_VERSE:
+                    slots[code[pc + 1]] = fit_verse(self.read_line())
+                    pc += 2
+                elif op == HALT:
+                    break
+                else:
+                    raise ValueError(f"Unknown opcode {op} at {pc}")
+        finally:
+            self.steps = steps
+            self.stdout.flush()
+        return steps
+
+    def read_line(self):
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError("End of input")
+        return line
+
+    def read_tally(self, slot):
+        line = self.read_line()
+        try:
+            return simulator.wrap(int(line.strip()))
+        except ValueError:
+            raise ValueError(f"Invalid input for variable '{self.code_object.slots[slot][0]}' of type 'tally'") from None
+
+    def read_portion(self, slot):
+        line = self.read_line()
+        try:
+            value = float(line.strip())
+        except ValueError:
+            raise ValueError(f"Invalid input for variable '{self.code_object.slots[slot][0]}' of type 'portion'") from None
+        return array.array('f', [value])[0]
+
+def compile_source(text):
+    """
+    Lex, parse, check and compile source text to a CodeObject.
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(text), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    return Compiler().compile(ast)
+
+def main():
+    import io
+    import time
+
+    input_code = """
+    tally n;
+    summon n;
+    tally total imbue with 0;
+    tally i imbue with 0;
+    cycle (i falls below n) {
+        total imbue with total augmented by i fragmented by 3;
+        i imbue with i augmented by 1;
+    }
+    portion mean imbue with total fragmented by n;
+    cast spell total spell " " spell mean;
+    """
+    code_object = compile_source(input_code)
+    print(code_object.disassemble())
+    output = io.StringIO()
+    start = time.perf_counter()
+    steps = VM(code_object).run(io.StringIO("100000\n"), output)
+    elapsed = time.perf_counter() - start
+    print(output.getvalue())
+    print(f"{steps} instructions in {elapsed:.3f}s ({steps / elapsed / 1e6:.1f}M/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import io
+import sys
+
+import bytecode
+import closures
+import compiler
+import simulator
+import transpile
+
+# Runs programs on every Python backend and on the MIPS simulator, and
+# reports any whose output differs. A run that stops with an error counts
+# as the output written before it plus the fact that it failed, whatever the
+# exception: the backends raise Python errors where the machine traps. On the
+# simulator the only error that counts is the trap; a program that does not
+# compile or stops any other way is reported as broken, since every backend
+# failing alike would otherwise pass as agreement.
+
+PROGRAMS = [
+    ("""tally x; summon x; tally y imbue with x augmented by 4 amplified by 3; cast spell y;""", "5\n"),
+    ("""tally n imbue with 0; tally total imbue with 0;
+    cycle (n falls below 5) { tally square imbue with n amplified by n; total imbue with total augmented by square;
+    n imbue with n augmented by 1; }
+    trial (total exceeds 20) { cast spell "big "; }
+    cast spell total spell " " spell n;""", ""),
+    ("""tally a; summon a; tally b imbue with a fragmented by 3 diminished by a fragmented by (0 diminished by 7); cast spell b;
+    tally c imbue with 2147483647 augmented by a; cast spell " " spell c;""", "-45\n"),
+    ("""verse s; summon s; verse t imbue with "<" augmented by s augmented by ">"; cast spell t;
+    rune r imbue with "z"; cast spell r;""", "hello\n"),
+    ("""tally x imbue with 5; tally y imbue with 7; x imbue with y augment by 3; cast spell x spell y;
+    tally z imbue with x at least 10 and y at most 7 or x defies y; cast spell z;""", ""),
+    # Portion literals are single precision, as the .float they are pooled in
+    ("""portion p imbue with 123456789.0; cast spell p;""", ""),
+    ("""portion p imbue with 0.1 augmented by 0.2; trial (p exceeds 0.3) { cast spell "above "; } cast spell p;""", ""),
+    ("""portion x imbue with 0.0; tally i imbue with 0;
+    cycle (i falls below 10) { x imbue with x augmented by 0.1; i imbue with i augmented by 1; }
+    tally n imbue with 3; portion y imbue with x fragmented by n; cast spell x spell " " spell y;""", ""),
+    # A verse holds 99 bytes of UTF-8, cut between characters
+    ("""verse s; summon s; verse t imbue with s augmented by s augmented by s; cast spell t;
+    verse u imbue with "ab" augmented by s; cast spell " " spell u;""", "\u00e9" * 40 + "\n"),
+    ("""verse s; summon s; verse t imbue with "x" augmented by s; cast spell t;""", "\U0001f600" * 30 + "\n"),
+    # Tally literals wrap to 32 bits, as li does
+    ("""tally a imbue with 4294967301; tally b imbue with 2147483648 augmented by 1; cast spell a spell " " spell b;""", ""),
+    # A tally divided by zero stops the program, even when the result is not used
+    ("""tally z; summon z; cast spell "before "; tally q imbue with 7 fragmented by z; cast spell "after";""", "0\n"),
+    ("""tally z imbue with 0; cast spell "before "; tally q imbue with 7 fragmented by z; cast spell q;""", ""),
+    ("""tally z; summon z; tally i imbue with 0;
+    cycle (i falls below 3) { cast spell i; tally q imbue with 12 fragmented by (z diminished by i); i imbue with i augmented by 1; }""", "2\n"),
+    # A portion divided by zero is an infinity or NaN
+    ("""portion z; summon z; portion p imbue with 1.5 fragmented by z; portion n imbue with (0 diminished by 1.5) fragmented by z;
+    portion u imbue with z fragmented by z; cast spell p spell " " spell n spell " " spell u;
+    trial (u defies u) { cast spell " nan"; }""", "0.0\n"),
+    ("""portion p imbue with 1.5 augmented by 2.25 amplified by 2.0; portion q imbue with 0.1 amplified by 3 diminished by 0.3;
+    cast spell p spell " " spell q;""", ""),
+    ("""portion q; summon q; portion r imbue with 1.5 amplified by q augmented by 2.25; cast spell r;""", "2.75\n"),
+]
+
+def run_bytecode(source, stdin, output):
+    bytecode.VM(bytecode.compile_source(source)).run(stdin, output)
+
+def run_transpiled(source, stdin, output):
+    transpile.compile_source(source).run(stdin, output)
+
+def run_closures(source, stdin, output):
+    closures.compile_source(source).run(stdin, output)
+
+# Backends by name, each a function running source with the given stdin and output streams
+BACKENDS = {
+    'bytecode': run_bytecode,
+    'transpile': run_transpiled,
+    'closures': run_closures,
+}
+
+def outcome(run, source, stdin):
+    """
+    (output, whether the run failed) of running source on a backend.
+    """
+    output = io.StringIO()
+    try:
+        run(source, io.StringIO(stdin), output)
+    except Exception:
+        return output.getvalue(), True
+    return output.getvalue(), False
+
+def simulated_outcome(source, stdin):
+    """
+    (output, whether the run trapped) of running source on the simulator.
+    Compile errors and any other error the run stops with are raised.
+    """
+    assembly = compiler.compile_source(source)
+    output = io.StringIO()
+    try:
+        simulator.Simulator(assembly).run(io.StringIO(stdin), output)
+    except RuntimeError as exc:
+        if str(exc) != simulator.TRAP_MESSAGE:
+            raise
+        return output.getvalue(), True
+    return output.getvalue(), False
+
+def check(programs=PROGRAMS, backends=BACKENDS):
+    """
+    Run every program on every backend; returns the number of mismatches
+    and broken programs, each of which is printed.
+    """
+    failures = 0
+    for source, stdin in programs:
+        try:
+            expected = simulated_outcome(source, stdin)
+        except Exception as exc:
+            failures += 1
+            print(f"broken program, the simulator cannot run it: {exc!r}\n{source}")
+            continue
+        for name, run in backends.items():
+            got = outcome(run, source, stdin)
+            if got != expected:
+                failures += 1
+                print(f"{name} disagrees with the simulator: {got!r} != {expected!r}\n{source}")
+    return failures
+
+def main():
+    failures = check()
+    print(f"{len(PROGRAMS)} programs, {len(BACKENDS)} backends, {failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
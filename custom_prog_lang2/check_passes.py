@@ -0,0 +1,124 @@
+import random
+import sys
+
+import ir
+import passes
+
+# Checks the instruction sequences passes.reduce_strength puts in place of
+# mul and div by a constant: runs reduce_multiply's shifts and adds and
+# reduce_divide's shifts and magic-number multiplications on edge and random
+# words, and compares them with the exact wrapped product and the quotient
+# truncated toward zero.
+
+TALLY_MIN = -0x80000000
+TALLY_MAX = 0x7FFFFFFF
+
+# Divisors and multipliers tried on top of every value up to SMALL_LIMIT
+EDGE_CONSTANTS = [TALLY_MIN, TALLY_MIN + 1, TALLY_MAX, TALLY_MAX - 1, 0x40000000, 0x55555555, 0x33333333,
+                  641, 6700417, 715827883, 1 << 16, (1 << 16) + 1, (1 << 30) - 1]
+SMALL_LIMIT = 1000
+EDGE_DIVIDENDS = [0, 1, -1, 2, -2, 3, -3, 7, -7, TALLY_MIN, TALLY_MIN + 1, TALLY_MAX, TALLY_MAX - 1,
+                  0x40000000, -0x40000000, 0x7FFF, -0x8000, 0x10000, -0x10000]
+
+def execute(instructions, inputs):
+    """
+    The word each virtual register ends up with after running instructions,
+    starting from inputs ({VReg: value}).
+    """
+    values = dict(inputs)
+
+    def read(arg):
+        return values[arg] if isinstance(arg, ir.VReg) else arg
+
+    for instruction in instructions:
+        op = instruction.op
+        if op in ('li', 'move'):
+            values[instruction.dest] = passes.wrap(read(instruction.args[0]))
+        elif op in passes.FOLDERS:
+            left, right = (read(arg) for arg in instruction.args)
+            values[instruction.dest] = passes.wrap(passes.FOLDERS[op](left, right))
+        else:
+            raise ValueError(f"Unexpected op in reduced code: {op}")
+    return values
+
+def operands(constant, rng, count):
+    """
+    Words to try with constant: the edge values, those around multiples of
+    constant and count random ones.
+    """
+    values = list(EDGE_DIVIDENDS)
+    for multiple in (1, 2, 3, -1, -2, -3):
+        values.extend(passes.wrap(constant * multiple + offset) for offset in (-1, 0, 1))
+    values.extend(rng.randint(TALLY_MIN, TALLY_MAX) for _ in range(count))
+    return values
+
+def check_constant(op, constant, rng, count):
+    """
+    Mismatches of the reduced form of `op` by constant, as (left, got, expected).
+    """
+    program = ir.Program()
+    left = program.new_vreg()
+    dest = program.new_vreg()
+    reduce = passes.reduce_multiply if op == 'mul' else passes.reduce_divide
+    instructions = reduce(program, dest, left, constant)
+    if instructions is None:
+        return []
+    mismatches = []
+    for value in operands(constant, rng, count):
+        got = execute(instructions, {left: value})[dest]
+        if op == 'mul':
+            expected = passes.wrap(value * constant)
+        else:
+            expected = passes.wrap(passes.divide(value, constant))
+        if got != expected:
+            mismatches.append((value, got, expected))
+    return mismatches
+
+def constants(rng, count):
+    values = set(range(-SMALL_LIMIT, SMALL_LIMIT + 1))
+    values.update(EDGE_CONSTANTS)
+    values.update(-value for value in EDGE_CONSTANTS if value != TALLY_MIN)
+    for shift in range(31):
+        values.update((1 << shift, -(1 << shift), (1 << shift) - 1, (1 << shift) + 1))
+    values.update(rng.randint(TALLY_MIN, TALLY_MAX) for _ in range(count))
+    return sorted(values)
+
+def check(seed=0, count=200):
+    """
+    Check multiplication and division by every constant from constants();
+    returns the number of mismatches, each of which is printed.
+    """
+    rng = random.Random(seed)
+    failures = 0
+    for constant in constants(rng, count):
+        for op in ('mul', 'div'):
+            if op == 'div' and constant == 0:
+                continue
+            for value, got, expected in check_constant(op, constant, rng, count):
+                failures += 1
+                print(f"{value} {op} {constant}: reduced code gives {got}, expected {expected}")
+    return failures
+
+def magic_check():
+    """
+    magic_divisor's multipliers against those in Hacker's Delight, table 10-1.
+    """
+    known = {3: (0x55555556, 0), 5: (0x66666667, 1), 6: (0x2AAAAAAB, 0), 7: (passes.wrap(0x92492493), 2),
+             -5: (passes.wrap(0x99999999), 1), -7: (0x6DB6DB6D, 2)}
+    failures = 0
+    for divisor, expected in known.items():
+        got = passes.magic_divisor(divisor)
+        if got != expected:
+            failures += 1
+            print(f"magic_divisor({divisor}) = {got}, expected {expected}")
+    return failures
+
+def main():
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    failures = magic_check() + check(seed, count)
+    print(f"seed {seed}, {count} random values per constant, {failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import operator
+import sys
+
+import bytecode
+import lexer
+import parser
+import semantic
+import simulator
+import transpile
+
+# Closure compiler: turns each node of a checked AST into a Python closure
+# once, with its operator already resolved to a function and its variables to
+# slot indexes, so running the program is calls between closures with no
+# node['type'] dispatch or operator string comparisons left. Sits between
+# Parser.evaluate_expression, which walks the dicts every time, and the
+# bytecode VM.
+#
+# Expressions compile to functions of the slots list, statements to
+# functions of (slots, stdin, write). The semantics are those of the bytecode
+# VM (see bytecode).
+
+TALLY_FUNCTIONS = {
+    'augmented by': operator.add,
+    'diminished by': operator.sub,
+    'amplified by': operator.mul,
+    'fragmented by': transpile.divide_tally,
+}
+PORTION_FUNCTIONS = {
+    'augmented by': operator.add,
+    'diminished by': operator.sub,
+    'amplified by': operator.mul,
+    'fragmented by': transpile.divide_portion,
+}
+COMPARISON_FUNCTIONS = {
+    'falls below': operator.lt,
+    'exceeds': operator.gt,
+    'at most': operator.le,
+    'at least': operator.ge,
+    'mirrors': operator.eq,
+    'defies': operator.ne,
+    # Both operands are evaluated, as in the other backends
+    'and': lambda left, right: bool(left) & bool(right),
+    'or': lambda left, right: bool(left) | bool(right),
+}
+
+READERS = {
+    'tally': transpile.read_tally,
+    'portion': transpile.read_portion,
+    'verse': transpile.read_verse,
+}
+
+TALLY_MIN = bytecode.TALLY_MIN
+TALLY_MAX = bytecode.TALLY_MAX
+
+class CompiledProgram:
+    """
+    A program compiled to closures: statements run in order against a list
+    of slots holding (name, data type) slot_types' variables.
+    """
+    def __init__(self, statements, slot_types):
+        self.statements = statements
+        self.slot_types = slot_types
+
+    def run(self, stdin=None, stdout=None):
+        """
+        Run the program, reading summon input a line at a time from stdin and
+        writing output to stdout (text streams, sys.stdin and sys.stdout by
+        default). Each run starts with every variable at its default.
+        """
+        stdin = sys.stdin if stdin is None else stdin
+        stdout = sys.stdout if stdout is None else stdout
+        slots = [bytecode.DEFAULT_VALUES[data_type] for name, data_type in self.slot_types]
+        write = stdout.write
+        try:
+            for statement in self.statements:
+                statement(slots, stdin, write)
+        finally:
+            stdout.flush()
+
+class ClosureCompiler:
+    """
+    Compiles an AST built by Parser(tokens, evaluate=False) and checked by
+    semantic.SemanticAnalyzer into a CompiledProgram.
+    """
+    def __init__(self):
+        # (name, data type) by slot; variables parsed without slots fall back to their name
+        self.slot_types = []
+        self.slot_indexes = {}
+        self.handlers = {
+            'variable_declaration': self.compile_variable_declaration,
+            'variable_assignment': self.compile_variable_assignment,
+            'input_statement': self.compile_input_statement,
+            'output_statement': self.compile_output_statement,
+            'if_statement': self.compile_if_statement,
+            'for_statement': self.compile_for_statement,
+        }
+
+    def compile(self, ast):
+        return CompiledProgram(self.compile_body(ast), self.slot_types)
+
+    def compile_body(self, body):
+        return tuple(self.compile_statement(node) for node in body)
+
+    def declare(self, node):
+        key = node['variable'] if node.get('slot') is None else node['slot']
+        self.slot_indexes[key] = len(self.slot_types)
+        self.slot_types.append((node['variable'], node['data_type']))
+        return self.slot_indexes[key]
+
+    def lookup(self, slot, name):
+        """
+        The slot index of a variable reference and its data type.
+        """
+        index = self.slot_indexes[name if slot is None else slot]
+        return index, self.slot_types[index][1]
+
+    def compile_statement(self, node):
+        handler = self.handlers.get(node['type'])
+        if handler is None:
+            raise ValueError(f"Unknown node type: {node['type']}")
+        return handler(node)
+
+    def compile_variable_declaration(self, node):
+        # The initializer cannot refer to the variable, so it is compiled first
+        if 'expression' in node:
+            value = self.compile_value(node['data_type'], node['variable'], node['expression'])
+        else:
+            default = bytecode.DEFAULT_VALUES[node['data_type']]
+            value = lambda slots: default
+        return self.store(self.declare(node), value)
+
+    def compile_variable_assignment(self, node):
+        index, data_type = self.lookup(node.get('slot'), node['variable'])
+        return self.store(index, self.compile_value(data_type, node['variable'], node['expression']))
+
+    def store(self, index, value):
+        def execute(slots, stdin, write):
+            slots[index] = value(slots)
+        return execute
+
+    def compile_value(self, data_type, name, expression):
+        """
+        Compile expression as a value for a variable of data_type.
+        """
+        if data_type == 'rune' and expression['type'] == 'string':
+            # Runes are written as one-character string literals
+            rune = simulator.unescape(expression['value'][1:-1])
+            return lambda slots: rune
+        value, value_type = self.compile_expression(expression)
+        return self.convert(value, value_type, data_type, name)
+
+    def convert(self, value, value_type, data_type, name):
+        if data_type == 'portion' and value_type == 'tally':
+            single = transpile.single
+            return lambda slots: single(value(slots))
+        elif data_type == 'tally' and value_type == 'portion':
+            raise ValueError(f"Cannot store a portion value in tally '{name}'")
+        return value
+
+    def compile_input_statement(self, node):
+        index, data_type = self.lookup(node.get('slot'), node['variable'])
+        reader = READERS.get(data_type)
+        if reader is None:
+            raise TypeError(f"Unsupported data type: {data_type}")
+        name = node['variable']
+
+        def execute(slots, stdin, write):
+            slots[index] = reader(stdin, name)
+        return execute
+
+    def compile_output_statement(self, node):
+        # Each piece gives the text to write from the slots
+        pieces = []
+        for expression in node['expressions']:
+            if expression['type'] == 'string':
+                text = simulator.unescape(expression['value'][1:-1])
+                pieces.append(lambda slots, text=text: text)
+                continue
+            index, data_type = self.lookup(expression.get('slot'), expression['name'])
+            if data_type == 'portion':
+                pieces.append(lambda slots, index=index: simulator.format_float(slots[index]))
+            else:
+                pieces.append(lambda slots, index=index: str(slots[index]))
+        pieces = tuple(pieces)
+
+        def execute(slots, stdin, write):
+            for piece in pieces:
+                write(piece(slots))
+        return execute
+
+    def compile_if_statement(self, node):
+        condition = self.compile_expression(node['condition'])[0]
+        body = self.compile_body(node['body'])
+
+        def execute(slots, stdin, write):
+            if condition(slots):
+                for statement in body:
+                    statement(slots, stdin, write)
+        return execute
+
+    def compile_for_statement(self, node):
+        condition = self.compile_expression(node['condition'])[0]
+        body = self.compile_body(node['body'])
+
+        def execute(slots, stdin, write):
+            while condition(slots):
+                for statement in body:
+                    statement(slots, stdin, write)
+        return execute
+
+    def compile_expression(self, node):
+        """
+        A function of the slots computing an expression, and its type.
+        """
+        if node['type'] == 'number':
+            value = node['value']
+            if isinstance(value, float):
+                # Rounded once, as the .float the generator pools it in
+                value = simulator.single(value)
+                return (lambda slots: value), 'portion'
+            # Wrapped once, as the li that loads it wraps it
+            value = simulator.wrap(value)
+            return (lambda slots: value), 'tally'
+        elif node['type'] == 'variable':
+            index, data_type = self.lookup(node.get('slot'), node['name'])
+            return (lambda slots: slots[index]), data_type
+        elif node['type'] in ('string', 'char'):
+            if node['type'] == 'string':
+                text = bytecode.fit_verse(simulator.unescape(node['value'][1:-1]))
+            else:
+                text = simulator.unescape(node['value'])
+            return (lambda slots: text), 'verse' if node['type'] == 'string' else 'rune'
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            return self.compile_operation(node)
+        raise ValueError(f"Unsupported expression in closure compiler: {node['type']}")
+
+    def compile_operation(self, node):
+        operator_name = bytecode.PLAIN_OPERATORS.get(node['operator'], node['operator'])
+        left, left_type = self.compile_expression(node['left'])
+        right, right_type = self.compile_expression(node['right'])
+        single = transpile.single
+
+        if left_type == 'verse':
+            fit_verse = bytecode.fit_verse
+            evaluate = lambda slots: fit_verse(left(slots) + right(slots))
+            result = 'verse'
+        elif operator_name in COMPARISON_FUNCTIONS:
+            function = COMPARISON_FUNCTIONS[operator_name]
+            if operator_name not in ('and', 'or'):
+                left, right = self.unify(left, left_type, right, right_type)
+            evaluate = lambda slots: 1 if function(left(slots), right(slots)) else 0
+            result = 'tally'
+        elif 'portion' in (left_type, right_type):
+            function = PORTION_FUNCTIONS[operator_name]
+            left, right = self.unify(left, left_type, right, right_type)
+            evaluate = lambda slots: single(function(left(slots), right(slots)))
+            result = 'portion'
+        else:
+            function = TALLY_FUNCTIONS[operator_name]
+
+            def evaluate(slots):
+                value = function(left(slots), right(slots))
+                if TALLY_MIN <= value <= TALLY_MAX:
+                    return value
+                return simulator.wrap(value)
+            result = 'tally'
+
+        if node['type'] == 'compound_assignment' and node['left']['type'] == 'variable':
+            # `x augment by 1` also stores the result back into x
+            index, data_type = self.lookup(node['left'].get('slot'), node['left']['name'])
+            self.convert(evaluate, result, data_type, node['left']['name'])
+            compute = evaluate
+            # x gets the converted value while the expression stays a tally
+            converts = data_type == 'portion' and result == 'tally'
+
+            def evaluate(slots):
+                value = compute(slots)
+                slots[index] = single(value) if converts else value
+                return value
+        return evaluate, result
+
+    def unify(self, left, left_type, right, right_type):
+        """
+        A tally mixed with a portion is converted to one.
+        """
+        single = transpile.single
+        if left_type == 'tally' and right_type == 'portion':
+            convert_left = left
+            left = lambda slots: single(convert_left(slots))
+        elif left_type == 'portion' and right_type == 'tally':
+            convert_right = right
+            right = lambda slots: single(convert_right(slots))
+        return left, right
+
+def compile_source(text):
+    """
+    Lex, parse, check and compile source text to a CompiledProgram.
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(text), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    return ClosureCompiler().compile(ast)
+
+def main():
+    import io
+    import time
+
+    input_code = """
+    tally n;
+    summon n;
+    tally total imbue with 0;
+    tally i imbue with 0;
+    cycle (i falls below n) {
+        total imbue with total augmented by i fragmented by 3;
+        i imbue with i augmented by 1;
+    }
+    portion mean imbue with total fragmented by n;
+    cast spell total spell " " spell mean;
+    """
+    program = compile_source(input_code)
+    output = io.StringIO()
+    start = time.perf_counter()
+    program.run(io.StringIO("100000\n"), output)
+    print(f"{output.getvalue()} in {time.perf_counter() - start:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+
+import lexer
+import parser
+import semantic
+import generator
+import simulator
+import sourcemap
+import tracing
+
+def compile_source(text, tracer=None, output=None):
+    """
+    Compile source text to MIPS assembly: lex, parse, semantic checks and
+    code generation. Pass a tracing.Tracer to measure each phase; without
+    one the phases run back to back with no instrumentation at all.
+    The assembly is returned as a string, or streamed to output (a file or
+    socket, see Generator.write_mips) if one is given.
+    """
+    if tracer is None:
+        return compile_with_map(text, output)[0]
+
+    with tracer.phase('lex') as phase:
+        tokens = lexer.lexical_analyzer(text)
+        phase.items = len(tokens)
+
+    with tracer.phase('parse') as phase:
+        ast = tracing.TracingParser(tokens, tracer, evaluate=False).parse()
+        phase.items = len(ast)
+
+    with tracer.phase('semantic') as phase:
+        symbol_table = semantic.SemanticAnalyzer().analyze(ast)
+        phase.items = len(symbol_table)
+
+    with tracer.phase('codegen') as phase:
+        gen = generator.Generator()
+        mips_code = emit(gen, ast, output)
+        phase.items = gen.writer.text_lines
+
+    return mips_code
+
+def compile_with_map(text, output=None):
+    """
+    compile_source without tracing, returning the assembly (None if it was
+    streamed to output) and its sourcemap.SourceMap.
+    """
+    tokens = lexer.lexical_analyzer(text)
+    ast = parser.Parser(tokens, evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    gen = generator.Generator()
+    return emit(gen, ast, output), gen.source_map
+
+def compile_file(text, asm_path):
+    """
+    Compile source text to the assembly file asm_path and write its source
+    map next to it, at sourcemap.map_path(asm_path). Returns the SourceMap.
+    """
+    with open(asm_path, 'wb') as file:
+        source_map = compile_with_map(text, file)[1]
+    source_map.file = os.path.basename(asm_path)
+    source_map.write(sourcemap.map_path(asm_path))
+    return source_map
+
+def run_source(text, stdin=None, stdout=None, max_steps=simulator.MAX_STEPS):
+    """
+    Compile source text and run it in process on simulator.Simulator,
+    reading input from stdin and writing output to stdout (text streams,
+    sys.stdin and sys.stdout by default). Returns the number of MIPS
+    instructions executed.
+    """
+    return simulator.Simulator(compile_source(text)).run(stdin, stdout, max_steps)
+
+def emit(gen, ast, output):
+    if output is None:
+        return gen.generate_mips(ast)
+    gen.write_mips(ast, output)
+    return None
+
+def main():
+    input_code = """
+    tally x;
+    cast spell "Give me a number: ";
+    summon x;
+    x imbue with 1 augmented by 2;
+    tally y imbue with x augmented by 4;
+    cast spell y;
+    """
+    tracer = tracing.Tracer(events=False)
+    print(compile_source(input_code, tracer))
+    print(tracer.format_report())
+
+if __name__ == "__main__":
+    main()
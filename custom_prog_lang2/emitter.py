@@ -0,0 +1,78 @@
+import io
+import shutil
+import socket
+import tempfile
+
+# Streaming output for the generated assembly. Text lines go straight to the
+# output stream through a buffered writer as they are produced; data lines are
+# spooled to a temporary buffer, kept in memory while small and moved to disk
+# past SPOOL_SIZE, and copied after the text section at the end. Assemblers
+# accept the sections in either order, so memory use stays bounded whatever
+# the size of the program.
+
+BUFFER_SIZE = 64 * 1024
+
+# Characters of data kept in memory before the spool moves to a temporary file
+SPOOL_SIZE = 256 * 1024
+
+class AssemblyWriter:
+    def __init__(self, stream, spool_size=SPOOL_SIZE):
+        """
+        stream is a text stream, a binary file (buffered or raw) or a
+        connected socket. It is flushed by finish() but not closed.
+        """
+        self.socket_file = None
+        self.buffered = None
+        if isinstance(stream, socket.socket):
+            stream = self.socket_file = stream.makefile('wb', buffering=BUFFER_SIZE)
+        elif isinstance(stream, io.RawIOBase):
+            stream = self.buffered = io.BufferedWriter(stream, BUFFER_SIZE)
+
+        if isinstance(stream, io.TextIOBase):
+            self.out = stream
+            self.wrapper = None
+        else:
+            self.out = self.wrapper = io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_size, mode='w+', encoding='utf-8', newline='\n')
+        self.text_lines = 0
+        self.data_lines = 0
+
+    def text(self, lines):
+        for line in lines:
+            self.out.write(line)
+            self.out.write('\n')
+        self.text_lines += len(lines)
+
+    def data(self, line):
+        if not self.data_lines:
+            self.spool.write(".data\n")
+        self.spool.write(line)
+        self.spool.write('\n')
+        self.data_lines += 1
+
+    def finish(self):
+        """
+        Append the spooled data section and flush everything to the stream.
+        """
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.out, BUFFER_SIZE)
+        self.spool.close()
+        self.out.flush()
+        # Let go of the wrappers without closing the caller's stream
+        if self.wrapper is not None:
+            self.wrapper.detach()
+        if self.buffered is not None:
+            self.buffered.detach()
+        if self.socket_file is not None:
+            self.socket_file.close()
+
+def main():
+    import sys
+
+    writer = AssemblyWriter(sys.stdout)
+    writer.text([".text", ".globl main", "main:", "la $a0, greeting", "li $v0, 4", "syscall", "li $v0, 10", "syscall"])
+    writer.data('greeting: .asciiz "hello"')
+    writer.finish()
+
+if __name__ == "__main__":
+    main()
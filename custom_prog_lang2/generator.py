@@ -1,178 +1,354 @@
+import io
+
+import emitter
+import ir
 import lexer
 import parser
+import passes as ir_passes
+import peephole
+import regalloc
+import runtime
+import semantic
+import sourcemap
+
+# Immediate forms of IR ops whose right operand is a constant
+IMMEDIATE_OPS = {'add': 'addi', 'slt': 'slti', 'and': 'andi', 'or': 'ori'}
+
+# Shifts by an amount in a register
+VARIABLE_SHIFTS = {'sll': 'sllv', 'sra': 'srav', 'srl': 'srlv'}
+
+# MIPS branches taken when an IR comparison holds, and the comparisons testing the opposite
+BRANCH_OPS = {'slt': 'blt', 'sgt': 'bgt', 'sle': 'ble', 'sge': 'bge', 'seq': 'beq', 'sne': 'bne'}
+INVERTED_COMPARISONS = {'slt': 'sge', 'sge': 'slt', 'sgt': 'sle', 'sle': 'sgt', 'seq': 'sne', 'sne': 'seq'}
+
+# Data the runtime string routines read a word at a time starts on a word boundary
+ALIGNED_DIRECTIVES = ('.asciiz', '.space')
+
+# Registers holding spilled values while one instruction uses them; the
+# allocator never hands these out
+SCRATCH_REGISTERS = ('$v1', '$a3')
+FLOAT_SCRATCH_REGISTERS = ('$f0', '$f12')
+
+# Coprocessor 1 instructions for the float ops
+FLOAT_ARITHMETIC = {'fadd': 'add.s', 'fsub': 'sub.s', 'fmul': 'mul.s', 'fdiv': 'div.s'}
+# The compare setting the condition flag for each float comparison, whether
+# its operands are swapped, and the move clearing the result when the flag
+# says the comparison does not hold
+FLOAT_COMPARISONS = {
+    'fslt': ('c.lt.s', False, 'movf'),
+    'fsgt': ('c.lt.s', True, 'movf'),
+    'fsle': ('c.le.s', False, 'movf'),
+    'fsge': ('c.le.s', True, 'movf'),
+    'fseq': ('c.eq.s', False, 'movf'),
+    'fsne': ('c.eq.s', False, 'movt'),
+}
 
 class Generator:
-    def __init__(self, symbol_table):
-        self.symbol_table = symbol_table
-        self.mips_code = []
-        self.data_segment = [".data"]
-        self.text_segment = [".text", ".globl main", "main:"]
-        self.temp_register_counter = 0
-        self.buffer = 0
+    def __init__(self, passes=None, promote=len(regalloc.SAVED_REGISTERS), peephole_rules=None):
+        """
+        The AST to generate from must have been checked by
+        semantic.SemanticAnalyzer. passes are run over the IR program (see
+        ir.run_passes) before MIPS is emitted; the default is
+        passes.DEFAULT_PASSES, and passes=() emits the IR as lowered.
+        Registers are then allocated with up to promote variables kept in $s
+        registers (see regalloc.allocate). Finally the peephole_rules
+        (default peephole.DEFAULT_RULES) clean up the emitted instructions;
+        self.peephole.report counts what each one eliminated.
+        """
+        self.passes = list(passes) if passes is not None else list(ir_passes.DEFAULT_PASSES)
+        self.promote = promote
+        self.peephole = peephole.Peephole(peephole.DEFAULT_RULES if peephole_rules is None else peephole_rules)
+        # Text lines emitted since the last flush_text, and the source position of each
+        self.text_segment = []
+        self.text_positions = []
+        # Source position of every instruction written so far (see sourcemap)
+        self.source_map = sourcemap.SourceMap()
+        self.writer = None
+        self.program = None
+        self.allocation = None
+        # Label of the block laid out after the current one, which needs no jump
+        self.next_label = None
+        # Spilled virtual registers loaded into scratch registers for the current instruction
+        self.scratch = {}
+        # Runtime routines called so far (see runtime.ROUTINES)
+        self.runtime = set()
+        # MIPS emitters by IR op
+        self.emitters = {
+            'li': self.emit_li,
+            'move': self.emit_move,
+            'load': self.emit_load,
+            'store': self.emit_store,
+            'read_int': self.emit_read_int,
+            'read_string': self.emit_read_string,
+            'print_int': self.emit_print_int,
+            'print_char': self.emit_print_char,
+            'print_string': self.emit_print_string,
+            'print_buffer': self.emit_print_buffer,
+            'copy_string': self.emit_copy_string,
+            'append_string': self.emit_append_string,
+            'jump': self.emit_jump,
+            'branch': self.emit_branch,
+            'cbranch': self.emit_cbranch,
+            'exit': self.emit_exit,
+        }
+        for op in ir.BINARY_OPS:
+            self.emitters[op] = self.emit_binary
+        self.emitters.update({
+            'fload': self.emit_fload,
+            'fstore': self.emit_fstore,
+            'itof': self.emit_itof,
+            'read_float': self.emit_read_float,
+            'print_float': self.emit_print_float,
+        })
+        for op in FLOAT_ARITHMETIC:
+            self.emitters[op] = self.emit_float_arithmetic
+        for op in FLOAT_COMPARISONS:
+            self.emitters[op] = self.emit_float_comparison
 
     def generate_mips(self, ast):
         """
-        Generate MIPS code from the AST.
+        Generate MIPS code from the AST and return it as one string; see
+        write_mips, which this collects the output of.
+        """
+        output = io.StringIO()
+        self.write_mips(ast, output)
+        return output.getvalue()
+
+    def write_mips(self, ast, stream):
         """
-        for node in ast:
-            if node['type'] == 'variable_declaration':
-                self.handle_variable_declaration(node)
-            elif node['type'] == 'variable_assignment':
-                self.handle_variable_assignment(node)
-            elif node['type'] == 'input_statement':
-                self.handle_input_statement(node)
-            elif node['type'] == 'output_statement':
-                self.handle_output_statement(node)
-            elif node['type'] == 'comment':
-                self.handle_comment(node)
-            elif node['type'] == 'if_statement':
-                self.handle_if_statement(node)
-
-        return self.generate_output()
-
-    def get_temp_register(self):
-        reg = f"$t{self.temp_register_counter}"
-        self.temp_register_counter = (self.temp_register_counter + 1) % 10
-        return reg
-    
-    def get_buffer(self, variable):
-        return f"{variable}_buffer"
-
-    def handle_variable_declaration(self, node):
-        variable = node['variable']
-        if node.get('value') is None:
-            if self.symbol_table[variable]['data_type'] == "tally":
-                self.data_segment.append(f"{variable}: .word 0")
-            # elif self.symbol_table[variable]['data_type'] == "verse":
-            #     buffer_label = self.get_buffer(variable)
-                # if f"{buffer_label}: .space" not in self.data_segment:
-                #     self.data_segment.append(f"{buffer_label}: .space 100")
+        Generate MIPS code from the AST: lower it to IR, run the passes and
+        emit each block followed by the runtime routines it calls. The text
+        section is streamed to stream (see emitter.AssemblyWriter) a block
+        at a time, after the peephole rules have run over it; the data
+        section is spooled and follows it. self.source_map then maps each
+        instruction written to the statement it came from.
+        """
+        self.program = ir.run_passes(ir.lower(ast), self.passes)
+        self.allocation = regalloc.allocate(self.program, self.promote)
+        self.writer = emitter.AssemblyWriter(stream)
+        self.source_map = sourcemap.SourceMap()
+
+        self.writer.text([".text", ".globl main", "main:"])
+        blocks = self.program.blocks
+        for index, block in enumerate(blocks):
+            if block.label != 'main':
+                self.text_segment.append(f"{block.label}:")
+                self.text_positions.append(None)
+            self.next_label = blocks[index + 1].label if index + 1 < len(blocks) else None
+            for instruction in block.instructions:
+                start = len(self.text_segment)
+                self.emit_instruction(instruction)
+                self.text_positions.extend([instruction.position] * (len(self.text_segment) - start))
+            self.flush_text()
+        routines = runtime.routines(self.runtime)
+        self.text_segment.extend(routines)
+        self.text_positions.extend([None] * len(routines))
+        self.flush_text()
+
+        for label, directive, value in self.program.data:
+            if directive in ALIGNED_DIRECTIVES:
+                self.writer.data(".align 2")
+            self.writer.data(f"{label}: {directive} {value}")
+        self.writer.finish()
+
+    def flush_text(self):
+        """
+        Run the peephole rules over the lines emitted since the last flush
+        and write them out. The rules see the next block's label too, since
+        some look at what follows a jump. Lines without a position (labels,
+        runtime routines) map to None.
+        """
+        if self.next_label is None:
+            lines, positions = self.peephole.run_with_positions(self.text_segment, self.text_positions)
         else:
-            if self.symbol_table[variable]['data_type'] == "tally":
-                self.data_segment.append(f"{variable}: .word {node['value']}")
-            elif self.symbol_table[variable]['data_type'] == "verse":
-                buffer_label = self.get_buffer(variable)
-                if f"{buffer_label}: .space" not in self.data_segment:
-                    self.data_segment.append(f"{buffer_label}: .space 100")
-
-    def handle_variable_assignment(self, node):
-        variable = node['variable']
-        expression = node['expression']
-        var_info = self.symbol_table[variable]
-
-        if var_info['data_type'] == "verse":
-            buffer_label = self.get_buffer(variable)
-            if expression['type'] == 'string':
-                # Store string directly in the buffer
-                temp_label = f"str_{len(self.data_segment)}"
-                self.data_segment.append(f"{temp_label}: .asciiz {expression['value']}")
-                self.text_segment.append(f"la $t0, {temp_label}")
-                self.text_segment.append(f"la $t1, {buffer_label}")
-                self.text_segment.append(f"li $t2, 100")  # Assuming a max size of 100 bytes
-                self.text_segment.append(f"loop_copy:")
-                self.text_segment.append(f"lb $t3, 0($t0)")
-                self.text_segment.append(f"sb $t3, 0($t1)")
-                self.text_segment.append(f"beqz $t3, end_copy")
-                self.text_segment.append(f"addi $t0, $t0, 1")
-                self.text_segment.append(f"addi $t1, $t1, 1")
-                self.text_segment.append(f"subi $t2, $t2, 1")
-                self.text_segment.append(f"bnez $t2, loop_copy")
-                self.text_segment.append(f"end_copy:")
-            elif expression['type'] == 'variable':
-                # Copy from one string buffer to another
-                source_buffer = self.get_buffer(expression['name'])
-                self.text_segment.append(f"la $t0, {source_buffer}")
-                self.text_segment.append(f"la $t1, {buffer_label}")
-                self.text_segment.append(f"li $t2, 100")  # Assuming a max size of 100 bytes
-                self.text_segment.append(f"loop_copy_var:")
-                self.text_segment.append(f"lb $t3, 0($t0)")
-                self.text_segment.append(f"sb $t3, 0($t1)")
-                self.text_segment.append(f"beqz $t3, end_copy_var")
-                self.text_segment.append(f"addi $t0, $t0, 1")
-                self.text_segment.append(f"addi $t1, $t1, 1")
-                self.text_segment.append(f"subi $t2, $t2, 1")
-                self.text_segment.append(f"bnez $t2, loop_copy_var")
-                self.text_segment.append(f"end_copy_var:")
+            lines, positions = self.peephole.run_with_positions(self.text_segment + [f"{self.next_label}:"],
+                                                                self.text_positions + [None])
+            lines, positions = lines[:-1], positions[:-1]
+        for line, position in zip(lines, positions):
+            if peephole.is_instruction(line):
+                self.source_map.add(position)
+        self.writer.text(lines)
+        self.text_segment = []
+        self.text_positions = []
+
+    def emit_instruction(self, instruction):
+        spills = self.allocation.spills
+        if not spills:
+            self.emitters[instruction.op](instruction)
+            return
+
+        # Spilled operands are loaded into scratch registers, and a spilled
+        # result is computed in one and stored afterwards
+        scratch = {False: iter(SCRATCH_REGISTERS), True: iter(FLOAT_SCRATCH_REGISTERS)}
+        for vreg in instruction.uses():
+            if vreg in spills and vreg not in self.scratch:
+                self.scratch[vreg] = next(scratch[vreg.is_float])
+                self.text_segment.append(f"{'l.s' if vreg.is_float else 'lw'} {self.scratch[vreg]}, {spills[vreg]}")
+        dest = instruction.dest
+        if dest in spills:
+            self.scratch[dest] = FLOAT_SCRATCH_REGISTERS[0] if dest.is_float else SCRATCH_REGISTERS[0]
+        self.emitters[instruction.op](instruction)
+        if dest in spills:
+            self.text_segment.append(f"{'s.s' if dest.is_float else 'sw'} {self.scratch[dest]}, {spills[dest]}")
+        self.scratch = {}
+
+    def reg(self, vreg):
+        """
+        Physical register of a virtual register, as allocated.
+        """
+        register = self.scratch.get(vreg)
+        return register if register is not None else self.allocation.registers[vreg]
+
+    def source(self, operand):
+        """
+        Register holding a binary op's left operand; the constant 0 is $zero.
+        """
+        return '$zero' if operand == 0 and not isinstance(operand, ir.VReg) else self.reg(operand)
+
+    def emit_li(self, instruction):
+        self.text_segment.append(f"li {self.reg(instruction.dest)}, {instruction.args[0]}")
+
+    def emit_move(self, instruction):
+        self.text_segment.append(f"move {self.reg(instruction.dest)}, {self.reg(instruction.args[0])}")
+
+    def emit_load(self, instruction):
+        self.text_segment.append(f"lw {self.reg(instruction.dest)}, {instruction.args[0]}")
+
+    def emit_store(self, instruction):
+        label, source = instruction.args
+        self.text_segment.append(f"sw {self.reg(source)}, {label}")
+
+    def emit_binary(self, instruction):
+        op = instruction.op
+        dest = self.reg(instruction.dest)
+        left, right = instruction.args
+        if isinstance(right, ir.VReg):
+            if op == 'div':
+                # div leaves hi and lo alone on a zero divisor; trap instead, as the other backends stop
+                self.text_segment.append(f"teq {self.reg(right)}, $zero")
+                self.text_segment.append(f"div {self.source(left)}, {self.reg(right)}")
+                self.text_segment.append(f"mflo {dest}")
+            elif op == 'mulhi':
+                self.text_segment.append(f"mult {self.source(left)}, {self.reg(right)}")
+                self.text_segment.append(f"mfhi {dest}")
+            else:
+                op = VARIABLE_SHIFTS.get(op, op)
+                self.text_segment.append(f"{op} {dest}, {self.source(left)}, {self.reg(right)}")
+        elif op == 'div' and right == 0:
+            # Always traps; dest is only set to keep the code well formed
+            self.text_segment.append("teq $zero, $zero")
+            self.text_segment.append(f"move {dest}, $zero")
+        elif op == 'sub':
+            self.text_segment.append(f"addi {dest}, {self.source(left)}, {-right}")
+        else:
+            # Shifts, three-operand div, mul and the set pseudo-instructions take an immediate directly
+            self.text_segment.append(f"{IMMEDIATE_OPS.get(op, op)} {dest}, {self.source(left)}, {right}")
+
+    def emit_fload(self, instruction):
+        self.text_segment.append(f"l.s {self.reg(instruction.dest)}, {instruction.args[0]}")
+
+    def emit_fstore(self, instruction):
+        label, source = instruction.args
+        self.text_segment.append(f"s.s {self.reg(source)}, {label}")
+
+    def emit_itof(self, instruction):
+        dest = self.reg(instruction.dest)
+        self.text_segment.append(f"mtc1 {self.reg(instruction.args[0])}, {dest}")
+        self.text_segment.append(f"cvt.s.w {dest}, {dest}")
+
+    def emit_float_arithmetic(self, instruction):
+        left, right = instruction.args
+        self.text_segment.append(f"{FLOAT_ARITHMETIC[instruction.op]} {self.reg(instruction.dest)}, {self.reg(left)}, {self.reg(right)}")
+
+    def emit_float_comparison(self, instruction):
+        compare, swapped, clear = FLOAT_COMPARISONS[instruction.op]
+        dest = self.reg(instruction.dest)
+        left, right = instruction.args
+        if swapped:
+            left, right = right, left
+        self.text_segment.append(f"li {dest}, 1")
+        self.text_segment.append(f"{compare} {self.reg(left)}, {self.reg(right)}")
+        self.text_segment.append(f"{clear} {dest}, $zero, 0")
+
+    def emit_read_int(self, instruction):
+        self.text_segment.append(f"li $v0, 5")  # Read integer
+        self.text_segment.append(f"syscall")
+        self.text_segment.append(f"move {self.reg(instruction.dest)}, $v0")
+
+    def emit_read_string(self, instruction):
+        self.text_segment.append(f"li $v0, 8")
+        self.text_segment.append(f"la $a0, {instruction.args[0]}")
+        self.text_segment.append(f"li $a1, {ir.VERSE_BUFFER_SIZE}")
+        self.text_segment.append(f"syscall")
+
+    def emit_print_int(self, instruction):
+        self.text_segment.append(f"move $a0, {self.reg(instruction.args[0])}")
+        self.text_segment.append(f"li $v0, 1")  # Print integer
+        self.text_segment.append(f"syscall")
+
+    def emit_read_float(self, instruction):
+        self.text_segment.append(f"li $v0, 6")  # Read float
+        self.text_segment.append(f"syscall")
+        self.text_segment.append(f"mov.s {self.reg(instruction.dest)}, $f0")
+
+    def emit_print_float(self, instruction):
+        self.text_segment.append(f"mov.s $f12, {self.reg(instruction.args[0])}")
+        self.text_segment.append(f"li $v0, 2")  # Print float
+        self.text_segment.append(f"syscall")
+
+    def emit_print_char(self, instruction):
+        self.text_segment.append(f"move $a0, {self.reg(instruction.args[0])}")
+        self.text_segment.append(f"li $v0, 11")  # Print character
+        self.text_segment.append(f"syscall")
+
+    def emit_print_string(self, instruction):
+        self.text_segment.append(f"la $a0, {instruction.args[0]}")
+        self.text_segment.append(f"li $v0, 4")  # Print string
+        self.text_segment.append(f"syscall")
+
+    def emit_print_buffer(self, instruction):
+        self.emit_print_string(instruction)
+
+    def emit_copy_string(self, instruction):
+        self.call_string_routine('rt.strcpy', *instruction.args)
+
+    def emit_append_string(self, instruction):
+        self.call_string_routine('rt.strcat', *instruction.args)
+
+    def call_string_routine(self, routine, target, source):
+        self.runtime.add(routine)
+        self.text_segment.append(f"la $a0, {target}")
+        self.text_segment.append(f"la $a1, {source}")
+        self.text_segment.append(f"li $a2, {ir.VERSE_BUFFER_SIZE}")
+        self.text_segment.append(f"jal {routine}")
+
+    def emit_jump(self, instruction):
+        if instruction.args[0] != self.next_label:
+            self.text_segment.append(f"j {instruction.args[0]}")
+
+    def emit_branch(self, instruction):
+        condition, if_true, if_false = instruction.args
+        if if_true == self.next_label:
+            self.text_segment.append(f"beqz {self.reg(condition)}, {if_false}")
+            return
+        self.text_segment.append(f"bnez {self.reg(condition)}, {if_true}")
+        self.emit_jump(ir.Instruction('jump', None, (if_false,)))
+
+    def emit_cbranch(self, instruction):
+        comparison, left, right, if_true, if_false = instruction.args
+        if if_true == self.next_label:
+            # Branch away on the opposite test and fall through into the true side
+            comparison, if_true, if_false = INVERTED_COMPARISONS[comparison], if_false, if_true
+        right = self.reg(right) if isinstance(right, ir.VReg) else right
+        if right == 0 and comparison in ('seq', 'sne'):
+            self.text_segment.append(f"{'beqz' if comparison == 'seq' else 'bnez'} {self.reg(left)}, {if_true}")
         else:
-            # Original logic for tally (integer) assignments
-            temp_reg = self.get_temp_register()
-            self.evaluate_expression(expression, temp_reg)
-            self.text_segment.append(f"sw {temp_reg}, {variable}")
-
-    def evaluate_expression(self, expression, target_reg):
-        if expression['type'] == 'number':
-            self.text_segment.append(f"li {target_reg}, {expression['value']}")
-        elif expression['type'] == 'variable':
-            self.text_segment.append(f"lw {target_reg}, {expression['name']}")
-        elif expression['type'] == 'binary_operation':
-            left_reg = self.get_temp_register()
-            right_reg = self.get_temp_register()
-
-            # Evaluate left and right operands
-            self.evaluate_expression(expression['left'], left_reg)
-            self.evaluate_expression(expression['right'], right_reg)
-
-            # Perform the binary operation
-            operator = expression['operator']
-            if operator == 'augmented by':
-                self.text_segment.append(f"add {target_reg}, {left_reg}, {right_reg}")
-            elif operator == 'diminished by':
-                self.text_segment.append(f"sub {target_reg}, {left_reg}, {right_reg}")
-            elif operator == 'amplified by':
-                self.text_segment.append(f"mul {target_reg}, {left_reg}, {right_reg}")
-            elif operator == 'fragmented by':
-                self.text_segment.append(f"div {left_reg}, {right_reg}")
-                self.text_segment.append(f"mflo {target_reg}")
-
-    def handle_input_statement(self ,node):
-        variable = node['variable']
-        var_info = self.symbol_table[variable]
-        if var_info['data_type'] == "tally":
-            self.text_segment.append(f"li $v0, 5")  # Read integer
-            self.text_segment.append(f"syscall")
-            self.text_segment.append(f"sw $v0, {variable}")
-        elif var_info['data_type'] == "verse":
-            buffer_label = self.get_buffer(variable)
-            if f"{buffer_label}" not in self.data_segment:
-                self.data_segment.append(f"{buffer_label}: .space 100") 
-            
-            self.text_segment.append(f"li $v0, 8")
-            self.text_segment.append(f"la $a0, {buffer_label}")
-            self.text_segment.append(f"li $a1, 100")
-            self.text_segment.append(f"syscall")
-
-    def handle_output_statement(self, node):
-        for expr in node['expressions']:
-            if expr['type'] == 'string':
-                label = f"str_{len(self.data_segment)}"
-                self.data_segment.append(f"{label}: .asciiz {expr['value']}")
-                self.text_segment.append(f"la $a0, {label}")
-                self.text_segment.append(f"li $v0, 4")  # Print string
-            elif expr['type'] == 'variable':
-                if self.symbol_table[expr['name']]['data_type'] == "verse":
-                    buffer_label = self.get_buffer(expr['name'])
-                    self.text_segment.append(f"la $a0, {buffer_label}")
-                    self.text_segment.append(f"li $v0, 4")
-                else:
-                    self.text_segment.append(f"lw $a0, {expr['name']}")
-                    self.text_segment.append(f"li $v0, 1")  # Print integer
-            self.text_segment.append(f"syscall")
-
-    # def handle_comment(self, node):
-
-
-    # def handle_if_statement(self, node):
-
-    
-    def generate_output(self):
-        self.mips_code.extend(self.data_segment)
-
-        self.mips_code.extend(self.text_segment)
-        self.mips_code.extend([
-        "li $v0, 10",
-        "syscall"
-        ])
-        return "\n".join(self.mips_code)
+            self.text_segment.append(f"{BRANCH_OPS[comparison]} {self.reg(left)}, {right}, {if_true}")
+        self.emit_jump(ir.Instruction('jump', None, (if_false,)))
+
+    def emit_exit(self, instruction):
+        self.text_segment.append("li $v0, 10")
+        self.text_segment.append("syscall")
 
 def main():
     # input_code = """
@@ -195,18 +371,18 @@ def main():
     """
 
     tokens = lexer.lexical_analyzer(input_code)
-    parse_to_mips = parser.Parser(tokens)
+    parse_to_mips = parser.Parser(tokens, evaluate=False)
     ast = parse_to_mips.parse()
-    symbol_table = parse_to_mips.get_symbol_table()
+    semantic.SemanticAnalyzer().analyze(ast)
 
-    generator = Generator(symbol_table)
+    generator = Generator()
     mips_code = generator.generate_mips(ast)
 
-    # output_file = "output.asm"
-    # with open(output_file, "w") as file:
-    #     file.write(mips_code)
-
     print(mips_code)
 
+    # Large programs can be streamed to a file instead
+    # with open("output.asm", "wb") as file:
+    #     Generator().write_mips(ast, file)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,376 @@
+import bisect
+
+import lexer
+import parser
+
+STATEMENT_ENDS = parser.STATEMENT_ENDS
+STATEMENT_ERRORS = parser.STATEMENT_ERRORS
+
+class LiveParser(parser.Parser):
+    """
+    Parser used while editing. There is no stdin in the editor, so `summon`
+    only checks the variable and leaves its value unknown. trial and cycle
+    bodies are checked once rather than run, and the variables they assign
+    are unknown afterwards.
+
+    Statements are re-parsed from the middle of the buffer, so slots would be
+    numbered from the wrong place; the editor leaves them unresolved (None).
+    """
+    def resolve_slot(self, var_name):
+        return None
+
+    def declare_slot(self, var_name, data_type):
+        return None
+
+    def execute_statement(self, node):
+        if node['type'] not in ('if_statement', 'for_statement'):
+            return super().execute_statement(node)
+
+        self.check_names(node['condition'])
+        try:
+            self.execute_block(node['body'])
+        finally:
+            # Also when the body fails part way, after some of its assignments ran
+            for var_name in assigned_names(node['body']):
+                if var_name in self.symbol_table:
+                    # Stored through __setitem__ so that TrackedTable sees the write
+                    self.symbol_table[var_name] = dict(self.symbol_table[var_name], value=None)
+
+    def check_names(self, node):
+        if node['type'] == 'variable':
+            if node['name'] not in self.symbol_table:
+                raise SyntaxError(f"Variable '{node['name']}' not declared")
+        elif 'left' in node:
+            self.check_names(node['left'])
+            self.check_names(node['right'])
+
+    def execute_input_statement(self, node):
+        var_name = node['variable']
+        if var_name not in self.symbol_table:
+            raise SyntaxError(f"Variable '{var_name}' not declared")
+
+        self.symbol_table[var_name]['value'] = None
+        node['value'] = None
+
+def assigned_names(body):
+    """
+    Names assigned or read into anywhere in a trial or cycle body.
+    """
+    names = set()
+    for statement in body:
+        if statement['type'] in ('variable_assignment', 'input_statement'):
+            names.add(statement['variable'])
+        elif 'body' in statement:
+            names |= assigned_names(statement['body'])
+    return names
+
+class TrackedTable(dict):
+    """
+    Symbol table that remembers which names were declared since the last reset.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.declared = set()
+
+    def __setitem__(self, name, info):
+        self.declared.add(name)
+        super().__setitem__(name, info)
+
+class Statement:
+    """
+    One parsed statement: the tokens it spans, its AST node (or the error it
+    raised) and the symbol table entries it left behind.
+    """
+    __slots__ = ('tokens', 'node', 'error', 'changes')
+
+    def __init__(self, tokens, node, error, changes):
+        self.tokens = tokens
+        self.node = node
+        self.error = error
+        self.changes = changes
+
+def shift_lines(node, delta):
+    """
+    Move the line recorded on a statement, and on those in its body, by delta.
+    """
+    if delta:
+        node['line'] += delta
+        for statement in node.get('body', ()):
+            shift_lines(statement, delta)
+
+def apply_changes(state, changes):
+    for name, info in changes.items():
+        state[name] = dict(info)
+
+def position(token):
+    return (token.line, token.column)
+
+class IncrementalFrontEnd:
+    """
+    Keeps the tokens and statements of a buffer up to date across edits.
+    Tokens are stored per line. An edit re-lexes only the touched lines (widened
+    while a comment or string still spans the boundary) and re-parses from the
+    first touched statement until the statements line up with the previous
+    parse again, at a statement that starts on the same token with the same
+    symbol table. Statements keep only the symbol table entries they wrote, so
+    no per-statement copies of the whole table are needed.
+    """
+    def __init__(self, text=''):
+        self.lines = text.split('\n')
+        self.line_tokens, self.line_clean, self.line_errors = self.lex_lines(0, len(self.lines))
+        self.unterminated = self.first_unterminated(0)
+        self.statements = []
+        self.symbol_table = {}
+        self.reparse(0, 0, 0, 0)
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+    @property
+    def ast(self):
+        return [statement.node for statement in self.statements if statement.node is not None]
+
+    def lex_lines(self, first, stop):
+        """
+        Lex lines[first:stop] (0-based). Returns per-line tokens, whether each
+        line starts outside a comment or string, and per-line lexer errors, or
+        None if a comment or string is still open at the end of the range.
+        """
+        at_end = stop == len(self.lines)
+        text = '\n'.join(self.lines[first:stop])
+        if not at_end:
+            text += '\n'
+
+        count = stop - first
+        tokens = [[] for _ in range(count)]
+        clean = [True] * count
+        errors = [None] * count
+        row = 0
+        line_start = 0
+
+        for match in lexer.TOKEN_REGEX.finditer(text):
+            kind = match.lastgroup
+            value = match.group()
+            column = match.start() - line_start
+            if kind == 'NEWLINE':
+                row += 1
+                line_start = match.end()
+                continue
+            if kind == 'MISMATCH':
+                if not at_end and value in lexer.OPEN_DELIMITERS:
+                    return None
+                if errors[row] is None:
+                    errors[row] = []
+                errors[row].append((column, value))
+                continue
+            if kind not in lexer.SKIPPED_KINDS:
+                tokens[row].append(lexer.Token(kind, value, first + row + 1, column))
+            if kind in ('MULTI_COMMENT', 'STRING') and '\n' in value:
+                newlines = value.count('\n')
+                for covered in range(row + 1, row + newlines + 1):
+                    clean[covered] = False
+                row += newlines
+                line_start = match.start() + value.rindex('\n') + 1
+
+        return tokens, clean, errors
+
+    def first_unterminated(self, first):
+        """
+        Line of the first comment, string or char left open at the end of the
+        buffer, at or after line index first.
+        """
+        for row in range(first, len(self.lines)):
+            errors = self.line_errors[row]
+            if errors and any(value in lexer.OPEN_DELIMITERS for _, value in errors):
+                return row
+        return None
+
+    def edit(self, start_line, start_column, end_line, end_column, new_text):
+        """
+        Replace the text between two positions (1-based lines, 0-based columns,
+        as stored on Token) and bring tokens and statements up to date.
+        Returns the diagnostics for the new buffer.
+        """
+        first = start_line - 1
+        last = end_line - 1
+        new_lines = (self.lines[first][:start_column] + new_text + self.lines[last][end_column:]).split('\n')
+        delta = len(new_lines) - (last - first + 1)
+
+        # Lexing restarts at the nearest line that does not begin inside a comment or
+        # string; a comment or string left open earlier may be closed by this edit
+        begin = first
+        if self.unterminated is not None and self.unterminated < begin:
+            begin = self.unterminated
+        while begin > 0 and not self.line_clean[begin]:
+            begin -= 1
+
+        self.lines[first:last + 1] = new_lines
+        self.line_tokens[first:last + 1] = [[]] * len(new_lines)
+        self.line_clean[first:last + 1] = [False] * len(new_lines)
+        self.line_errors[first:last + 1] = [None] * len(new_lines)
+
+        # Lines past the edit still hold the previous lexing; stop at the first
+        # one that was lexed from the same (clean) state
+        stop = first + len(new_lines)
+        while True:
+            lexed = self.lex_lines(begin, stop)
+            if lexed is not None and (stop == len(self.lines) or self.line_clean[stop]):
+                break
+            stop = min(len(self.lines), stop + max(stop - begin, 1))
+        old_stop = stop - delta
+
+        # Statements [i0, j0) touch the re-lexed lines; located with the old line numbers
+        i0 = bisect.bisect_right(self.statements, begin, key=lambda statement: statement.tokens[-1].line)
+        j0 = max(i0, bisect.bisect_right(self.statements, old_stop, key=lambda statement: statement.tokens[0].line))
+        # A broken statement that ran into the end of input would also swallow new tokens
+        if i0 > 0 and (self.statements[i0 - 1].tokens[-1].kind not in STATEMENT_ENDS
+                       or self.statements[i0 - 1].error is not None):
+            i0 -= 1
+
+        start_row, start_index = begin, 0
+        if i0 < len(self.statements) and self.statements[i0].tokens[0].line - 1 < begin:
+            first_token = self.statements[i0].tokens[0]
+            start_row = first_token.line - 1
+            start_index = next(index for index, token in enumerate(self.line_tokens[start_row]) if token is first_token)
+        tokens, clean, errors = lexed
+        self.line_tokens[begin:stop] = tokens
+        self.line_clean[begin:stop] = clean
+        self.line_errors[begin:stop] = errors
+        if delta:
+            for line_tokens in self.line_tokens[stop:]:
+                for token in line_tokens:
+                    token.line += delta
+        if stop == len(self.lines):
+            self.unterminated = self.first_unterminated(begin)
+        elif self.unterminated is not None:
+            if self.unterminated >= old_stop:
+                self.unterminated += delta
+            else:
+                # The edit removed it
+                self.unterminated = self.first_unterminated(stop)
+
+        self.reparse(i0, j0, start_row, start_index)
+        if delta:
+            # Statements kept from the previous parse moved with their tokens
+            for statement in self.statements:
+                if statement.node is not None:
+                    shift_lines(statement.node, statement.tokens[0].line - statement.node['line'])
+        return self.diagnostics()
+
+    def reparse(self, i0, j0, start_row, start_index):
+        """
+        Re-parse from statement i0, starting at line_tokens[start_row][start_index].
+        Statements from j0 on have unchanged tokens. Once parsing reaches one of
+        them, it is reused if it mentions no variable whose entry changed, and
+        parsing stops when no entry differs from the previous parse any more.
+        """
+        entry_state = {}
+        for statement in self.statements[:i0]:
+            apply_changes(entry_state, statement.changes)
+        consumed = []
+
+        def stream():
+            row, index = start_row, start_index
+            while row < len(self.line_tokens):
+                for token in self.line_tokens[row][index:]:
+                    consumed.append(token)
+                    yield token
+                row += 1
+                index = 0
+
+        live = LiveParser(stream(), evaluate=False)
+        live.symbol_table = TrackedTable()
+        apply_changes(live.symbol_table, entry_state)
+        old = self.statements
+        new_statements = []
+        # Entries written by the old statements [i0, j), and names whose value may
+        # differ between the old and the new parse at this point
+        old_changes = {}
+        pending = set()
+        j = i0
+
+        while live.peek() is not None:
+            token = live.peek()
+            while j < len(old) and (j < j0 or position(old[j].tokens[0]) < position(token)):
+                old_changes.update(old[j].changes)
+                pending |= old[j].changes.keys()
+                j += 1
+            if j < len(old) and old[j].tokens[0] is token:
+                pending = {name for name in pending
+                           if live.symbol_table.get(name) != old_changes.get(name, entry_state.get(name))}
+                if not pending:
+                    self.statements[i0:j] = new_statements
+                    return
+                statement = old[j]
+                if not any(word.kind == parser.VARIABLE_NAME and word.value in pending for word in statement.tokens):
+                    # It mentions nothing that changed, so it would parse the same way again
+                    for _ in statement.tokens:
+                        live.consume()
+                    apply_changes(live.symbol_table, statement.changes)
+                    old_changes.update(statement.changes)
+                    new_statements.append(statement)
+                    j += 1
+                    continue
+
+            start = live.current
+            live.symbol_table.declared = set()
+            try:
+                node = live.parse_statement()
+                error = None
+            except STATEMENT_ERRORS as exc:
+                node = None
+                error = (live.peek() or consumed[-1], str(exc))
+                live.synchronize()
+            else:
+                # The statement parsed; evaluation errors need no resynchronization
+                try:
+                    live.execute_statement(node)
+                except STATEMENT_ERRORS as exc:
+                    node = None
+                    error = (consumed[start], str(exc))
+            # Names declared inside a trial or cycle body are gone again
+            written = {name for name in live.symbol_table.declared if name in live.symbol_table}
+            if node is not None and 'variable' in node:
+                written.add(node['variable'])
+            pending |= written
+            changes = {name: dict(live.symbol_table[name]) for name in written}
+            new_statements.append(Statement(consumed[start:live.current], node, error, changes))
+
+        self.statements[i0:] = new_statements
+        self.symbol_table = live.symbol_table
+
+    def diagnostics(self):
+        found = []
+        for row, errors in enumerate(self.line_errors):
+            if errors:
+                for column, value in errors:
+                    found.append({
+                        'line': row + 1,
+                        'column': column,
+                        'message': f"Unexpected character {value}"
+                    })
+        for statement in self.statements:
+            if statement.error is not None:
+                token, message = statement.error
+                found.append({
+                    'line': token.line,
+                    'column': token.column,
+                    'message': message
+                })
+        found.sort(key=lambda diagnostic: (diagnostic['line'], diagnostic['column']))
+        return found
+
+def main():
+    document = IncrementalFrontEnd("""tally x imbue with 4;
+tally y imbue with x amplified by 2;
+cast spell y;""")
+    print(document.diagnostics())
+
+    # Typing on the second line only re-lexes that line and re-parses from it
+    print(document.edit(2, 19, 2, 20, "z"))
+    print(document.edit(2, 19, 2, 20, "x"))
+    print(document.ast)
+
+if __name__ == "__main__":
+    main()
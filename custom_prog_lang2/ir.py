@@ -0,0 +1,565 @@
+import lexer
+import parser
+import semantic
+
+# Three-address intermediate representation between the AST and MIPS.
+#
+# A Program is a list of basic blocks. Each block is straight-line code ending
+# in exactly one terminator (jump, branch or exit). Instructions compute into
+# virtual registers (VReg), of which there are as many as needed, each holding
+# either a word or (is_float) a single-precision portion value; variables live
+# in memory under a storage label and are reached only through load and store,
+# so passes can see every access. Operands are VRegs, immediates (int) or
+# labels (str): variables, string literals and blocks.
+#
+#   v3 = li 5                  v3 = load x            store x, v3
+#   v4 = add v3, v2            v4 = add v3, 1         (binary ops, rhs may be an immediate)
+#   v4 = sub 0, v3                                    (negation: the lhs of sub may be 0)
+#   v5 = sll v4, 2             v5 = mulhi v4, v3      (high word of the product)
+#   v5 = move v4               v6 = read_int          read_string x_buffer
+#   print_int v5               print_char v5          print_string str_1
+#   print_buffer x_buffer      copy_string x_buffer, str_1   append_string x_buffer, y_buffer
+#   jump L2                    branch v3, L1, L2      exit
+#   cbranch slt, v3, 10, L1, L2                       (branch on a comparison)
+#
+# portion values have ops of their own, computing into float VRegs except for
+# the comparisons, which give a word of 1 or 0:
+#
+#   f1 = fload x               fstore x, f1           f2 = itof v3
+#   f3 = fadd f1, f2           v4 = fslt f1, f2       f5 = read_float
+#   print_float f3
+#
+# Each instruction also records the (line, column) of the statement it was
+# lowered from, or None, which passes keep when they rewrite it; the
+# generator turns them into the source map.
+
+class VReg:
+    __slots__ = ('number', 'is_float')
+
+    def __init__(self, number, is_float=False):
+        self.number = number
+        self.is_float = is_float
+
+    def __repr__(self):
+        return f"f{self.number}" if self.is_float else f"v{self.number}"
+
+class Instruction:
+    __slots__ = ('op', 'dest', 'args', 'position')
+
+    def __init__(self, op, dest, args, position=None):
+        self.op = op
+        self.dest = dest
+        self.args = args
+        self.position = position
+
+    def uses(self):
+        """
+        The virtual registers this instruction reads.
+        """
+        return [arg for arg in self.args if isinstance(arg, VReg)]
+
+    def __repr__(self):
+        args = ', '.join(str(arg) for arg in self.args)
+        text = f"{self.op} {args}" if args else self.op
+        return f"{self.dest} = {text}" if self.dest is not None else text
+
+class Block:
+    __slots__ = ('label', 'instructions')
+
+    def __init__(self, label):
+        self.label = label
+        self.instructions = []
+
+    @property
+    def terminator(self):
+        return self.instructions[-1] if self.instructions and self.instructions[-1].op in TERMINATORS else None
+
+    def successors(self):
+        terminator = self.terminator
+        if terminator is None or terminator.op == 'exit':
+            return []
+        if terminator.op == 'jump':
+            return [terminator.args[0]]
+        return list(terminator.args[-2:])
+
+# Computing ops, with a destination and no other effect
+BINARY_OPS = ('add', 'sub', 'mul', 'div', 'slt', 'sgt', 'sle', 'sge', 'seq', 'sne', 'and', 'or',
+              'sll', 'sra', 'srl', 'mulhi')
+# Binary ops MIPS has no immediate form of, whose right operand stays a VReg
+REGISTER_OPS = ('mulhi',)
+FLOAT_ARITHMETIC_OPS = {'add': 'fadd', 'sub': 'fsub', 'mul': 'fmul', 'div': 'fdiv'}
+FLOAT_COMPARISON_OPS = {'slt': 'fslt', 'sgt': 'fsgt', 'sle': 'fsle', 'sge': 'fsge', 'seq': 'fseq', 'sne': 'fsne'}
+FLOAT_OPS = tuple(FLOAT_ARITHMETIC_OPS.values()) + tuple(FLOAT_COMPARISON_OPS.values()) + ('fload', 'itof')
+PURE_OPS = BINARY_OPS + FLOAT_OPS + ('li', 'move', 'load')
+TERMINATORS = ('jump', 'branch', 'cbranch', 'exit')
+
+def may_trap(instruction):
+    """
+    Whether instruction can stop the program: a tally division by a divisor
+    not known to be nonzero, which the generator guards with a trap. It has
+    to run even if its result is never used.
+    """
+    if instruction.op != 'div':
+        return False
+    divisor = instruction.args[1]
+    return isinstance(divisor, VReg) or divisor == 0
+
+# Comparisons a cbranch can test
+COMPARISON_OPS = ('slt', 'sgt', 'sle', 'sge', 'seq', 'sne')
+
+# Memory behaviour: the operand indexes holding the variable labels each op
+# reads, and the one it writes
+MEMORY_READS = {'load': (0,), 'fload': (0,), 'print_buffer': (0,), 'copy_string': (1,), 'append_string': (0, 1)}
+MEMORY_WRITES = {'store': 0, 'fstore': 0, 'read_string': 0, 'copy_string': 0, 'append_string': 0}
+
+# Loads and stores of a single variable, by value kind
+LOAD_OPS = ('load', 'fload')
+STORE_OPS = ('store', 'fstore')
+
+# Source operators and the ops they lower to
+OPERATOR_OPS = {
+    'augmented by': 'add', 'augment by': 'add',
+    'diminished by': 'sub', 'diminish by': 'sub',
+    'amplified by': 'mul', 'amplify by': 'mul',
+    'fragmented by': 'div', 'fragment by': 'div',
+    'exceeds': 'sgt',
+    'falls below': 'slt',
+    'at least': 'sge',
+    'at most': 'sle',
+    'mirrors': 'seq',
+    'defies': 'sne',
+    'and': 'and',
+    'or': 'or',
+}
+
+# Size of every verse buffer, in bytes
+VERSE_BUFFER_SIZE = 100
+
+# Buffer a concatenation is built in when it reads its own target
+VERSE_SCRATCH = 'verse.scratch'
+
+# What a declaration without an initializer sets its variable to
+DEFAULT_VALUES = {
+    'tally': {'type': 'number', 'value': 0},
+    'portion': {'type': 'number', 'value': 0.0},
+    'rune': {'type': 'number', 'value': 0},
+    'verse': {'type': 'string', 'value': '""'},
+}
+
+class Storage:
+    """
+    Where a declared variable lives: its data label and type.
+    """
+    __slots__ = ('label', 'data_type')
+
+    def __init__(self, label, data_type):
+        self.label = label
+        self.data_type = data_type
+
+class Program:
+    def __init__(self):
+        self.blocks = []
+        # (label, directive, value) in the order the generator should write them
+        self.data = []
+        self.vreg_count = 0
+        self.label_count = 0
+        self.string_count = 0
+        self.float_count = 0
+        # String pool: data label of each distinct literal
+        self.strings = {}
+        # Float constant pool, likewise; MIPS has no float immediates
+        self.floats = {}
+
+    def new_vreg(self, is_float=False):
+        vreg = VReg(self.vreg_count, is_float)
+        self.vreg_count += 1
+        return vreg
+
+    def new_block(self, label=None):
+        if label is None:
+            label = f"L{self.label_count}"
+            self.label_count += 1
+        block = Block(label)
+        self.blocks.append(block)
+        return block
+
+    def block_map(self):
+        return {block.label: block for block in self.blocks}
+
+    def add_string(self, text):
+        """
+        Data label of the string literal text; equal literals share one.
+        """
+        label = self.strings.get(text)
+        if label is None:
+            label = f"str_{self.string_count}"
+            self.string_count += 1
+            self.strings[text] = label
+            self.data.append((label, '.asciiz', text))
+        return label
+
+    def add_float(self, value):
+        """
+        Data label of a .float holding value; equal values share one.
+        """
+        label = self.floats.get(value)
+        if label is None:
+            label = f"flt_{self.float_count}"
+            self.float_count += 1
+            self.floats[value] = label
+            self.data.append((label, '.float', value))
+        return label
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.instructions
+
+    def dump(self):
+        lines = []
+        for block in self.blocks:
+            lines.append(f"{block.label}:")
+            lines.extend(f"    {instruction}" for instruction in block.instructions)
+        return '\n'.join(lines)
+
+class Lowering:
+    """
+    Translates a checked AST (Parser(tokens, evaluate=False) followed by
+    semantic.SemanticAnalyzer) into a Program.
+    """
+    def __init__(self):
+        self.program = Program()
+        self.block = self.program.new_block('main')
+        # Storage by slot; variables parsed without slots fall back to their name
+        self.storage = {}
+        self.labels = set()
+        # trial and cycle bodies being lowered
+        self.depth = 0
+        # (line, column) of the statement being lowered
+        self.position = None
+        self.handlers = {
+            'variable_declaration': self.lower_variable_declaration,
+            'variable_assignment': self.lower_variable_assignment,
+            'input_statement': self.lower_input_statement,
+            'output_statement': self.lower_output_statement,
+            'if_statement': self.lower_if_statement,
+            'for_statement': self.lower_for_statement,
+        }
+
+    def lower(self, ast):
+        for node in ast:
+            self.lower_statement(node)
+        self.emit('exit')
+        return self.program
+
+    def emit(self, op, *args, dest=None):
+        self.block.instructions.append(Instruction(op, dest, args, self.position))
+        return dest
+
+    def emit_value(self, op, *args):
+        return self.emit(op, *args, dest=self.program.new_vreg())
+
+    def emit_float(self, op, *args):
+        return self.emit(op, *args, dest=self.program.new_vreg(is_float=True))
+
+    def to_float(self, value):
+        """
+        value as a float VReg, converting a word.
+        """
+        return value if value.is_float else self.emit_float('itof', value)
+
+    def truth(self, value):
+        """
+        A word of 1 if value is not zero, else 0.
+        """
+        if value.is_float:
+            return self.emit_value('fsne', value, self.emit_float('fload', self.program.add_float(0.0)))
+        return self.emit_value('sne', value, 0)
+
+    def start_block(self, block):
+        """
+        Continue emitting into block; the current block must already end in its terminator.
+        """
+        self.block = block
+
+    def lower_statement(self, node):
+        handler = self.handlers.get(node['type'])
+        if handler is None:
+            raise ValueError(f"Unknown node type: {node['type']}")
+        # A trial or cycle gets its position back once its body is lowered
+        outer = self.position
+        if 'line' in node:
+            self.position = (node['line'], node['column'])
+        handler(node)
+        self.position = outer
+
+    def lookup(self, slot, name):
+        return self.storage[name if slot is None else slot]
+
+    def declare(self, node):
+        name = node['variable']
+        slot = node.get('slot')
+        data_type = node['data_type']
+
+        # Names can be declared again in sibling blocks; later ones get their slot appended
+        label = name if name not in self.labels else f"{name}_{slot}"
+        self.labels.add(label)
+        storage = Storage(label, data_type)
+        self.storage[name if slot is None else slot] = storage
+
+        if data_type == 'verse':
+            storage.label = f"{label}_buffer"
+            self.program.data.append((storage.label, '.space', VERSE_BUFFER_SIZE))
+        elif data_type == 'portion':
+            self.program.data.append((label, '.float', 0.0))
+        else:
+            self.program.data.append((label, '.word', 0))
+        return storage
+
+    def lower_variable_declaration(self, node):
+        storage = self.declare(node)
+        if 'expression' in node:
+            self.assign(storage, node['expression'])
+        elif self.depth:
+            # A body can run again, and its declarations start over each time
+            self.assign(storage, DEFAULT_VALUES[storage.data_type])
+
+    def lower_variable_assignment(self, node):
+        self.assign(self.lookup(node.get('slot'), node['variable']), node['expression'])
+
+    def assign(self, storage, expression):
+        if storage.data_type == 'verse':
+            self.concatenate(storage.label, self.verse_sources(expression))
+        elif storage.data_type == 'rune' and expression['type'] == 'string':
+            # Runes are stored as character codes
+            self.emit('store', storage.label, self.emit_value('li', ord(expression['value'][1:-1])))
+        else:
+            self.store(storage, self.lower_expression(expression))
+
+    def store(self, storage, value):
+        if storage.data_type == 'portion':
+            self.emit('fstore', storage.label, self.to_float(value))
+        elif value.is_float:
+            raise ValueError(f"Cannot store a portion value in {storage.data_type} '{storage.label}'")
+        else:
+            self.emit('store', storage.label, value)
+
+    def verse_sources(self, node):
+        """
+        Labels of the strings a verse expression concatenates, in order. The
+        result of `x augment by ...` is built in x first and then read from there.
+        """
+        if node['type'] == 'string':
+            return [self.program.add_string(node['value'])]
+        elif node['type'] == 'variable':
+            return [self.lookup(node.get('slot'), node['name']).label]
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            sources = self.verse_sources(node['left']) + self.verse_sources(node['right'])
+            if node['type'] == 'compound_assignment' and node['left']['type'] == 'variable':
+                target = self.lookup(node['left'].get('slot'), node['left']['name']).label
+                self.concatenate(target, sources)
+                return [target]
+            return sources
+        raise ValueError(f"Unsupported verse expression in MIPS generator: {node['type']}")
+
+    def concatenate(self, target, sources):
+        """
+        Emit the copies building the concatenation of sources in target.
+        """
+        if sources[0] == target and target not in sources[1:]:
+            # Appending to itself: the first copy is not needed
+            rest = sources[1:]
+        elif target in sources:
+            # target would be read after it is overwritten: build the result aside
+            if not any(label == VERSE_SCRATCH for label, directive, value in self.program.data):
+                self.program.data.append((VERSE_SCRATCH, '.space', VERSE_BUFFER_SIZE))
+            self.concatenate(VERSE_SCRATCH, sources)
+            self.emit('copy_string', target, VERSE_SCRATCH)
+            return
+        else:
+            self.emit('copy_string', target, sources[0])
+            rest = sources[1:]
+        for source in rest:
+            self.emit('append_string', target, source)
+
+    def lower_expression(self, node):
+        """
+        Emit the code computing a tally, rune or portion expression; returns
+        its VReg, a float one for portion values.
+        """
+        if node['type'] == 'number':
+            if isinstance(node['value'], float):
+                return self.emit_float('fload', self.program.add_float(node['value']))
+            return self.emit_value('li', node['value'])
+        elif node['type'] == 'variable':
+            storage = self.lookup(node.get('slot'), node['name'])
+            if storage.data_type == 'portion':
+                return self.emit_float('fload', storage.label)
+            return self.emit_value('load', storage.label)
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            op = OPERATOR_OPS[node['operator']]
+            left = self.lower_expression(node['left'])
+            right = self.lower_expression(node['right'])
+            if op in ('and', 'or'):
+                # Logical operators work on truth values: normalize both sides to 1 or 0
+                result = self.emit_value(op, self.truth(left), self.truth(right))
+            elif left.is_float or right.is_float:
+                # A tally mixed with a portion is converted to one
+                if op in FLOAT_COMPARISON_OPS:
+                    result = self.emit_value(FLOAT_COMPARISON_OPS[op], self.to_float(left), self.to_float(right))
+                else:
+                    result = self.emit_float(FLOAT_ARITHMETIC_OPS[op], self.to_float(left), self.to_float(right))
+            else:
+                result = self.emit_value(op, left, right)
+            if node['type'] == 'compound_assignment' and node['left']['type'] == 'variable':
+                # `x augment by 1` also stores the result back into x
+                self.store(self.lookup(node['left'].get('slot'), node['left']['name']), result)
+            return result
+        raise ValueError(f"Unsupported expression in MIPS generator: {node['type']}")
+
+    def lower_input_statement(self, node):
+        storage = self.lookup(node.get('slot'), node['variable'])
+        if storage.data_type == 'verse':
+            self.emit('read_string', storage.label)
+        elif storage.data_type == 'portion':
+            self.emit('fstore', storage.label, self.emit_float('read_float'))
+        else:
+            self.emit('store', storage.label, self.emit_value('read_int'))
+
+    def lower_output_statement(self, node):
+        for expression in node['expressions']:
+            if expression['type'] == 'string':
+                self.emit('print_string', self.program.add_string(expression['value']))
+                continue
+            storage = self.lookup(expression.get('slot'), expression['name'])
+            if storage.data_type == 'verse':
+                self.emit('print_buffer', storage.label)
+            elif storage.data_type == 'rune':
+                self.emit('print_char', self.emit_value('load', storage.label))
+            elif storage.data_type == 'portion':
+                self.emit('print_float', self.emit_float('fload', storage.label))
+            else:
+                self.emit('print_int', self.emit_value('load', storage.label))
+
+    def lower_condition(self, node):
+        value = self.lower_expression(node)
+        return self.truth(value) if value.is_float else value
+
+    def lower_body(self, body):
+        self.depth += 1
+        for statement in body:
+            self.lower_statement(statement)
+        self.depth -= 1
+
+    def lower_if_statement(self, node):
+        condition = self.lower_condition(node['condition'])
+        body = self.program.new_block()
+        end = self.program.new_block()
+        self.emit('branch', condition, body.label, end.label)
+        self.start_block(body)
+        self.lower_body(node['body'])
+        self.emit('jump', end.label)
+        # Blocks are laid out in creation order, so later blocks go after end
+        self.program.blocks.remove(end)
+        self.program.blocks.append(end)
+        self.start_block(end)
+
+    def lower_for_statement(self, node):
+        # Laid out bottom-tested: the test follows the body, so each
+        # iteration ends in one branch back to the body instead of a jump to
+        # the test and a branch out of it
+        test = self.program.new_block()
+        body = self.program.new_block()
+        end = self.program.new_block()
+        self.emit('jump', test.label)
+        self.start_block(body)
+        self.lower_body(node['body'])
+        self.emit('jump', test.label)
+        for block in (test, end):
+            self.program.blocks.remove(block)
+            self.program.blocks.append(block)
+        self.start_block(test)
+        self.emit('branch', self.lower_condition(node['condition']), body.label, end.label)
+        self.start_block(end)
+
+def lower(ast):
+    return Lowering().lower(ast)
+
+def predecessors(program):
+    preds = {block.label: [] for block in program.blocks}
+    for block in program.blocks:
+        for successor in block.successors():
+            preds[successor].append(block.label)
+    return preds
+
+def dominators(program):
+    """
+    The set of block labels dominating each block (including itself).
+    """
+    preds = predecessors(program)
+    labels = [block.label for block in program.blocks]
+    entry = labels[0]
+    dominated = {label: set(labels) for label in labels}
+    dominated[entry] = {entry}
+    changed = True
+    while changed:
+        changed = False
+        for label in labels[1:]:
+            incoming = [dominated[pred] for pred in preds[label]]
+            new = set.intersection(*incoming) | {label} if incoming else {label}
+            if new != dominated[label]:
+                dominated[label] = new
+                changed = True
+    return dominated
+
+def natural_loops(program):
+    """
+    (header, body labels) for every back edge, i.e. an edge into a block that
+    dominates its source; loops sharing a header are merged.
+    """
+    preds = predecessors(program)
+    dominated = dominators(program)
+    loops = {}
+    for block in program.blocks:
+        for successor in block.successors():
+            if successor in dominated[block.label]:
+                body = loops.setdefault(successor, {successor})
+                pending = [block.label]
+                while pending:
+                    label = pending.pop()
+                    if label not in body:
+                        body.add(label)
+                        pending.extend(preds[label])
+    return list(loops.items())
+
+def loop_depths(program):
+    """
+    How many loops each block is nested in.
+    """
+    depths = {block.label: 0 for block in program.blocks}
+    for header, body in natural_loops(program):
+        for label in body:
+            depths[label] += 1
+    return depths
+
+def run_passes(program, passes):
+    """
+    Run each pass (a callable taking and changing a Program) in order.
+    """
+    for ir_pass in passes:
+        ir_pass(program)
+    return program
+
+def main():
+    input_code = """
+    tally n imbue with 0;
+    cycle (n falls below 3) {
+        n imbue with n augmented by 1;
+    }
+    cast spell "n is " spell n;
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    print(lower(ast).dump())
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,38 @@
+import codecs
+import mmap
+import os
 import re
+from array import array
+
+import scanner
+import tokens
+
+# The keyword tables live in tokens, which scanner shares
+KEYWORDS = tokens.KEYWORDS
+OPERATORS = tokens.OPERATORS
+
+def keyword_pattern(words):
+    """Whole-word alternation, longest first"""
+    return r'\b(?:' + '|'.join(sorted(words, key=len, reverse=True)) + r')\b'
+
+def keywords_of(kind):
+    return [word for word, word_kind in KEYWORDS.items() if word_kind == kind]
 
 # Define token types with regex patterns
+# Keywords and operators come before VARIABLE_NAME and only match whole words
 TOKEN_SPECIFICATION = [
-    ('DATA_TYPE',       r'\b(?:tally|rune|verse|portion)\b'), # Data type
-    ('INPUT',           r'(?:summon)'),
-    ('OUTPUT',          r'cast'),
-    ('OUTPUT_CASE',     r'spell'),
+    ('DATA_TYPE',       keyword_pattern(keywords_of('DATA_TYPE'))), # Data type
+    ('INPUT',           keyword_pattern(keywords_of('INPUT'))),
+    ('OUTPUT',          keyword_pattern(keywords_of('OUTPUT'))),
+    ('OUTPUT_CASE',     keyword_pattern(keywords_of('OUTPUT_CASE'))),
     ('NUMBER',          r'\d+(\.\d*)?'),  # Integer or decimal number
     ('STRING',          r'(?:"[^"]*")|(?:\'[^\']*\')'),
     ('CHAR',            r'(?:"[^"]")|(?:\'[^\']\')'),
-    ('OPERATOR',        r'(imbue with|augmented by|diminished by|amplified by|fragmented by|augment by|diminish by|amplify by|fragment by)'), 
+    ('OPERATOR',        keyword_pattern(OPERATORS)),
+    ('IF_STATEMENT',    keyword_pattern(keywords_of('IF_STATEMENT'))),
+    ('FOR_STATEMENT',   keyword_pattern(keywords_of('FOR_STATEMENT'))),
     ('VARIABLE_NAME',   r'[A-Za-z_]\w*'),  # Identifiers (variable names)
     ('PUNCTUATION',     r'[,\(\)]'),       # Punctuation
-    ('IF_STATEMENT',    r'\b(?:trial)\b'),
-    ('FOR_STATEMENT',   r'\b(?:cycle)\b'),
     ('SEMI_COLON',      r';'),
     ('START_IF_FOR',    r'{'), 
     ('END_IF_FOR',      r'}'), 
@@ -24,41 +43,204 @@ TOKEN_SPECIFICATION = [
     ('MISMATCH',        r'.'),            # Any other character
 ]
 
-# Token class for structured storage
-class Token:
-    def __init__(self, type_, value, line, column):
-        self.type = type_
-        self.value = value
-        self.line = line
-        self.column = column
+# Compiled once at import time instead of on every call
+TOKEN_REGEX = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPECIFICATION), re.DOTALL)
+
+# Kinds that are matched but never handed to the parser
+SKIPPED_KINDS = ('SKIP', 'SINGLE_COMMENT', 'MULTI_COMMENT')
+
+# A match ending this close to the end of a chunk may still grow once more text
+# arrives (identifiers, numbers, 'fragmented by'), so the lexer reads ahead first
+LOOKAHEAD = max(len(operator) for operator in OPERATORS) + 2
+
+# A MISMATCH on one of these may be an unterminated comment, string or char
+# that closes in a later chunk
+OPEN_DELIMITERS = ('/', '"', "'")
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Integer kind codes, in TOKEN_SPECIFICATION order; the parser dispatches on these
+TOKEN_KINDS = tokens.TOKEN_KINDS
+KIND_CODES = tokens.KIND_CODES
+
+Token = tokens.Token
+
+class TokenStore:
+    """
+    Struct-of-arrays token stream.
+    Each token costs one byte of kind code and four unsigned ints (start, end,
+    line, column); values are sliced from the source only when asked for.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+
+    def append(self, kind, start, end, line, column):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def value(self, index):
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield TokenView(self, index)
+
+class TokenView:
+    """
+    Lightweight stand-in for Token that reads its fields from a TokenStore,
+    so code written against Token keeps working.
+    """
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def kind(self):
+        return self.store.kinds[self.index]
+
+    @property
+    def type(self):
+        return TOKEN_KINDS[self.store.kinds[self.index]]
+
+    @property
+    def value(self):
+        return self.store.value(self.index)
+
+    @property
+    def line(self):
+        return self.store.lines[self.index]
+
+    @property
+    def column(self):
+        return self.store.columns[self.index]
 
     def __repr__(self):
         return f"Token({self.type}, {repr(self.value)}, Line {self.line}, Col {self.column})"
 
-def lexical_analyzer(text):
-    tokens = []
+def read_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the text of a source in chunks.
+    Accepts a string of code, a path, a text or binary file object, or a
+    bytes-like region such as an mmap (decoded as UTF-8).
+    """
+    if isinstance(source, str):
+        yield source
+    elif isinstance(source, os.PathLike):
+        with open(source, encoding='utf-8') as file:
+            yield from read_chunks(file, chunk_size)
+    elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for start in range(0, len(source), chunk_size):
+            yield decoder.decode(source[start:start + chunk_size])
+        yield decoder.decode(b'', final=True)
+    else:
+        decoder = None
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, bytes):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder('utf-8')()
+                chunk = decoder.decode(chunk)
+            yield chunk
+        if decoder is not None:
+            yield decoder.decode(b'', final=True)
+
+def scan_tokens(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lazily tokenize a source, reading it in chunks, and yield
+    (kind, value, start, end, line, column) tuples with absolute offsets.
+    Only the unconsumed tail of the current chunk is kept in memory, so the
+    parser can start on the first statement before the rest is read. Tokens
+    that straddle a chunk boundary are completed by reading ahead.
+    """
+    chunks = read_chunks(source, chunk_size)
+    buffer = ''
+    pos = 0
+    offset = 0      # absolute offset of buffer[0]
+    eof = False
     line_num = 1
-    line_start = 0
-    token_regex = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPECIFICATION)
-    
-    complete_regex = re.compile(token_regex, re.DOTALL)
+    line_start = 0  # absolute offset of the current line
+
+    while True:
+        match = TOKEN_REGEX.match(buffer, pos)
+        if not eof and (match is None
+                        or match.end() > len(buffer) - LOOKAHEAD
+                        or (match.lastgroup == 'MISMATCH' and match.group() in OPEN_DELIMITERS)):
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                # Keep one consumed character so \b still sees the previous token
+                keep = max(pos - 1, 0)
+                buffer = buffer[keep:] + chunk
+                offset += keep
+                pos -= keep
+            continue
+        if match is None:
+            return
 
-    for match in re.finditer(complete_regex, text):
         kind = match.lastgroup
         value = match.group()
-        column = match.start() - line_start
-        # print("MATCH:", match, "match start:", match.start(), "line start", line_start)
+        start = offset + match.start()
+        column = start - line_start
+        pos = match.end()
         if kind == 'NEWLINE':
             line_num += 1
-            line_start = match.end()
-        elif kind == 'SKIP' or kind in ['SINGLE_COMMENT', 'MULTI_COMMENT']:
-            continue
+            line_start = offset + pos
+        elif kind in SKIPPED_KINDS:
+            if kind == 'MULTI_COMMENT' and '\n' in value:
+                line_num += value.count('\n')
+                line_start = start + value.rindex('\n') + 1
         elif kind == 'MISMATCH':
             raise SyntaxError(f"Unexpected character {value} on line {line_num}, column {column}")
         else:
-            tokens.append(Token(kind, value, line_num, column))
-            # print("tokens:", tokens)
-    return tokens
+            yield kind, value, start, offset + pos, line_num, column
+
+def iter_tokens(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lazily yield Token objects from a string, path, file object or mmap.
+    """
+    for kind, value, _, _, line, column in scan_tokens(source, chunk_size):
+        yield Token(kind, value, line, column)
+
+def compact_lexical_analyzer(text):
+    """
+    Tokenize text into a TokenStore instead of a list of Token objects.
+    """
+    store = TokenStore(text)
+    for kind, _, start, end, line, column in scan_tokens(text):
+        store.append(KIND_CODES[kind], start, end, line, column)
+    return store
+
+def lexical_analyzer(text):
+    """
+    Tokenize a whole string. Uses the table-driven scanner, which yields the
+    same tokens as TOKEN_REGEX without trying every alternative per token;
+    iter_tokens() remains the path for chunked sources.
+    """
+    return scanner.dfa_lexical_analyzer(text)
 
 # Example usage
 if __name__ == "__main__":
@@ -1,127 +1,322 @@
+import sys
+
 import lexer
+import symbols
+
+# Token kind codes, so dispatch compares integers instead of strings
+DATA_TYPE = lexer.KIND_CODES['DATA_TYPE']
+INPUT = lexer.KIND_CODES['INPUT']
+OUTPUT = lexer.KIND_CODES['OUTPUT']
+OUTPUT_CASE = lexer.KIND_CODES['OUTPUT_CASE']
+NUMBER = lexer.KIND_CODES['NUMBER']
+STRING = lexer.KIND_CODES['STRING']
+CHAR = lexer.KIND_CODES['CHAR']
+OPERATOR = lexer.KIND_CODES['OPERATOR']
+VARIABLE_NAME = lexer.KIND_CODES['VARIABLE_NAME']
+PUNCTUATION = lexer.KIND_CODES['PUNCTUATION']
+SEMI_COLON = lexer.KIND_CODES['SEMI_COLON']
+IF_STATEMENT = lexer.KIND_CODES['IF_STATEMENT']
+FOR_STATEMENT = lexer.KIND_CODES['FOR_STATEMENT']
+START_IF_FOR = lexer.KIND_CODES['START_IF_FOR']
+END_IF_FOR = lexer.KIND_CODES['END_IF_FOR']
+
+# Statements end at one of these, so error recovery resynchronizes on them
+STATEMENT_ENDS = (SEMI_COLON, END_IF_FOR)
+
+# Errors a single statement can raise while it is parsed and evaluated
+STATEMENT_ERRORS = (SyntaxError, TypeError, ValueError, ZeroDivisionError)
+
+# Binary operators: (precedence, node type). Higher binds tighter; the
+# compound forms share the level of their plain counterparts.
+BINARY_OPERATORS = {
+    'or': (1, 'binary_operation'),
+    'and': (2, 'binary_operation'),
+    'exceeds': (3, 'binary_operation'),
+    'falls below': (3, 'binary_operation'),
+    'at least': (3, 'binary_operation'),
+    'at most': (3, 'binary_operation'),
+    'mirrors': (3, 'binary_operation'),
+    'defies': (3, 'binary_operation'),
+    'augmented by': (4, 'binary_operation'),
+    'diminished by': (4, 'binary_operation'),
+    'augment by': (4, 'compound_assignment'),
+    'diminish by': (4, 'compound_assignment'),
+    'amplified by': (5, 'binary_operation'),
+    'fragmented by': (5, 'binary_operation'),
+    'amplify by': (5, 'compound_assignment'),
+    'fragment by': (5, 'compound_assignment'),
+}
 
 class Parser:
-    def __init__(self, tokens):
+    # Set by tracing.TracingParser; the plain parser records nothing
+    tracer = None
+
+    def __init__(self, tokens, evaluate=True):
+        """
+        tokens can be a list, a lexer.TokenStore or any iterable of tokens, e.g.
+        lexer.iter_tokens(), in which case tokens are pulled from the lexer only
+        as the parser needs them.
+
+        With evaluate=False the parser only builds the AST: it does not touch
+        the symbol table, evaluate expressions or read stdin, so the result
+        depends on the tokens alone. Declarations and types are then checked by
+        semantic.SemanticAnalyzer.
+
+        Either way every variable is resolved while parsing: declarations and
+        the variables that refer to them carry the same 'slot' index (None if
+        the name is not declared), numbered by self.scopes.
+        """
         self.tokens = tokens
+        self.evaluate = evaluate
+        self.token_stream = iter(tokens)
+        self.lookahead = next(self.token_stream, None)
         self.current = 0
+        self.previous = None
         self.symbol_table = {}
+        self.scopes = symbols.SymbolTable()
+        self.errors = []
+        # Set by parse(recover=True); trial and cycle bodies then recover per statement
+        self.recover = False
     
     def peek(self):
-        if self.current < len(self.tokens):
-            return self.tokens[self.current]
-        return None
+        return self.lookahead
     
-    def consume(self, expected_type=None):
-        if self.current >= len(self.tokens):
+    def consume(self, expected_kind=None):
+        token = self.lookahead
+        if token is None:
             raise SyntaxError("Unexpected end of input")
         
-        token = self.tokens[self.current]
-        
-        if expected_type and token.type != expected_type:
-            raise SyntaxError(f"Expected {expected_type}, got {token.type}")
+        if expected_kind is not None and token.kind != expected_kind:
+            raise SyntaxError(f"Expected {lexer.TOKEN_KINDS[expected_kind]}, got {token.type}")
         
+        self.lookahead = next(self.token_stream, None)
         self.current += 1
+        self.previous = token
         return token
     
-    def parse(self):
+    def parse(self, recover=False):
         """
         Top-level parsing method
         This implements a simple grammar for variable declarations and assignments
+
+        With recover=True a broken statement does not stop the parse: the error
+        is added to self.errors as {line, column, message}, the parser skips to
+        the next `;` or `}` and carries on, and the statements that did parse
+        are returned as a partial AST. A broken statement inside a trial or
+        cycle body is dropped from that body alone.
         """
+        self.recover = recover
         statements = []
         while self.peek():
-            statements.append(self.parse_statement())
+            if not recover:
+                statements.append(self.parse_statement())
+                continue
+
+            first_token = self.peek()
+            try:
+                statement = self.parse_statement_node()
+            except STATEMENT_ERRORS as exc:
+                self.add_error(self.peek() or self.previous, exc)
+                self.synchronize()
+                continue
+            if self.evaluate:
+                # The statement is complete, so an evaluation error needs no resynchronization
+                try:
+                    self.execute_statement(statement)
+                except STATEMENT_ERRORS as exc:
+                    self.add_error(first_token, exc)
+                    continue
+            statements.append(statement)
         return statements
+
+    def add_error(self, token, exc):
+        self.errors.append({
+            'line': token.line,
+            'column': token.column,
+            'message': str(exc)
+        })
+
+    def synchronize(self, in_block=False):
+        """
+        Panic-mode recovery: skip past the end of a broken statement, always
+        consuming at least one token. A `{ ... }` the statement opened is
+        skipped whole. In a block, the `}` closing it is left for parse_block.
+        """
+        depth = 0
+        while self.peek() is not None:
+            kind = self.peek().kind
+            if kind == END_IF_FOR and depth == 0 and in_block:
+                return
+            self.consume()
+            if kind == START_IF_FOR:
+                depth += 1
+            elif kind == END_IF_FOR:
+                if depth <= 1:
+                    return
+                depth -= 1
+            elif kind == SEMI_COLON and depth == 0:
+                return
     
     def parse_statement(self):
-        """Parse a single statement (currently supports variable declaration and assignment)"""
+        """Parse a single statement and, when evaluating, run it"""
+        statement = self.parse_statement_node()
+        if self.evaluate:
+            self.execute_statement(statement)
+        return statement
+
+    def parse_statement_node(self):
+        """
+        Parse a single statement (declarations, assignments, input, output,
+        trial and cycle). The node records the line and column of its first
+        token, which the generator's source map refers back to.
+        """
         token = self.peek()
 
-        print(token, token.type)
-        
-        if token.type == 'DATA_TYPE':
-            return self.parse_variable_declaration()
-        elif token.type == 'INPUT':
-            return self.parse_input_statement()
-        elif token.type == 'OUTPUT':
-            return self.parse_output_statement()
-        elif token.type == 'VARIABLE_NAME':
-            return self.parse_variable_statement()
+        if token.kind == DATA_TYPE:
+            node = self.parse_variable_declaration()
+        elif token.kind == INPUT:
+            node = self.parse_input_statement()
+        elif token.kind == OUTPUT:
+            node = self.parse_output_statement()
+        elif token.kind == VARIABLE_NAME:
+            node = self.parse_variable_statement()
+        elif token.kind == IF_STATEMENT:
+            node = self.parse_if_statement()
+        elif token.kind == FOR_STATEMENT:
+            node = self.parse_for_statement()
         else:
-            raise SyntaxError(f"Unexpected token: {token}")
-        
-    def parse_input_statement(self):
+            raise SyntaxError(f"Unexpected token: {token.type} {token.value!r}")
+        node['line'] = token.line
+        node['column'] = token.column
+        return node
+
+    def variable_name(self):
+        """
+        Consume a VARIABLE_NAME and return it interned.
+        """
+        return sys.intern(self.consume(VARIABLE_NAME).value)
+
+    def resolve_slot(self, var_name):
+        symbol = self.scopes.resolve(var_name)
+        return None if symbol is None else symbol.slot
+
+    def declare_slot(self, var_name, data_type):
+        return self.scopes.declare(var_name, data_type).slot
+
+    def parse_if_statement(self):
         """
-        Parse `cin >> variable;` and update the variable's value in the symbol table.
+        Parse `trial (condition) { statements }`
         """
-        self.consume('INPUT') 
-        var_name = self.consume('VARIABLE_NAME') 
+        self.consume(IF_STATEMENT)
+        condition = self.parse_condition()
+        return {
+            'type': 'if_statement',
+            'condition': condition,
+            'body': self.parse_block()
+        }
 
-        if var_name.value not in self.symbol_table:
-            raise SyntaxError(f"Variable '{var_name.value}' not declared")
+    def parse_for_statement(self):
+        """
+        Parse `cycle (condition) { statements }`, which repeats the body while
+        the condition holds
+        """
+        self.consume(FOR_STATEMENT)
+        condition = self.parse_condition()
+        return {
+            'type': 'for_statement',
+            'condition': condition,
+            'body': self.parse_block()
+        }
 
-        data_type = self.symbol_table[var_name.value]['data_type']
-        user_input = input(f"Enter value for {var_name.value}: ")
+    def parse_condition(self):
+        token = self.consume(PUNCTUATION)
+        if token.value != '(':
+            raise SyntaxError(f"Expected '(', got {token.value}")
+        condition = self.parse_expression()
+        token = self.consume(PUNCTUATION)
+        if token.value != ')':
+            raise SyntaxError(f"Expected ')', got {token.value}")
+        return condition
 
+    def parse_block(self):
+        """
+        Parse `{ statements }` in a new scope. The statements are only parsed;
+        they run when the enclosing trial or cycle does. When recovering, a
+        broken statement is recorded and skipped, and the rest of the block
+        is kept.
+        """
+        self.consume(START_IF_FOR)
+        self.scopes.push_scope()
         try:
-            if data_type == 'tally':
-                self.symbol_table[var_name.value]['value'] = int(user_input)
-            elif data_type == 'portion':
-                self.symbol_table[var_name.value]['value'] = float(user_input)
-            elif data_type == 'verse':  # Assuming you support a 'string' type
-                self.symbol_table[var_name.value]['value'] = user_input
-            else:
-                raise TypeError(f"Unsupported data type: {data_type}")
-        except ValueError:
-            raise SyntaxError(f"Invalid input for variable '{var_name.value}' of type '{data_type}'")
+            body = []
+            while self.peek() is not None and self.peek().kind != END_IF_FOR:
+                if not self.recover:
+                    body.append(self.parse_statement_node())
+                    continue
+                try:
+                    body.append(self.parse_statement_node())
+                except STATEMENT_ERRORS as exc:
+                    self.add_error(self.peek() or self.previous, exc)
+                    self.synchronize(in_block=True)
+            self.consume(END_IF_FOR)
+        finally:
+            self.scopes.pop_scope()
+        return body
+        
+    def parse_input_statement(self):
+        """
+        Parse `cin >> variable;`
+        """
+        self.consume(INPUT) 
+        var_name = self.variable_name()
 
         # Consume the semicolon
-        self.consume('SEMI_COLON')
+        self.consume(SEMI_COLON)
 
         # Return the parsed input statement
         return {
             'type': 'input_statement',
-            'variable': var_name.value,
-            'value': self.symbol_table[var_name.value]['value']
+            'variable': var_name,
+            'slot': self.resolve_slot(var_name)
         }
 
     def parse_output_statement(self):
         """
         Parse `cout << expression;`
         """
-        self.consume('OUTPUT')  # Consume `cout`
-        self.consume('OUTPUT_CASE')  # Consume the initial `<<`
+        self.consume(OUTPUT)  # Consume `cout`
+        self.consume(OUTPUT_CASE)  # Consume the initial `<<`
         expressions = []
 
         # Parse one or more expressions separated by `<<`
         while True:
             current_token = self.peek()
+            if current_token is None:
+                raise SyntaxError("Unexpected end of input")
 
-            if current_token.type == 'STRING':  # Handle string literals
-                string_token = self.consume('STRING')
+            if current_token.kind == STRING:  # Handle string literals
+                string_token = self.consume(STRING)
                 expressions.append({
                     'type': 'string',
                     'value': string_token.value
                 })
-            elif current_token.type == 'VARIABLE_NAME':  # Handle variable names
-                var_name = self.consume('VARIABLE_NAME').value
-                if var_name not in self.symbol_table:
-                    raise SyntaxError(f"Variable '{var_name}' not declared")
+            elif current_token.kind == VARIABLE_NAME:  # Handle variable names
+                var_name = self.variable_name()
                 expressions.append({
                     'type': 'variable',
                     'name': var_name,
-                    'value': self.symbol_table[var_name]['value']
+                    'slot': self.resolve_slot(var_name)
                 })
             else:
-                raise SyntaxError(f"Unexpected token in output statement: {current_token}")
+                raise SyntaxError(f"Unexpected token in output statement: {current_token.type} {current_token.value!r}")
 
             # Check for another `<<`
-            if self.peek() and self.peek().type == 'OUTPUT_CASE':
-                self.consume('OUTPUT_CASE')  # Consume `<<` to continue parsing
+            if self.peek() and self.peek().kind == OUTPUT_CASE:
+                self.consume(OUTPUT_CASE)  # Consume `<<` to continue parsing
             else:
                 break  # No more expressions to process
 
-        self.consume('SEMI_COLON')  # Consume the semicolon at the end of the statement
+        self.consume(SEMI_COLON)  # Consume the semicolon at the end of the statement
 
         # Return the parsed output statement as an AST node
         return {
@@ -135,47 +330,37 @@ class Parser:
         data_type variable_name = expression;
         """
         # Consume data type
-        data_type = self.consume('DATA_TYPE')
+        data_type = self.consume(DATA_TYPE)
         
         # Variable name
-        var_name = self.consume('VARIABLE_NAME')
-        
-        if var_name.value in self.symbol_table:
-            raise SyntaxError(f"Variable {var_name.value} already declared")
-        self.symbol_table[var_name.value] = {'data_type': data_type.value, 'value': None} 
+        var_name = self.variable_name()
 
         current_token = self.peek()
 
-        if current_token.type == 'SEMI_COLON':
-            self.consume('SEMI_COLON')
+        if current_token is not None and current_token.kind == SEMI_COLON:
+            self.consume(SEMI_COLON)
             return {
                 'type': 'variable_declaration',
                 'data_type': data_type.value,
-                'variable': var_name.value,
+                'variable': var_name,
+                'slot': self.declare_slot(var_name, data_type.value)
             }
 
         # Assignment operator
-        self.consume('OPERATOR')
+        self.consume(OPERATOR)
         
         # Parse expression
         expression = self.parse_expression()
-        value = self.evaluate_expression(expression) 
-
-        if data_type.value == 'rune':
-            if not isinstance(value, str) or len(value) != 1:
-                # raise SyntaxError(f"Expected a single character for '{var_name.value}', got {value}")
-                print("DATA TYPEEEE:", data_type, "LENGTHH:", len(value))
         
         # Semicolon
-        self.consume('SEMI_COLON')
-
-        self.symbol_table[var_name.value]['value'] = value
+        self.consume(SEMI_COLON)
         
+        # Declared after its initializer, which cannot refer to it
         return {
             'type': 'variable_declaration',
             'data_type': data_type.value,
-            'variable': var_name.value,
-            'value': value,
+            'variable': var_name,
+            'slot': self.declare_slot(var_name, data_type.value),
             'expression': expression
         }
     
@@ -185,102 +370,139 @@ class Parser:
         variable_name = expression;
         """
         # Consume the variable name
-        var_name = self.consume('VARIABLE_NAME').value
-        
-        # Check if the variable is declared
-        if var_name not in self.symbol_table:
-            raise SyntaxError(f"Variable '{var_name}' not declared")
+        var_name = self.variable_name()
         
         # Consume the assignment operator
-        self.consume('OPERATOR') 
+        self.consume(OPERATOR) 
         
         # Parse the expression after '='
         expression = self.parse_expression()
         
-        # Evaluate the expression to get the assigned value
-        value = self.evaluate_expression(expression)
-        
-        # Update the symbol table with the new value
-        self.symbol_table[var_name]['value'] = value
-        
         # Consume the semicolon
-        self.consume('SEMI_COLON')
+        self.consume(SEMI_COLON)
         
         # Return the parsed assignment statement as an AST node
         return {
             'type': 'variable_assignment',
             'variable': var_name,
-            'value': value,
+            'slot': self.resolve_slot(var_name),
             'expression': expression
         }
-    
-    def parse_expression(self):
+
+    def execute_statement(self, node):
         """
-        Parse arithmetic expressions with basic precedence
-        Supports: 
-        - Numbers 
-        - Variables
-        - Parenthesized expressions
-        - Basic arithmetic operations (+, -, *, /)
-        - Compound assignment operations (+=, -=, *=, /=)
+        Run a parsed statement against the symbol table (evaluating mode only).
+        Checks declarations, evaluates expressions and records the values on the
+        nodes, as the parser used to do while parsing.
         """
-        return self.parse_additive_expression()
-    
-    def parse_additive_expression(self):
+        if node['type'] == 'variable_declaration':
+            var_name = node['variable']
+            if var_name in self.symbol_table:
+                raise SyntaxError(f"Variable {var_name} already declared")
+            self.symbol_table[var_name] = {'data_type': node['data_type'], 'value': None}
+            if 'expression' not in node:
+                return
+
+            value = self.evaluate_expression(node['expression'])
+            if node['data_type'] == 'rune':
+                if not isinstance(value, str) or len(value) != 1:
+                    # raise SyntaxError(f"Expected a single character for '{var_name}', got {value}")
+                    if self.tracer is not None:
+                        self.tracer.event('rune_length', var_name, value)
+            self.symbol_table[var_name]['value'] = value
+            node['value'] = value
+
+        elif node['type'] == 'variable_assignment':
+            var_name = node['variable']
+            if var_name not in self.symbol_table:
+                raise SyntaxError(f"Variable '{var_name}' not declared")
+            value = self.evaluate_expression(node['expression'])
+            self.symbol_table[var_name]['value'] = value
+            node['value'] = value
+
+        elif node['type'] == 'input_statement':
+            self.execute_input_statement(node)
+
+        elif node['type'] == 'output_statement':
+            for expression in node['expressions']:
+                if expression['type'] == 'variable':
+                    self.evaluate_expression(expression)
+
+        elif node['type'] == 'if_statement':
+            if self.evaluate_expression(node['condition']):
+                self.execute_block(node['body'])
+
+        elif node['type'] == 'for_statement':
+            while self.evaluate_expression(node['condition']):
+                self.execute_block(node['body'])
+
+    def execute_block(self, body):
         """
-        Handle addition and subtraction
-        Supports expressions like: x augmented by y, z diminished by w, etc. as well as the compound assignment versions
+        Run the statements of a trial or cycle body. Variables declared in it go
+        out of scope at the end, so a loop body can declare them again.
         """
-        left = self.parse_multiplicative_expression()
-        
-        while self.peek() and self.peek().type == 'OPERATOR' and self.peek().value in ['augmented by', 'diminished by', 'augment by', 'diminish by']:
-            value = self.peek().value
-            operator = self.consume('OPERATOR')
-            right = self.parse_multiplicative_expression()
-            if value in ['augmented by', 'diminished by']:
-                left = {
-                    'type': 'binary_operation',
-                    'operator': operator.value,
-                    'left': left,
-                    'right': right
-                }
+        outer = set(self.symbol_table)
+        try:
+            for statement in body:
+                self.execute_statement(statement)
+        finally:
+            for var_name in [name for name in self.symbol_table if name not in outer]:
+                del self.symbol_table[var_name]
+
+    def execute_input_statement(self, node):
+        """
+        Read a value from stdin into the variable's symbol table entry.
+        """
+        var_name = node['variable']
+        if var_name not in self.symbol_table:
+            raise SyntaxError(f"Variable '{var_name}' not declared")
+
+        data_type = self.symbol_table[var_name]['data_type']
+        user_input = input(f"Enter value for {var_name}: ")
+
+        try:
+            if data_type == 'tally':
+                self.symbol_table[var_name]['value'] = int(user_input)
+            elif data_type == 'portion':
+                self.symbol_table[var_name]['value'] = float(user_input)
+            elif data_type == 'verse':  # Assuming you support a 'string' type
+                self.symbol_table[var_name]['value'] = user_input
             else:
-                left = {
-                    'type': 'compound_assignment',
-                    'operator': operator.value,
-                    'left': left,
-                    'right': right
-                }
-        return left
+                raise TypeError(f"Unsupported data type: {data_type}")
+        except ValueError:
+            raise SyntaxError(f"Invalid input for variable '{var_name}' of type '{data_type}'")
+
+        node['value'] = self.symbol_table[var_name]['value']
     
-    def parse_multiplicative_expression(self):
+    def parse_expression(self, min_precedence=1):
         """
-        Handle multiplication and division
-        Supports expressions like: x * y, z / w, etc. as well as the compound assignment versions
+        Precedence climbing over BINARY_OPERATORS. Parses operands with
+        parse_primary_expression and keeps folding operators of at least
+        min_precedence into the left operand; the right operand only takes
+        operators that bind tighter, so every operator is left-associative.
+        Adding a precedence level is a table entry, not another method.
         """
         left = self.parse_primary_expression()
-        
-        while self.peek() and self.peek().type == 'OPERATOR'and self.peek().value in ['amplified by', 'fragmented by', 'amplify by', 'fragment by']:
-            value = self.peek().value
-            operator = self.consume('OPERATOR')
-            right = self.parse_primary_expression()
-            if value in ['amplified by', 'fragmented by']:
-                left = {
-                    'type': 'binary_operation',
-                    'operator': operator.value,
-                    'left': left,
-                    'right': right
-                }
-            else:
-                left = {
-                    'type': 'compound_assignment',
-                    'operator': operator.value,
-                    'left': left,
-                    'right': right
-                }
-        
+
+        while True:
+            token = self.lookahead
+            if token is None or token.kind != OPERATOR:
+                break
+            entry = BINARY_OPERATORS.get(token.value)
+            if entry is None or entry[0] < min_precedence:
+                break
+            precedence, node_type = entry
+            self.consume()
+            right = self.parse_expression(precedence + 1)
+            left = {
+                'type': node_type,
+                'operator': token.value,
+                'left': left,
+                'right': right
+            }
+
         return left
-    
+
     def parse_primary_expression(self):
         """
         Parse primary expressions:
@@ -291,61 +513,69 @@ class Parser:
         - Parenthesized expressions
         """
         token = self.peek()
-        print("TOKENNN:", token, "TOKEN Type:", token.type)
+        if token is None:
+            raise SyntaxError("Unexpected end of input")
         
-        if token.type == 'NUMBER':
+        if token.kind == NUMBER:
             if '.' in token.value:
                 return {
                     'type': 'number',
-                    'value': float(self.consume('NUMBER').value)
+                    'value': float(self.consume(NUMBER).value)
                 }
             return {
                 'type': 'number',
-                'value': int(self.consume('NUMBER').value)
+                'value': int(self.consume(NUMBER).value)
             }
-        elif token.type == 'VARIABLE_NAME':
-            var_name = self.consume('VARIABLE_NAME').value
-            if var_name not in self.symbol_table:
-                raise SyntaxError(f"Variable '{var_name}' not declared") 
+        elif token.kind == VARIABLE_NAME:
+            var_name = self.variable_name()
             return {
                 'type': 'variable',
                 'name': var_name,
-                'value': self.symbol_table[var_name]['value']
+                'slot': self.resolve_slot(var_name)
             }
-        elif token.type == 'CHAR':  # Handle characters
+        elif token.kind == CHAR:  # Handle characters
             return {
                 'type': 'char',
-                'value': self.consume('CHAR').value.strip("'")
+                'value': self.consume(CHAR).value.strip("'")
             }
-        elif token.type == 'STRING':  # Handle string literals
+        elif token.kind == STRING:  # Handle string literals
             return {
                 'type': 'string',
-                'value': self.consume('STRING').value
+                'value': self.consume(STRING).value
             }
-        elif token.type == 'PUNCTUATION' and token.value == '(':
-            self.consume('PUNCTUATION')  # consume '('
+        elif token.kind == PUNCTUATION and token.value == '(':
+            self.consume(PUNCTUATION)  # consume '('
             expr = self.parse_expression()      
-            self.consume('PUNCTUATION')  # consume ')'
+            self.consume(PUNCTUATION)  # consume ')'
             return expr
         
-        raise SyntaxError(f"Unexpected token in expression: {token}")
+        raise SyntaxError(f"Unexpected token in expression: {token.type} {token.value!r}")
     
     def evaluate_expression(self, node):
         """
-        Evaluate the parsed expression tree.
+        Evaluate the parsed expression tree, recording the current value of
+        each variable on its node.
         """
         if node['type'] == 'number':
             return node['value']
         elif node['type'] == 'variable':
+            if node['name'] not in self.symbol_table:
+                raise SyntaxError(f"Variable '{node['name']}' not declared")
+            node['value'] = self.symbol_table[node['name']]['value']
             return node['value']
         elif node['type'] == 'char':
             return node['value']
         elif node['type'] == 'string':
             return node['value']
         elif node['type'] == 'binary_operation':
+            operator = node['operator']
             left_val = self.evaluate_expression(node['left'])
+            # Logical operators short-circuit and yield 1 or 0
+            if operator == 'and':
+                return int(bool(left_val) and bool(self.evaluate_expression(node['right'])))
+            elif operator == 'or':
+                return int(bool(left_val) or bool(self.evaluate_expression(node['right'])))
             right_val = self.evaluate_expression(node['right'])
-            operator = node['operator']
             if operator == 'augmented by':
                 return left_val + right_val
             elif operator == 'diminished by':
@@ -356,6 +586,18 @@ class Parser:
                 if right_val == 0:
                     raise ZeroDivisionError("Division by zero")
                 return left_val / right_val
+            elif operator == 'exceeds':
+                return int(left_val > right_val)
+            elif operator == 'falls below':
+                return int(left_val < right_val)
+            elif operator == 'at least':
+                return int(left_val >= right_val)
+            elif operator == 'at most':
+                return int(left_val <= right_val)
+            elif operator == 'mirrors':
+                return int(left_val == right_val)
+            elif operator == 'defies':
+                return int(left_val != right_val)
         raise ValueError(f"Unknown node type: {node['type']}") 
 
     def get_symbol_table(self):
@@ -0,0 +1,666 @@
+import math
+
+import ir
+import simulator
+
+# Optimization passes over ir.Program. Each pass is a callable taking the
+# program and changing it in place, so Generator(passes=...) can run any
+# selection of them in any order.
+
+def wrap(value):
+    """
+    Reduce an integer to a signed 32-bit MIPS word.
+    """
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+def divide(left, right):
+    # MIPS div truncates toward zero
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+FOLDERS = {
+    'add': lambda left, right: left + right,
+    'sub': lambda left, right: left - right,
+    'mul': lambda left, right: left * right,
+    'div': divide,
+    'slt': lambda left, right: int(left < right),
+    'sgt': lambda left, right: int(left > right),
+    'sle': lambda left, right: int(left <= right),
+    'sge': lambda left, right: int(left >= right),
+    'seq': lambda left, right: int(left == right),
+    'sne': lambda left, right: int(left != right),
+    'and': lambda left, right: left & right,
+    'or': lambda left, right: left | right,
+    'sll': lambda left, right: left << (right & 31),
+    'sra': lambda left, right: left >> (right & 31),
+    'srl': lambda left, right: (left & 0xFFFFFFFF) >> (right & 31),
+    'mulhi': lambda left, right: (left * right) >> 32,
+}
+
+COMMUTATIVE_OPS = ('add', 'mul', 'seq', 'sne', 'and', 'or')
+
+# Comparisons with the operands swapped, for moving a constant to the right
+SWAPPED_COMPARISONS = {'slt': 'sgt', 'sgt': 'slt', 'sle': 'sge', 'sge': 'sle'}
+
+def fold_block(block, memory, rewrite):
+    """
+    Constant folding and propagation through one block. memory maps
+    variable labels to known values on entry and is updated to the values
+    on exit. With rewrite=True, instructions are rewritten: known values
+    become li, constant operands become immediates.
+    """
+    values = {}
+    for index, instruction in enumerate(block.instructions):
+        op = instruction.op
+        dest = instruction.dest
+        args = instruction.args
+
+        if op == 'li':
+            values[dest] = args[0]
+        elif op == 'move':
+            if args[0] in values:
+                values[dest] = values[args[0]]
+        elif op == 'load':
+            if args[0] in memory:
+                values[dest] = memory[args[0]]
+        elif op == 'store':
+            if args[1] in values:
+                memory[args[0]] = values[args[1]]
+            else:
+                memory.pop(args[0], None)
+        elif op in FOLDERS:
+            left, right = args
+            left_value = values.get(left, left if isinstance(left, int) else None)
+            right_value = values.get(right, right if isinstance(right, int) else None)
+            if left_value is not None and right_value is not None and not (op == 'div' and right_value == 0):
+                values[dest] = wrap(FOLDERS[op](left_value, right_value))
+            elif rewrite and op in ir.REGISTER_OPS:
+                pass
+            elif rewrite and right_value is not None:
+                instruction.args = (left, right_value)
+            elif rewrite and left_value is not None and (op in COMMUTATIVE_OPS or op in SWAPPED_COMPARISONS):
+                instruction.op = SWAPPED_COMPARISONS.get(op, op)
+                instruction.args = (right, left_value)
+        elif op == 'branch' and rewrite and args[0] in values:
+            # The condition is known, so only one side can run
+            target = args[1] if values[args[0]] else args[2]
+            block.instructions[index] = ir.Instruction('jump', None, (target,), instruction.position)
+        elif op == 'cbranch' and rewrite:
+            comparison, left, right, if_true, if_false = args
+            left_value = values.get(left, left if isinstance(left, int) else None)
+            right_value = values.get(right, right if isinstance(right, int) else None)
+            if left_value is not None and right_value is not None:
+                target = if_true if FOLDERS[comparison](left_value, right_value) else if_false
+                block.instructions[index] = ir.Instruction('jump', None, (target,), instruction.position)
+            elif right_value is not None:
+                instruction.args = (comparison, left, right_value, if_true, if_false)
+
+        if rewrite and dest is not None and dest in values and op != 'li':
+            block.instructions[index] = ir.Instruction('li', dest, (values[dest],), instruction.position)
+
+def fold_constants(program):
+    """
+    Constant folding and propagation over tally and rune values. A forward
+    dataflow over the blocks finds the variables whose value is known on
+    entry to each block (all words start out with their .word value); loads
+    of them become li, operations on known values are folded, and a known
+    right-hand operand is turned into an immediate.
+    """
+    preds = ir.predecessors(program)
+    initial = {label: value for label, directive, value in program.data if directive == '.word'}
+    entry = program.blocks[0].label
+    # Known variable values on entry to and exit from each block; None until reached
+    entry_state = {block.label: None for block in program.blocks}
+    exit_state = dict(entry_state)
+
+    changed = True
+    while changed:
+        changed = False
+        for block in program.blocks:
+            incoming = [exit_state[pred] for pred in preds[block.label] if exit_state[pred] is not None]
+            if block.label == entry:
+                incoming.append(initial)
+            if not incoming:
+                continue
+            state = dict(incoming[0])
+            for other in incoming[1:]:
+                state = {label: value for label, value in state.items() if label in other and other[label] == value}
+            if state == entry_state[block.label] and exit_state[block.label] is not None:
+                continue
+            entry_state[block.label] = dict(state)
+            fold_block(block, state, rewrite=False)
+            exit_state[block.label] = state
+            changed = True
+
+    for block in program.blocks:
+        if entry_state[block.label] is not None:
+            fold_block(block, dict(entry_state[block.label]), rewrite=True)
+
+    fold_conversions(program)
+    fold_floats(program)
+    remove_unreachable_blocks(program)
+    move_initializers(program)
+    remove_dead_values(program)
+    remove_unused_floats(program)
+
+def fold_conversions(program):
+    """
+    A known word converted to a float becomes a load from the float pool.
+    """
+    constants = {instruction.dest: instruction.args[0] for instruction in program.instructions() if instruction.op == 'li'}
+    for block in program.blocks:
+        for index, instruction in enumerate(block.instructions):
+            if instruction.op == 'itof' and instruction.args[0] in constants:
+                label = program.add_float(float(constants[instruction.args[0]]))
+                block.instructions[index] = ir.Instruction('fload', instruction.dest, (label,), instruction.position)
+
+FLOAT_FOLDERS = {
+    'fadd': lambda left, right: left + right,
+    'fsub': lambda left, right: left - right,
+    'fmul': lambda left, right: left * right,
+    'fdiv': lambda left, right: left / right,
+}
+
+def fold_floats(program):
+    """
+    Portion arithmetic on two loads from the float pool becomes a load of the
+    result, rounded to single precision as add.s and the rest round it. A
+    division by zero is left to run, as is a result the pool cannot hold:
+    an infinity or NaN, which .float has no spelling for, or a zero, whose
+    sign the pool does not keep apart.
+    """
+    pool = {label: value for value, label in program.floats.items()}
+    definitions = {}
+    for instruction in program.instructions():
+        if instruction.dest is not None:
+            definitions[instruction.dest] = definitions.get(instruction.dest, 0) + 1
+
+    # Values of the float registers loaded from the pool and defined only there
+    known = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in program.blocks:
+            for index, instruction in enumerate(block.instructions):
+                op = instruction.op
+                if definitions.get(instruction.dest) != 1 or instruction.dest in known:
+                    continue
+                if op == 'fload' and instruction.args[0] in pool:
+                    known[instruction.dest] = simulator.single(pool[instruction.args[0]])
+                    changed = True
+                elif op in FLOAT_FOLDERS and all(arg in known for arg in instruction.args):
+                    left, right = (known[arg] for arg in instruction.args)
+                    if op == 'fdiv' and right == 0:
+                        continue
+                    value = simulator.single(FLOAT_FOLDERS[op](left, right))
+                    if not math.isfinite(value) or value == 0:
+                        continue
+                    label = program.add_float(value)
+                    pool[label] = value
+                    block.instructions[index] = ir.Instruction('fload', instruction.dest, (label,), instruction.position)
+                    known[instruction.dest] = value
+                    changed = True
+
+def remove_unused_floats(program):
+    """
+    Drop the pool constants nothing loads any more.
+    """
+    used = {instruction.args[0] for instruction in program.instructions() if instruction.op == 'fload'}
+    unused = {label for label in program.floats.values() if label not in used}
+    if unused:
+        program.data = [entry for entry in program.data if entry[0] not in unused]
+        program.floats = {value: label for value, label in program.floats.items() if label not in unused}
+
+def remove_unreachable_blocks(program):
+    blocks = program.block_map()
+    reachable = set()
+    pending = [program.blocks[0].label]
+    while pending:
+        label = pending.pop()
+        if label not in reachable:
+            reachable.add(label)
+            pending.extend(blocks[label].successors())
+    program.blocks = [block for block in program.blocks if block.label in reachable]
+
+def move_initializers(program):
+    """
+    A constant stored into a variable at the start of the program, before
+    anything else touches it, becomes the variable's .word value instead.
+    Only the entry block runs exactly once, and only if nothing jumps back to it.
+    """
+    entry = program.blocks[0]
+    if any(entry.label in block.successors() for block in program.blocks):
+        return
+
+    words = {label: index for index, (label, directive, value) in enumerate(program.data) if directive == '.word'}
+    constants = {}
+    touched = set()
+    kept = []
+    for instruction in entry.instructions:
+        op = instruction.op
+        if op == 'li':
+            constants[instruction.dest] = instruction.args[0]
+        elif op == 'store':
+            label, source = instruction.args
+            if label in words and label not in touched and source in constants:
+                index = words[label]
+                program.data[index] = (label, '.word', constants[source])
+                touched.add(label)
+                continue
+            touched.add(label)
+        elif op == 'load':
+            touched.add(instruction.args[0])
+        kept.append(instruction)
+    entry.instructions = kept
+
+def remove_dead_values(program):
+    """
+    Drop computations whose result is never used.
+    """
+    while True:
+        used = set()
+        for instruction in program.instructions():
+            used.update(instruction.uses())
+        removed = False
+        for block in program.blocks:
+            kept = [instruction for instruction in block.instructions
+                    if instruction.op not in ir.PURE_OPS or instruction.dest in used or ir.may_trap(instruction)]
+            if len(kept) != len(block.instructions):
+                block.instructions = kept
+                removed = True
+        if not removed:
+            return
+
+def forward_stores(program):
+    """
+    Redundant load elimination. A forward dataflow over the blocks finds, for
+    each word variable, the virtual register already holding its value on
+    entry to each block: the one last stored into it or loaded from it on
+    every path. A load of such a variable is dropped and its uses read that
+    register instead.
+    """
+    preds = ir.predecessors(program)
+    entry = program.blocks[0].label
+    # Available {label: VReg} on entry to and exit from each block; None until reached
+    entry_state = {block.label: None for block in program.blocks}
+    exit_state = dict(entry_state)
+
+    changed = True
+    while changed:
+        changed = False
+        for block in program.blocks:
+            incoming = [exit_state[pred] for pred in preds[block.label] if exit_state[pred] is not None]
+            if block.label == entry:
+                incoming.append({})
+            if not incoming:
+                continue
+            state = dict(incoming[0])
+            for other in incoming[1:]:
+                state = {label: vreg for label, vreg in state.items() if other.get(label) is vreg}
+            if state == entry_state[block.label] and exit_state[block.label] is not None:
+                continue
+            entry_state[block.label] = dict(state)
+            forward_block(block, state, {}, rewrite=False)
+            exit_state[block.label] = state
+            changed = True
+
+    copies = {}
+    for block in program.blocks:
+        if entry_state[block.label] is not None:
+            forward_block(block, dict(entry_state[block.label]), copies, rewrite=True)
+    if copies:
+        for instruction in program.instructions():
+            instruction.args = tuple(copies.get(arg, arg) if isinstance(arg, ir.VReg) else arg
+                                     for arg in instruction.args)
+
+def forward_block(block, available, copies, rewrite):
+    """
+    Redundant load elimination through one block. available maps variable
+    labels to the VReg holding their value on entry and is updated to the
+    values on exit. copies collects {dropped load's VReg: VReg replacing it};
+    with rewrite=True the loads in it are removed from the block.
+    """
+    kept = []
+    for instruction in block.instructions:
+        op = instruction.op
+        if op in ir.LOAD_OPS:
+            label = instruction.args[0]
+            if label in available:
+                copies[instruction.dest] = available[label]
+                if rewrite:
+                    continue
+            else:
+                available[label] = instruction.dest
+        elif op in ir.STORE_OPS:
+            label, source = instruction.args
+            available[label] = copies.get(source, source)
+        elif op in ir.MEMORY_WRITES:
+            available.pop(instruction.args[ir.MEMORY_WRITES[op]], None)
+        kept.append(instruction)
+    if rewrite:
+        block.instructions = kept
+
+def remove_dead_stores(program):
+    """
+    Dead store elimination. A backward dataflow over the blocks finds the
+    variables whose value may still be read; a store into a variable that is
+    overwritten or never read again before the program exits is dropped,
+    along with the computation only it used.
+    """
+    reads = {}
+    writes = {}
+    for block in program.blocks:
+        read, written = set(), set()
+        for instruction in block.instructions:
+            op = instruction.op
+            for index in ir.MEMORY_READS.get(op, ()):
+                if instruction.args[index] not in written:
+                    read.add(instruction.args[index])
+            if op in ir.STORE_OPS:
+                written.add(instruction.args[0])
+        reads[block.label] = read
+        writes[block.label] = written
+
+    live_in = {block.label: set() for block in program.blocks}
+    live_out = {block.label: set() for block in program.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(program.blocks):
+            out = set()
+            for successor in block.successors():
+                out |= live_in[successor]
+            new_in = reads[block.label] | (out - writes[block.label])
+            if out != live_out[block.label] or new_in != live_in[block.label]:
+                live_out[block.label] = out
+                live_in[block.label] = new_in
+                changed = True
+
+    for block in program.blocks:
+        live = set(live_out[block.label])
+        kept = []
+        for instruction in reversed(block.instructions):
+            op = instruction.op
+            if op in ir.STORE_OPS:
+                label = instruction.args[0]
+                if label not in live:
+                    continue
+                live.discard(label)
+            else:
+                live.update(instruction.args[index] for index in ir.MEMORY_READS.get(op, ()))
+            kept.append(instruction)
+        kept.reverse()
+        block.instructions = kept
+
+    remove_dead_values(program)
+
+# Longest signed-digit form of a constant multiplier rewritten as shifts and
+# adds; 3 digits take at most 5 single-cycle instructions
+MAX_SHIFT_ADD_DIGITS = 3
+
+def reduce_strength(program):
+    """
+    Multiplication and division by a constant become cheaper instructions:
+    shifts for powers of two, shifts and adds for multipliers with few
+    signed binary digits, and a multiplication by a magic number for other
+    divisors. Results are exactly those of mul and div, wrap-around and
+    truncation toward zero included.
+    """
+    for block in program.blocks:
+        instructions = []
+        for instruction in block.instructions:
+            op = instruction.op
+            if op in ('mul', 'div') and isinstance(instruction.args[1], int):
+                left, constant = instruction.args
+                reduce = reduce_multiply if op == 'mul' else reduce_divide
+                replacement = reduce(program, instruction.dest, left, constant)
+                if replacement is not None:
+                    for replaced in replacement:
+                        replaced.position = instruction.position
+                    instructions.extend(replacement)
+                    continue
+            instructions.append(instruction)
+        block.instructions = instructions
+
+def signed_digits(value):
+    """
+    The non-adjacent form of a positive integer: (sign, shift) pairs with
+    value == sum(sign << shift) and the fewest nonzero digits.
+    """
+    digits = []
+    shift = 0
+    while value:
+        if value & 1:
+            sign = 2 - (value & 3)
+            digits.append((sign, shift))
+            value -= sign
+        value >>= 1
+        shift += 1
+    return digits
+
+def reduce_multiply(program, dest, left, constant):
+    """
+    Instructions computing dest = left * constant with shifts and adds, or
+    None if that would take more than MAX_SHIFT_ADD_DIGITS digits.
+    """
+    constant = wrap(constant)
+    if constant == 0:
+        return [ir.Instruction('li', dest, (0,))]
+    digits = signed_digits(abs(constant))
+    if len(digits) > MAX_SHIFT_ADD_DIGITS:
+        return None
+
+    instructions = []
+
+    def emit(op, *args, result=None):
+        result = result or program.new_vreg()
+        instructions.append(ir.Instruction(op, result, args))
+        return result
+
+    if constant < 0:
+        digits = [(-sign, shift) for sign, shift in digits]
+    # Start from a positive digit so the sum needs no negating, if there is one
+    digits.sort(key=lambda digit: -digit[0])
+    total = None
+    for sign, shift in digits:
+        term = emit('sll', left, shift) if shift else left
+        if total is None:
+            total = term if sign > 0 else emit('sub', 0, term)
+        else:
+            total = emit('add' if sign > 0 else 'sub', total, term)
+    if total is left:
+        emit('move', left, result=dest)
+    else:
+        instructions[-1].dest = dest
+    return instructions
+
+def magic_divisor(divisor):
+    """
+    (multiplier, shift) for signed division by divisor, |divisor| >= 2:
+    the quotient is the high word of the product with the multiplier,
+    corrected and shifted right (Hacker's Delight, section 10-4).
+    """
+    two31 = 0x80000000
+    absolute = abs(divisor)
+    t = two31 + (1 if divisor < 0 else 0)
+    anc = t - 1 - t % absolute
+    p = 31
+    q1, r1 = divmod(two31, anc)
+    q2, r2 = divmod(two31, absolute)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= absolute:
+            q2, r2 = q2 + 1, r2 - absolute
+        delta = absolute - r2
+        if not (q1 < delta or (q1 == delta and r1 == 0)):
+            break
+    multiplier = wrap(q2 + 1)
+    return (wrap(-multiplier) if divisor < 0 else multiplier), p - 32
+
+def reduce_divide(program, dest, left, divisor):
+    """
+    Instructions computing dest = left / divisor, truncated toward zero, or
+    None for a zero divisor, which keeps its div.
+    """
+    divisor = wrap(divisor)
+    if divisor == 0:
+        return None
+
+    instructions = []
+
+    def emit(op, *args):
+        result = program.new_vreg()
+        instructions.append(ir.Instruction(op, result, args))
+        return result
+
+    absolute = abs(divisor)
+    if absolute == 1:
+        quotient = emit('move', left)
+    elif absolute & (absolute - 1) == 0:
+        # An arithmetic shift rounds down, so negative dividends are first
+        # biased by |divisor| - 1 to round toward zero instead
+        shift = absolute.bit_length() - 1
+        sign = emit('sra', left, 31) if shift > 1 else left
+        bias = emit('srl', sign, 32 - shift)
+        quotient = emit('sra', emit('add', left, bias), shift)
+    else:
+        multiplier, shift = magic_divisor(absolute)
+        quotient = emit('mulhi', left, emit('li', multiplier))
+        if multiplier < 0:
+            quotient = emit('add', quotient, left)
+        if shift:
+            quotient = emit('sra', quotient, shift)
+        # Add one when negative, to round toward zero
+        quotient = emit('add', quotient, emit('srl', quotient, 31))
+    if divisor < 0:
+        quotient = emit('sub', 0, quotient)
+    instructions[-1].dest = dest
+    return instructions
+
+def fuse_branches(program):
+    """
+    A branch on a comparison computed only for it becomes a cbranch testing
+    the comparison's operands directly, so no 1/0 value is materialized.
+    """
+    uses = {}
+    for instruction in program.instructions():
+        for vreg in instruction.uses():
+            uses[vreg] = uses.get(vreg, 0) + 1
+    for block in program.blocks:
+        branch = block.terminator
+        if branch is None or branch.op != 'branch':
+            continue
+        condition, if_true, if_false = branch.args
+        if uses[condition] != 1:
+            continue
+        for definition in block.instructions:
+            if definition.dest is condition:
+                if definition.op in ir.COMPARISON_OPS:
+                    args = (definition.op,) + definition.args + (if_true, if_false)
+                    block.instructions[-1] = ir.Instruction('cbranch', None, args, branch.position)
+                break
+    remove_dead_values(program)
+
+# Pure ops that are safe to run when the loop body would not have: MARS
+# traps on a zero divisor, so div stays where it is
+HOISTABLE_OPS = tuple(op for op in ir.PURE_OPS if op != 'div')
+
+def hoist_loop_invariants(program):
+    """
+    Loop-invariant code motion. Loads of variables no block of the loop
+    writes, and pure computations on values from outside the loop, move to
+    the loop's preheader so they run once instead of every iteration. Inner
+    loops are done first, so their invariants can move further out.
+    """
+    while True:
+        for header, body in sorted(ir.natural_loops(program), key=lambda loop: len(loop[1])):
+            if hoist_loop(program, header, body):
+                break
+        else:
+            return
+
+def hoist_loop(program, header, body):
+    """
+    Hoist the invariants of one loop. Returns whether anything moved.
+    """
+    blocks = [block for block in program.blocks if block.label in body]
+    written = set()
+    defined = set()
+    for block in blocks:
+        for instruction in block.instructions:
+            if instruction.op in ir.MEMORY_WRITES:
+                written.add(instruction.args[ir.MEMORY_WRITES[instruction.op]])
+            if instruction.dest is not None:
+                defined.add(instruction.dest)
+
+    # Each round can make the values computed from the last round's invariant
+    hoisted = []
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            kept = []
+            for instruction in block.instructions:
+                if instruction.op in HOISTABLE_OPS and not any(vreg in defined for vreg in instruction.uses()) \
+                        and (instruction.op not in ir.LOAD_OPS or instruction.args[0] not in written):
+                    hoisted.append(instruction)
+                    defined.discard(instruction.dest)
+                    changed = True
+                else:
+                    kept.append(instruction)
+            block.instructions = kept
+    if not hoisted:
+        return False
+    preheader = loop_preheader(program, header, body)
+    preheader.instructions[-1:-1] = hoisted
+    return True
+
+def loop_preheader(program, header, body):
+    """
+    The block every entry into the loop comes through, ending in a jump to
+    header. Created and laid out before the header if there is none.
+    """
+    blocks = program.block_map()
+    outside = [label for label in ir.predecessors(program)[header] if label not in body]
+    if len(outside) == 1 and blocks[outside[0]].terminator.op == 'jump':
+        return blocks[outside[0]]
+
+    preheader = program.new_block()
+    program.blocks.remove(preheader)
+    program.blocks.insert(program.blocks.index(blocks[header]), preheader)
+    preheader.instructions.append(ir.Instruction('jump', None, (header,)))
+    for label in outside:
+        terminator = blocks[label].terminator
+        terminator.args = tuple(preheader.label if arg == header else arg for arg in terminator.args)
+    return preheader
+
+DEFAULT_PASSES = (fold_constants, forward_stores, remove_dead_stores, reduce_strength, hoist_loop_invariants, fuse_branches)
+
+def main():
+    import lexer
+    import parser
+    import semantic
+
+    input_code = """
+    tally x imbue with 1 augmented by 2;
+    tally y imbue with x amplified by 4;
+    summon x;
+    x imbue with x augmented by y;
+    cast spell x spell y;
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    program = ir.lower(ast)
+    print(program.dump())
+    for ir_pass in DEFAULT_PASSES:
+        ir_pass(program)
+    print(program.dump())
+    print(program.data)
+
+if __name__ == "__main__":
+    main()
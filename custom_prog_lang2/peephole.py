@@ -0,0 +1,238 @@
+import re
+
+# Peephole optimizer over the emitted MIPS text. Each rule is a function
+# taking the list of lines and returning the rewritten list with, for each
+# line of it, the index of the line it came from (for merged lines, the first
+# of them); rules only drop and merge lines, so the instructions eliminated
+# are the difference in length. A Peephole runs its rules until none of them
+# changes anything and keeps a per-rule count of what they removed, and the
+# origins let it carry the generator's source positions along.
+#
+# Lines are the generator's: labels end in ':', directives start with '.',
+# everything else is `op operand, operand, ...`.
+
+REGISTER = re.compile(r'\$\w+')
+
+# Ops whose first operand is read, not written
+NO_DEST_OPS = frozenset((
+    'sw', 'sb', 'sh', 'beq', 'bne', 'beqz', 'bnez', 'blt', 'bgt', 'ble', 'bge',
+    'j', 'jr', 'jal', 'div', 'divu', 'mult', 'multu', 'syscall', 'teq',
+    'mtc1', 's.s', 'swc1', 'c.lt.s', 'c.le.s', 'c.eq.s', 'bc1t', 'bc1f',
+))
+
+# Ops that write their first operand only under a condition, so also read it
+CONDITIONAL_OPS = frozenset(('movf', 'movt', 'movn', 'movz'))
+
+# Ops after which the next line is not necessarily the next one executed
+CONTROL_OPS = frozenset(('beq', 'bne', 'beqz', 'bnez', 'blt', 'bgt', 'ble', 'bge', 'bc1t', 'bc1f', 'j', 'jr', 'jal'))
+
+# Registers syscall reads
+SYSCALL_REGISTERS = ('$v0', '$a0', '$a1')
+
+# Print syscall services; they leave $v0 and $a0 as they were
+PRINT_SERVICES = ('1', '2', '3', '4', '11')
+
+# Range of an addi immediate
+IMMEDIATE_MIN = -0x8000
+IMMEDIATE_MAX = 0x7FFF
+
+def is_instruction(line):
+    return not line.endswith(':') and not line.startswith('.')
+
+def split(line):
+    """
+    (op, [operands]) of an instruction line.
+    """
+    op, _, rest = line.partition(' ')
+    return op, [operand.strip() for operand in rest.split(',')] if rest else []
+
+def written_register(op, operands):
+    if op in NO_DEST_OPS or not operands or not operands[0].startswith('$'):
+        return None
+    return operands[0]
+
+def read_registers(op, operands):
+    if op == 'syscall':
+        return SYSCALL_REGISTERS
+    start = 0 if written_register(op, operands) is None or op in CONDITIONAL_OPS else 1
+    return [register for operand in operands[start:] for register in REGISTER.findall(operand)]
+
+def is_dead_after(lines, index, register):
+    """
+    Whether register is written before it is read after lines[index]. Gives
+    up (False) at the end of the straight-line run, where it may be live.
+    """
+    for line in lines[index + 1:]:
+        if not is_instruction(line):
+            return False
+        op, operands = split(line)
+        if register in read_registers(op, operands):
+            return False
+        if written_register(op, operands) == register:
+            return True
+        if op in CONTROL_OPS:
+            return False
+    return False
+
+def remove_self_moves(lines):
+    """
+    `move $x, $x` does nothing.
+    """
+    kept = []
+    origins = []
+    for index, line in enumerate(lines):
+        if is_instruction(line):
+            op, operands = split(line)
+            if op == 'move' and operands[0] == operands[1]:
+                continue
+        kept.append(line)
+        origins.append(index)
+    return kept, origins
+
+def merge_li_add(lines):
+    """
+    `li $r, n` followed by an add reading $r becomes addi when $r is dead
+    afterwards and n fits in 16 bits.
+    """
+    kept = []
+    origins = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if index + 1 < len(lines) and is_instruction(line) and is_instruction(lines[index + 1]):
+            op, operands = split(line)
+            next_op, next_operands = split(lines[index + 1])
+            if op == 'li' and next_op == 'add' and operands[1].lstrip('-').isdigit():
+                register, value = operands[0], int(operands[1])
+                dest, left, right = next_operands
+                other = left if right == register else right if left == register else None
+                if (other is not None and other != register and IMMEDIATE_MIN <= value <= IMMEDIATE_MAX
+                        and (dest == register or is_dead_after(lines, index + 1, register))):
+                    kept.append(f"addi {dest}, {other}, {value}")
+                    origins.append(index)
+                    index += 2
+                    continue
+        kept.append(line)
+        origins.append(index)
+        index += 1
+    return kept, origins
+
+def remove_repeated_print_setup(lines):
+    """
+    Consecutive print syscalls each load $v0 with the service number and
+    $a0 with the string address; a load of the value the register already
+    holds from the previous print is dropped. Labels, control flow and any
+    other syscall forget what is known.
+    """
+    kept = []
+    origins = []
+    known = {}
+    for index, line in enumerate(lines):
+        if not is_instruction(line):
+            known = {}
+            kept.append(line)
+            origins.append(index)
+            continue
+        op, operands = split(line)
+        if op in ('li', 'la') and operands[0] in ('$v0', '$a0'):
+            if known.get(operands[0]) == (op, operands[1]):
+                continue
+            known[operands[0]] = (op, operands[1])
+        elif op == 'syscall':
+            if known.get('$v0', (None, None))[1] not in PRINT_SERVICES:
+                known = {}
+        elif op in CONTROL_OPS:
+            known = {}
+        else:
+            known.pop(written_register(op, operands), None)
+        kept.append(line)
+        origins.append(index)
+    return kept, origins
+
+def remove_jumps_to_next(lines):
+    """
+    `j L` directly followed by label L (possibly among other labels) falls
+    through anyway.
+    """
+    kept = []
+    origins = []
+    for index, line in enumerate(lines):
+        if is_instruction(line):
+            op, operands = split(line)
+            if op == 'j':
+                following = index + 1
+                labels = set()
+                while following < len(lines) and lines[following].endswith(':'):
+                    labels.add(lines[following][:-1])
+                    following += 1
+                if operands[0] in labels:
+                    continue
+        kept.append(line)
+        origins.append(index)
+    return kept, origins
+
+DEFAULT_RULES = (remove_self_moves, merge_li_add, remove_repeated_print_setup, remove_jumps_to_next)
+
+class Peephole:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        # Instructions eliminated by each rule, by rule name
+        self.report = {rule.__name__: 0 for rule in self.rules}
+
+    def run(self, lines):
+        """
+        Apply the rules to lines until nothing changes; returns the new list.
+        """
+        return self.run_with_positions(lines, [None] * len(lines))[0]
+
+    def run_with_positions(self, lines, positions):
+        """
+        run() for lines with a position each (anything, e.g. the source
+        position of an instruction); returns the new lines and their
+        positions, a merged line taking that of the first it replaces.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                kept, origins = rule(lines)
+                eliminated = len(lines) - len(kept)
+                if eliminated:
+                    self.report[rule.__name__] += eliminated
+                    positions = [positions[origin] for origin in origins]
+                    changed = True
+                lines = kept
+        return lines, positions
+
+    def format_report(self):
+        lines = [f"{'rule':<28} {'eliminated':>10}"]
+        for name, eliminated in self.report.items():
+            lines.append(f"{name:<28} {eliminated:>10}")
+        lines.append(f"{'total':<28} {sum(self.report.values()):>10}")
+        return '\n'.join(lines)
+
+def main():
+    import generator
+    import lexer
+    import parser
+    import semantic
+
+    input_code = """
+    tally x;
+    cast spell "Give me a number: ";
+    summon x;
+    tally y imbue with x augmented by 4;
+    tally i imbue with 0;
+    cycle (i falls below 3) {
+        cast spell y spell " " spell i spell " ";
+        i imbue with i augmented by 1;
+    }
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    gen = generator.Generator()
+    print(gen.generate_mips(ast))
+    print(gen.peephole.format_report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import ir
+
+# Register allocation for ir.Program.
+#
+# First the most frequently accessed word variables (weighted by loop nesting)
+# are promoted into $s registers for the whole program: their loads and stores
+# become register moves, which are then coalesced away where possible. Then a
+# linear scan over live intervals assigns the word virtual registers to the
+# remaining $t and $s registers, and a second scan the float ones to $f
+# registers, spilling to memory the interval that ends last whenever more
+# values are live than there are registers.
+
+TEMP_REGISTERS = tuple(f"$t{number}" for number in range(10))
+SAVED_REGISTERS = tuple(f"$s{number}" for number in range(8))
+# Coprocessor 1 registers for portion values; $f0 and $f12 are left to the
+# float syscalls and spill code
+FLOAT_REGISTERS = tuple(f"$f{number}" for number in range(1, 32) if number != 12)
+
+# Weight of an access nested n loops deep, relative to straight-line code
+LOOP_WEIGHT = 10
+
+class Allocation:
+    """
+    Result of allocate(): a register for every virtual register, or a spill
+    slot label for those that did not get one.
+    """
+    def __init__(self):
+        self.registers = {}
+        self.spills = {}
+        self.promoted = {}
+
+def variable_weights(program):
+    """
+    Access counts of word variables, each weighted by LOOP_WEIGHT ** loop depth.
+    Variables other ops read from memory (a rune copied into a verse) have to
+    stay there and are left out.
+    """
+    words = {label for label, directive, value in program.data if directive == '.word'}
+    for instruction in program.instructions():
+        if instruction.op not in ('load', 'store'):
+            words.difference_update(instruction.args[index] for index in ir.MEMORY_READS.get(instruction.op, ()))
+    depths = ir.loop_depths(program)
+    weights = {}
+    for block in program.blocks:
+        weight = LOOP_WEIGHT ** depths[block.label]
+        for instruction in block.instructions:
+            if instruction.op in ('load', 'store') and instruction.args[0] in words:
+                label = instruction.args[0]
+                weights[label] = weights.get(label, 0) + weight
+    return weights
+
+def promote_variables(program, count):
+    """
+    Keep the count hottest word variables in registers. Returns {label: VReg};
+    each VReg stands for its variable everywhere and must get a register of
+    its own.
+    """
+    weights = variable_weights(program)
+    hottest = sorted(weights, key=lambda label: -weights[label])[:count]
+    if not hottest:
+        return {}
+
+    promoted = {label: program.new_vreg() for label in hottest}
+    initial = {label: value for label, directive, value in program.data if directive == '.word'}
+    for block in program.blocks:
+        for index, instruction in enumerate(block.instructions):
+            if instruction.op == 'load' and instruction.args[0] in promoted:
+                block.instructions[index] = ir.Instruction('move', instruction.dest, (promoted[instruction.args[0]],), instruction.position)
+            elif instruction.op == 'store' and instruction.args[0] in promoted:
+                block.instructions[index] = ir.Instruction('move', promoted[instruction.args[0]], (instruction.args[1],), instruction.position)
+
+    # Memory holds the variable's initial value, so the register starts with it
+    entry = program.blocks[0]
+    entry.instructions[0:0] = [ir.Instruction('li', vreg, (initial[label],)) for label, vreg in promoted.items()]
+    pinned = set(promoted.values())
+    shared = shared_vregs(program) - pinned
+    for block in program.blocks:
+        coalesce_moves(block, pinned, shared)
+    return promoted
+
+def shared_vregs(program):
+    """
+    Virtual registers used outside the block defining them.
+    """
+    defined = {}
+    for block in program.blocks:
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                defined[instruction.dest] = block.label
+    shared = set()
+    for block in program.blocks:
+        for instruction in block.instructions:
+            shared.update(vreg for vreg in instruction.uses() if defined.get(vreg) != block.label)
+    return shared
+
+def coalesce_moves(block, pinned, shared):
+    """
+    Remove the moves promotion introduced. A copy of a pinned register is
+    replaced by the register itself until the register is written again, and
+    a value computed only to be moved into a pinned register is computed
+    there directly. Values in shared are used by other blocks too, so both
+    are left to the moves there.
+    """
+    instructions = block.instructions
+    index = 0
+    while index < len(instructions):
+        instruction = instructions[index]
+        if instruction.op != 'move':
+            index += 1
+            continue
+        source = instruction.args[0]
+        dest = instruction.dest
+
+        if dest in shared or source in shared:
+            index += 1
+            continue
+
+        if source in pinned and dest not in pinned and replace_copy(instructions, index, dest, source):
+            del instructions[index]
+            continue
+
+        if dest in pinned and source not in pinned and retarget_definition(instructions, index, dest, source):
+            del instructions[index]
+            continue
+        index += 1
+
+def replace_copy(instructions, index, copy, register):
+    """
+    Replace the uses of copy after instructions[index] by register, if
+    register is not written before copy's last use. copy must be local to
+    the block.
+    """
+    last_use = None
+    for position in range(index + 1, len(instructions)):
+        if copy in instructions[position].uses():
+            last_use = position
+    if last_use is None:
+        return False
+    for position in range(index + 1, last_use):
+        if instructions[position].dest is register:
+            return False
+    for position in range(index + 1, last_use + 1):
+        instruction = instructions[position]
+        instruction.args = tuple(register if arg is copy else arg for arg in instruction.args)
+    return True
+
+def retarget_definition(instructions, index, register, value):
+    """
+    Make the instruction defining value write register directly, when value
+    is used only by the move at instructions[index] and register is not read
+    in between.
+    """
+    for position in range(index - 1, -1, -1):
+        instruction = instructions[position]
+        if instruction.dest is value:
+            if instruction.op not in ir.PURE_OPS and instruction.op != 'read_int':
+                return False
+            for between in instructions[position + 1:index]:
+                if register in between.uses() or value in between.uses() or between.dest is register:
+                    return False
+            if any(value in later.uses() for later in instructions[index + 1:]):
+                return False
+            instruction.dest = register
+            return True
+    return False
+
+def liveness(program):
+    """
+    Virtual registers live on entry to and exit from each block.
+    """
+    uses = {}
+    defs = {}
+    for block in program.blocks:
+        used, defined = set(), set()
+        for instruction in block.instructions:
+            used.update(vreg for vreg in instruction.uses() if vreg not in defined)
+            if instruction.dest is not None:
+                defined.add(instruction.dest)
+        uses[block.label] = used
+        defs[block.label] = defined
+
+    live_in = {block.label: set() for block in program.blocks}
+    live_out = {block.label: set() for block in program.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(program.blocks):
+            out = set()
+            for successor in block.successors():
+                out |= live_in[successor]
+            new_in = uses[block.label] | (out - defs[block.label])
+            if out != live_out[block.label] or new_in != live_in[block.label]:
+                live_out[block.label] = out
+                live_in[block.label] = new_in
+                changed = True
+    return live_in, live_out
+
+def live_intervals(program):
+    """
+    [start, end] positions of every virtual register in the linear order of
+    the blocks, stretched over whole blocks it is live into or out of.
+    Instruction i reads its operands at position 2i and writes its result at
+    2i + 1, so a value last read by an instruction can share a register with
+    its result, but not with a value that is still live.
+    """
+    live_in, live_out = liveness(program)
+    intervals = {}
+
+    def extend(vreg, position):
+        interval = intervals.get(vreg)
+        if interval is None:
+            intervals[vreg] = [position, position]
+        elif position < interval[0]:
+            interval[0] = position
+        elif position > interval[1]:
+            interval[1] = position
+
+    index = 0
+    for block in program.blocks:
+        start = index
+        for instruction in block.instructions:
+            for vreg in instruction.uses():
+                extend(vreg, 2 * index)
+            if instruction.dest is not None:
+                extend(instruction.dest, 2 * index + 1)
+            index += 1
+        end = max(start, index - 1)
+        for vreg in live_in[block.label]:
+            extend(vreg, 2 * start)
+        for vreg in live_out[block.label]:
+            extend(vreg, 2 * end + 1)
+    return intervals
+
+def allocate(program, promote=len(SAVED_REGISTERS)):
+    """
+    Assign registers to every virtual register of program: $t and $s
+    registers to words, FLOAT_REGISTERS to floats. Up to promote word
+    variables are kept in $s registers first. Spilled values get a .word
+    slot in program.data. Returns an Allocation.
+    """
+    allocation = Allocation()
+    allocation.promoted = promote_variables(program, min(promote, len(SAVED_REGISTERS)))
+    for vreg, register in zip(allocation.promoted.values(), SAVED_REGISTERS):
+        allocation.registers[vreg] = register
+    pinned = set(allocation.promoted.values())
+
+    intervals = live_intervals(program)
+    words = [vreg for vreg in intervals if vreg not in pinned and not vreg.is_float]
+    floats = [vreg for vreg in intervals if vreg.is_float]
+    linear_scan(program, allocation, intervals, words, list(TEMP_REGISTERS) + list(SAVED_REGISTERS[len(pinned):]))
+    linear_scan(program, allocation, intervals, floats, list(FLOAT_REGISTERS))
+    return allocation
+
+def linear_scan(program, allocation, intervals, vregs, free):
+    """
+    Assign the registers in free to vregs by their live intervals, adding
+    to allocation.
+    """
+    # Active intervals as (end, vreg), kept sorted by end
+    active = []
+
+    def spill(vreg):
+        label = f"spill_{len(allocation.spills)}"
+        allocation.spills[vreg] = label
+        program.data.append((label, '.word', 0))
+
+    for vreg in sorted(vregs, key=lambda vreg: intervals[vreg][0]):
+        start, end = intervals[vreg]
+        # An interval ending where this one starts can share its register
+        while active and active[0][0] <= start:
+            free.append(allocation.registers[active.pop(0)[1]])
+
+        if free:
+            register = free.pop(0)
+        else:
+            # Spill whichever of the active intervals and this one ends last
+            victim_end, victim = active[-1] if active else (-1, None)
+            if victim_end > end:
+                active.pop()
+                register = allocation.registers.pop(victim)
+                spill(victim)
+            else:
+                spill(vreg)
+                continue
+
+        allocation.registers[vreg] = register
+        active.append((end, vreg))
+        active.sort(key=lambda item: item[0])
+
+def main():
+    import lexer
+    import parser
+    import semantic
+
+    input_code = """
+    tally total imbue with 0;
+    tally i imbue with 0;
+    cycle (i falls below 10) {
+        total imbue with total augmented by i amplified by i;
+        i imbue with i augmented by 1;
+    }
+    cast spell total;
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    program = ir.lower(ast)
+    allocation = allocate(program)
+    print(program.dump())
+    print(allocation.registers)
+
+if __name__ == "__main__":
+    main()
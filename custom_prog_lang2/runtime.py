@@ -0,0 +1,131 @@
+# Runtime library for the generated MIPS: routines written once at the end of
+# the text segment and called with jal, instead of inlined at every use.
+#
+# The string routines take the destination in $a0, the source in $a1 and the
+# destination's size in bytes in $a2; the result is truncated to fit and always
+# terminated. Strings are UTF-8, and a cut never splits a character: when the
+# next source byte continues one, the copy backs up to that character's lead
+# byte and ends there. They use only $a0-$a3, $v0, $v1 and $ra, none of which the
+# register allocator hands out, so values stay in registers across a call.
+#
+# Strings and buffers are word aligned, so when the source and destination
+# share an alignment the copy runs a word at a time: a word w holds a zero byte
+# exactly when (w - 0x01010101) & ~w & 0x80808080 is not zero.
+#
+# Labels contain a dot, which identifiers cannot, so they never clash with
+# variables.
+
+STRCPY = [
+    "rt.strcpy:",
+    "xor $v0, $a0, $a1",
+    "andi $v0, $v0, 3",
+    "bnez $v0, rt.strcpy.bytes",  # Never aligned together: a byte at a time
+    "rt.strcpy.align:",
+    "andi $v0, $a0, 3",
+    "beqz $v0, rt.strcpy.words",
+    "slti $v0, $a2, 2",
+    "bnez $v0, rt.strcpy.end",
+    "lb $v0, 0($a1)",
+    "sb $v0, 0($a0)",
+    "beqz $v0, rt.strcpy.return",
+    "addiu $a0, $a0, 1",
+    "addiu $a1, $a1, 1",
+    "addiu $a2, $a2, -1",
+    "j rt.strcpy.align",
+    "rt.strcpy.words:",
+    "slti $v0, $a2, 5",  # A whole word and the terminator must still fit
+    "bnez $v0, rt.strcpy.bytes",
+    "lw $v0, 0($a1)",
+    "li $v1, 0x01010101",
+    "subu $v1, $v0, $v1",
+    "nor $a3, $v0, $zero",
+    "and $v1, $v1, $a3",
+    "li $a3, 0x80808080",
+    "and $v1, $v1, $a3",
+    "bnez $v1, rt.strcpy.bytes",  # The terminator is in this word
+    "sw $v0, 0($a0)",
+    "addiu $a0, $a0, 4",
+    "addiu $a1, $a1, 4",
+    "addiu $a2, $a2, -4",
+    "j rt.strcpy.words",
+    "rt.strcpy.bytes:",
+    "slti $v0, $a2, 2",
+    "bnez $v0, rt.strcpy.end",
+    "lb $v0, 0($a1)",
+    "sb $v0, 0($a0)",
+    "beqz $v0, rt.strcpy.return",
+    "addiu $a0, $a0, 1",
+    "addiu $a1, $a1, 1",
+    "addiu $a2, $a2, -1",
+    "j rt.strcpy.bytes",
+    "rt.strcpy.end:",
+    "lb $v0, 0($a1)",
+    "andi $v0, $v0, 0xC0",
+    "xori $v0, $v0, 0x80",
+    "bnez $v0, rt.strcpy.cut",  # The next byte starts a character
+    "rt.strcpy.back:",
+    "addiu $a0, $a0, -1",
+    "lb $v0, 0($a0)",
+    "andi $v0, $v0, 0xC0",
+    "xori $v0, $v0, 0x80",
+    "beqz $v0, rt.strcpy.back",  # Still a continuation byte
+    "rt.strcpy.cut:",
+    "sb $zero, 0($a0)",
+    "rt.strcpy.return:",
+    "jr $ra",
+]
+
+# Finds the end of the destination, then continues as rt.strcpy from there
+STRCAT = [
+    "rt.strcat:",
+    "andi $v0, $a0, 3",
+    "bnez $v0, rt.strcat.bytes",
+    "rt.strcat.words:",
+    "slti $v0, $a2, 5",
+    "bnez $v0, rt.strcat.bytes",
+    "lw $v0, 0($a0)",
+    "li $v1, 0x01010101",
+    "subu $v1, $v0, $v1",
+    "nor $a3, $v0, $zero",
+    "and $v1, $v1, $a3",
+    "li $a3, 0x80808080",
+    "and $v1, $v1, $a3",
+    "bnez $v1, rt.strcat.bytes",
+    "addiu $a0, $a0, 4",
+    "addiu $a2, $a2, -4",
+    "j rt.strcat.words",
+    "rt.strcat.bytes:",
+    "lb $v0, 0($a0)",
+    "beqz $v0, rt.strcpy",
+    "addiu $a0, $a0, 1",
+    "addiu $a2, $a2, -1",
+    "j rt.strcat.bytes",
+]
+
+# Routine code and the routines it jumps into, by entry label
+ROUTINES = {
+    'rt.strcpy': (STRCPY, ()),
+    'rt.strcat': (STRCAT, ('rt.strcpy',)),
+}
+
+def routines(names):
+    """
+    The lines of the named routines and those they depend on, each once.
+    """
+    needed = []
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.append(name)
+            pending.extend(ROUTINES[name][1])
+    lines = []
+    for name in sorted(needed):
+        lines.extend(ROUTINES[name][0])
+    return lines
+
+def main():
+    print('\n'.join(routines(['rt.strcat'])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import re
+
+import tokens
+
+# Table-driven scanner producing the same tokens as lexer.scan_tokens.
+# The first character of a token picks the scanner state from START; each state
+# then consumes its whole run at once. Words are always scanned as identifiers
+# first and only then classified as keywords or operator heads through a
+# perfect-hash table, so no per-token alternation is tried.
+
+# Scanner states
+IDENT, NUMBER, STRING, SLASH, BLANK, NEWLINE, SINGLE, MISMATCH = range(8)
+
+# Single-character tokens
+SINGLE_KINDS = {
+    ',': 'PUNCTUATION',
+    '(': 'PUNCTUATION',
+    ')': 'PUNCTUATION',
+    ';': 'SEMI_COLON',
+    '{': 'START_IF_FOR',
+    '}': 'END_IF_FOR',
+}
+
+# Transition table of the start state, by first character
+START = {}
+for code in range(128):
+    char = chr(code)
+    if char.isalpha() or char == '_':
+        START[char] = IDENT
+    elif char.isdigit():
+        START[char] = NUMBER
+    elif char in '"\'':
+        START[char] = STRING
+    elif char == '/':
+        START[char] = SLASH
+    elif char in ' \t':
+        START[char] = BLANK
+    elif char == '\n':
+        START[char] = NEWLINE
+    elif char in SINGLE_KINDS:
+        START[char] = SINGLE
+
+WORD_RUN = re.compile(r'\w*')
+DIGIT_RUN = re.compile(r'\d*')
+BLANK_RUN = re.compile(r'[ \t]*')
+
+def keyword_entries():
+    """
+    (word, kind, continuations) for every reserved word and operator head.
+    continuations lists the text a multi-word operator needs after its first
+    word, e.g. ' by' after 'augmented'; '' means the word is a token by itself.
+    """
+    entries = {word: (kind, ['']) for word, kind in tokens.KEYWORDS.items()}
+    for operator in tokens.OPERATORS:
+        head, _, rest = operator.partition(' ')
+        continuation = ' ' + rest if rest else ''
+        entries.setdefault(head, ('OPERATOR', []))[1].append(continuation)
+    # Try longer continuations first
+    return [(word, kind, sorted(continuations, key=len, reverse=True))
+            for word, (kind, continuations) in entries.items()]
+
+def keyword_hash(word, seed, size):
+    return (len(word) * seed + ord(word[0]) + ord(word[len(word) >> 1]) * 7 + ord(word[-1]) * 31) % size
+
+def build_perfect_hash(entries):
+    """
+    Find the smallest table and seed for which keyword_hash has no collisions.
+    """
+    for size in range(len(entries), 16 * len(entries)):
+        for seed in range(1, 64):
+            table = [None] * size
+            for entry in entries:
+                slot = keyword_hash(entry[0], seed, size)
+                if table[slot] is not None:
+                    break
+                table[slot] = entry
+            else:
+                return table, seed
+    raise ValueError("No perfect hash found for the keyword table")
+
+KEYWORD_TABLE, KEYWORD_SEED = build_perfect_hash(keyword_entries())
+KEYWORD_SIZE = len(KEYWORD_TABLE)
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+def scan(text):
+    """
+    Tokenize text and yield (kind, value, start, end, line, column) tuples,
+    like lexer.scan_tokens.
+    """
+    pos = 0
+    length = len(text)
+    line_num = 1
+    line_start = 0
+    start_state = START.get
+    table = KEYWORD_TABLE
+    seed = KEYWORD_SEED
+    size = KEYWORD_SIZE
+
+    while pos < length:
+        char = text[pos]
+        state = start_state(char, MISMATCH)
+        start = pos
+
+        if state == IDENT:
+            pos = WORD_RUN.match(text, pos + 1).end()
+            word = text[start:pos]
+            kind = 'VARIABLE_NAME'
+            # keyword_hash, inlined
+            entry = table[(len(word) * seed + ord(char) + ord(word[len(word) >> 1]) * 7 + ord(word[-1]) * 31) % size]
+            # Keywords only count as whole words, not after e.g. a number
+            if entry is not None and entry[0] == word and (start == 0 or not is_word_char(text[start - 1])):
+                for continuation in entry[2]:
+                    end = pos + len(continuation)
+                    if text.startswith(continuation, pos) and (end == length or not is_word_char(text[end])):
+                        kind = entry[1]
+                        pos = end
+                        break
+            yield kind, text[start:pos], start, pos, line_num, start - line_start
+
+        elif state == BLANK:
+            pos = BLANK_RUN.match(text, pos + 1).end()
+
+        elif state == NEWLINE:
+            pos += 1
+            line_num += 1
+            line_start = pos
+
+        elif state == SINGLE:
+            pos += 1
+            yield SINGLE_KINDS[char], char, start, pos, line_num, start - line_start
+
+        elif state == NUMBER:
+            pos = DIGIT_RUN.match(text, pos + 1).end()
+            if pos < length and text[pos] == '.':
+                pos = DIGIT_RUN.match(text, pos + 1).end()
+            yield 'NUMBER', text[start:pos], start, pos, line_num, start - line_start
+
+        elif state == STRING:
+            close = text.find(char, pos + 1)
+            if close < 0:
+                raise SyntaxError(f"Unexpected character {char} on line {line_num}, column {start - line_start}")
+            pos = close + 1
+            yield 'STRING', text[start:pos], start, pos, line_num, start - line_start
+
+        elif state == SLASH and text.startswith('//', pos):
+            close = text.find('\n', pos)
+            pos = length if close < 0 else close
+
+        elif state == SLASH and text.startswith('/*', pos) and text.find('*/', pos + 2) >= 0:
+            pos = text.find('*/', pos + 2) + 2
+            newlines = text.count('\n', start, pos)
+            if newlines:
+                line_num += newlines
+                line_start = text.rindex('\n', start, pos) + 1
+
+        elif char.isdecimal():
+            # Non-ASCII digits, as matched by \d
+            pos = DIGIT_RUN.match(text, pos).end()
+            if pos < length and text[pos] == '.':
+                pos = DIGIT_RUN.match(text, pos + 1).end()
+            yield 'NUMBER', text[start:pos], start, pos, line_num, start - line_start
+
+        else:
+            raise SyntaxError(f"Unexpected character {char} on line {line_num}, column {start - line_start}")
+
+def dfa_lexical_analyzer(text):
+    """
+    Drop-in replacement for lexer.lexical_analyzer.
+    """
+    return [tokens.Token(kind, value, line, column) for kind, value, _, _, line, column in scan(text)]
+
+def main():
+    input_code = """
+    tally x imbue with 4 augmented by 2; /* sum */
+    cast spell x;
+    """
+    for token in dfa_lexical_analyzer(input_code):
+        print(token)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import lexer
+import parser
+import symbols
+
+# Operators and the node types they build
+ARITHMETIC_OPERATORS = ('augmented by', 'diminished by', 'amplified by', 'fragmented by',
+                        'augment by', 'diminish by', 'amplify by', 'fragment by')
+CONCATENATION_OPERATORS = ('augmented by', 'augment by')
+# Comparisons and logical operators take numbers and yield a tally of 1 or 0
+COMPARISON_OPERATORS = ('exceeds', 'falls below', 'at least', 'at most', 'mirrors', 'defies')
+LOGICAL_OPERATORS = ('and', 'or')
+
+NUMERIC_TYPES = ('tally', 'portion')
+
+# Expression types each declared type accepts
+ASSIGNABLE = {
+    'tally': ('tally',),
+    'portion': ('tally', 'portion'),
+    'verse': ('verse', 'rune'),
+    'rune': ('rune',),
+}
+
+# Types summon can read into
+INPUT_TYPES = ('tally', 'portion', 'verse')
+
+class SemanticAnalyzer:
+    """
+    Declaration and type checks over an AST built with Parser(tokens, evaluate=False).
+    Nothing is evaluated and the AST is not modified; the result is a symbol
+    table of declared types that the generator can use.
+
+    trial and cycle bodies are scoped: a name is visible from its declaration
+    to the end of its block, and cannot be declared again while it is visible.
+    """
+    def __init__(self):
+        self.symbol_table = {}
+        self.scopes = symbols.SymbolTable()
+
+    def analyze(self, ast):
+        for node in ast:
+            self.check_statement(node)
+        return self.symbol_table
+
+    def check_statement(self, node):
+        if node['type'] == 'variable_declaration':
+            var_name = node['variable']
+            if self.scopes.resolve(var_name) is not None:
+                raise SyntaxError(f"Variable {var_name} already declared")
+            if 'expression' in node:
+                self.check_assignment(node['data_type'], var_name, node['expression'])
+            symbol = self.scopes.declare(var_name, node['data_type'])
+            self.symbol_table[var_name] = {'data_type': node['data_type'], 'slot': symbol.slot}
+
+        elif node['type'] == 'variable_assignment':
+            data_type = self.lookup(node['variable'])
+            self.check_assignment(data_type, node['variable'], node['expression'])
+
+        elif node['type'] == 'input_statement':
+            data_type = self.lookup(node['variable'])
+            if data_type not in INPUT_TYPES:
+                raise TypeError(f"Unsupported data type: {data_type}")
+
+        elif node['type'] == 'output_statement':
+            for expression in node['expressions']:
+                self.expression_type(expression)
+
+        elif node['type'] in ('if_statement', 'for_statement'):
+            condition_type = self.expression_type(node['condition'])
+            if condition_type not in NUMERIC_TYPES:
+                raise TypeError(f"Condition must be a tally or portion, got {condition_type}")
+            self.scopes.push_scope()
+            try:
+                for statement in node['body']:
+                    self.check_statement(statement)
+            finally:
+                self.scopes.pop_scope()
+
+        else:
+            raise ValueError(f"Unknown node type: {node['type']}")
+
+    def lookup(self, var_name):
+        symbol = self.scopes.resolve(var_name)
+        if symbol is None:
+            raise SyntaxError(f"Variable '{var_name}' not declared")
+        return symbol.data_type
+
+    def check_assignment(self, data_type, var_name, expression):
+        value_type = self.expression_type(expression)
+        if value_type in ASSIGNABLE[data_type]:
+            return
+        # String literals are also how single characters are written
+        if data_type == 'rune' and expression['type'] == 'string' and len(expression['value']) == 3:
+            return
+        raise TypeError(f"Cannot assign {value_type} to {data_type} '{var_name}'")
+
+    def expression_type(self, node):
+        """
+        Static type of an expression: tally, portion, verse or rune.
+        """
+        if node['type'] == 'number':
+            return 'portion' if isinstance(node['value'], float) else 'tally'
+        elif node['type'] == 'variable':
+            return self.lookup(node['name'])
+        elif node['type'] == 'string':
+            return 'verse'
+        elif node['type'] == 'char':
+            return 'rune'
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            left = self.expression_type(node['left'])
+            right = self.expression_type(node['right'])
+            operator = node['operator']
+            if operator not in ARITHMETIC_OPERATORS and operator not in COMPARISON_OPERATORS and operator not in LOGICAL_OPERATORS:
+                raise ValueError(f"Unknown operator: {operator}")
+            if left == 'verse' and right == 'verse' and operator in CONCATENATION_OPERATORS:
+                return 'verse'
+            if left not in NUMERIC_TYPES or right not in NUMERIC_TYPES:
+                raise TypeError(f"Operator '{operator}' not supported between {left} and {right}")
+            if operator in COMPARISON_OPERATORS or operator in LOGICAL_OPERATORS:
+                return 'tally'
+            return 'portion' if 'portion' in (left, right) else 'tally'
+        raise ValueError(f"Unknown node type: {node['type']}")
+
+def main():
+    input_code = """
+    tally x imbue with 4;
+    portion y imbue with x fragmented by 2.5;
+    summon x;
+    cast spell y;
+    """
+
+    # Parsing is pure, so the same AST can be cached and checked again later
+    ast = parser.Parser(lexer.lexical_analyzer(input_code), evaluate=False).parse()
+    symbol_table = SemanticAnalyzer().analyze(ast)
+
+    import json
+    print(json.dumps(ast, indent=2))
+    print(json.dumps(symbol_table, indent=2))
+
+if __name__ == "__main__":
+    main()
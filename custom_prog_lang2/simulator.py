@@ -0,0 +1,853 @@
+import array
+import math
+import struct
+import sys
+
+import peephole
+
+# In-process simulator for the MIPS the generator emits, so a program can be
+# compiled and run without MARS or SPIM.
+#
+# The assembly is decoded once into a list of (handler, a, b, c) tuples:
+# registers become indexes, immediates ints and labels resolved addresses or
+# instruction indexes. Handlers are closures over the machine state, found by
+# op in a table while decoding; each takes (pc, a, b, c) and returns the index
+# of the next instruction, so running is a single loop with no parsing or
+# lookups left in it.
+#
+# Memory is laid out as MARS does: instruction i is at TEXT_BASE + 4 * i and
+# the data segment starts at DATA_BASE. Words are kept in host byte order,
+# little-endian like MARS on the usual hosts. Float registers hold the bits of
+# single-precision values, so arithmetic rounds as coprocessor 1 does and
+# mtc1 moves integers in unchanged.
+
+TEXT_BASE = 0x00400000
+DATA_BASE = 0x10010000
+
+# Instructions run before giving up on a program that does not exit
+MAX_STEPS = 100_000_000
+
+# Message of the RuntimeError a taken teq raises
+TRAP_MESSAGE = "Trap"
+
+REGISTER_NAMES = (
+    'zero', 'at', 'v0', 'v1', 'a0', 'a1', 'a2', 'a3',
+    't0', 't1', 't2', 't3', 't4', 't5', 't6', 't7',
+    's0', 's1', 's2', 's3', 's4', 's5', 's6', 's7',
+    't8', 't9', 'k0', 'k1', 'gp', 'sp', 'fp', 'ra',
+)
+REGISTER_NUMBERS = {f"${name}": number for number, name in enumerate(REGISTER_NAMES)}
+REGISTER_NUMBERS.update({f"${number}": number for number in range(32)})
+FLOAT_REGISTER_NUMBERS = {f"$f{number}": number for number in range(32)}
+
+# Escapes .asciiz strings may contain
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"', "'": "'"}
+
+SIGN = 0x80000000
+MASK = 0xFFFFFFFF
+
+class Exit(Exception):
+    """
+    Raised by the exit syscall, and by running past the last instruction.
+    """
+
+class Simulator:
+    def __init__(self, assembly):
+        """
+        Assemble assembly (the text Generator.generate_mips returns). Raises
+        ValueError for instructions and directives outside the supported
+        subset. run() can then be called any number of times.
+        """
+        self.registers = [0] * 32
+        self.float_registers = array.array('f', bytes(4 * 32))
+        self.float_bits = memoryview(self.float_registers).cast('B').cast('i')
+        # hi and lo of the last mult or div, and the coprocessor 1 condition flag
+        self.hilo = [0, 0]
+        self.condition = [False]
+        self.stdin = None
+        self.stdout = None
+        self.steps = 0
+        # Index of the instruction run() stopped at, for a source map to look up
+        self.pc = None
+
+        instructions, text_labels, data = self.parse(assembly)
+        self.labels = {label: TEXT_BASE + 4 * index for label, index in text_labels.items()}
+        self.initial_data = self.layout_data(data)
+        self.memory = bytearray(self.initial_data)
+        self.words = memoryview(self.memory).cast('i')
+
+        self.handlers = self.make_handlers()
+        self.code = [self.decode(op, operands) for op, operands in instructions]
+        # Running past the last instruction ends the program, as in MARS
+        self.code.append((self.handlers['exit'], None, None, None))
+        self.entry = text_labels.get('main', 0)
+
+    def parse(self, assembly):
+        """
+        Split assembly into the text instructions as (op, operands), the
+        index of the instruction each text label stands before, and the
+        data lines as (label, directive, value).
+        """
+        instructions = []
+        text_labels = {}
+        data = []
+        in_data = False
+        for line in assembly.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('.globl'):
+                continue
+            if line in ('.text', '.data'):
+                in_data = line == '.data'
+                continue
+            label = None
+            head, colon, rest = line.partition(':')
+            if colon and not head.startswith('.') and '"' not in head and ' ' not in head:
+                label, line = head, rest.strip()
+            if in_data:
+                directive, _, value = line.partition(' ')
+                data.append((label, directive, value.strip()))
+                continue
+            if label is not None:
+                text_labels[label] = len(instructions)
+            if line:
+                instructions.append(peephole.split(line))
+        return instructions, text_labels, data
+
+    def layout_data(self, data):
+        """
+        Place the data lines from DATA_BASE on, recording their labels;
+        returns the initial contents of memory.
+        """
+        memory = bytearray()
+        for label, directive, value in data:
+            if directive in ('.word', '.float', '.align'):
+                alignment = 1 << int(value) if directive == '.align' else 4
+                memory.extend(bytes(-len(memory) % alignment))
+            if label is not None:
+                self.labels[label] = DATA_BASE + len(memory)
+            if directive == '.word':
+                for item in value.split(','):
+                    memory.extend(struct.pack('=i', wrap(int(item, 0))))
+            elif directive == '.float':
+                for item in value.split(','):
+                    memory.extend(struct.pack('=f', float(item)))
+            elif directive == '.asciiz':
+                memory.extend(unescape(value[1:-1]).encode('utf-8') + b'\0')
+            elif directive == '.space':
+                memory.extend(bytes(int(value)))
+            elif directive != '.align':
+                raise ValueError(f"Unsupported directive: {directive}")
+        memory.extend(bytes(-len(memory) % 4))
+        return bytes(memory)
+
+    def decode(self, op, operands):
+        """
+        The (handler, a, b, c) tuple of one instruction.
+        """
+        if op == 'div' and len(operands) == 2:
+            op = 'div hilo'
+        spec = OPERANDS.get(op)
+        if spec is None or len(spec) != len(operands):
+            raise ValueError(f"Unsupported instruction: {op} {', '.join(operands)}")
+        handler = self.handlers[op]
+        args = []
+        for kind, operand in zip(spec, operands):
+            if kind == 'r':
+                args.append(self.register(operand))
+            elif kind == 'f':
+                args.append(self.float_register(operand))
+            elif kind == 'i':
+                args.append(self.immediate(operand))
+            elif kind == 'x':
+                # A register, or an immediate picking the op's immediate form
+                if operand.startswith('$'):
+                    args.append(self.register(operand))
+                else:
+                    handler = self.handlers[f"{op} immediate"]
+                    args.append(self.immediate(operand))
+            elif kind == 'm':
+                # A label, or offset($base) picking the op's register form
+                if operand.endswith(')'):
+                    offset, _, base = operand[:-1].partition('(')
+                    handler = self.handlers[f"{op} register"]
+                    args.extend((self.register(base), int(offset or '0', 0)))
+                else:
+                    offset = self.immediate(operand) - DATA_BASE
+                    if not 0 <= offset < len(self.memory):
+                        raise ValueError(f"Not a data address: {operand}")
+                    if op in ('lw', 'sw', 'l.s', 's.s') and offset % 4:
+                        raise ValueError(f"Unaligned word address: {operand}")
+                    args.append(offset)
+            elif kind == 'l':
+                args.append(self.target(operand))
+
+        # Writes to $zero are dropped
+        if spec[:1] == 'r' and op not in READ_FIRST and args[0] == 0:
+            handler, args = self.handlers['nop'], []
+        args.extend([None] * (3 - len(args)))
+        return (handler, *args)
+
+    def register(self, operand):
+        number = REGISTER_NUMBERS.get(operand)
+        if number is None:
+            raise ValueError(f"Unknown register: {operand}")
+        return number
+
+    def float_register(self, operand):
+        number = FLOAT_REGISTER_NUMBERS.get(operand)
+        if number is None:
+            raise ValueError(f"Unknown float register: {operand}")
+        return number
+
+    def immediate(self, operand):
+        """
+        The value of an integer or label operand, label+offset included.
+        """
+        label, plus, offset = operand.partition('+')
+        if label in self.labels:
+            return self.labels[label] + (int(offset, 0) if plus else 0)
+        try:
+            return wrap(int(operand, 0))
+        except ValueError:
+            raise ValueError(f"Unknown label: {operand}") from None
+
+    def target(self, operand):
+        if operand not in self.labels or self.labels[operand] >= DATA_BASE:
+            raise ValueError(f"Unknown code label: {operand}")
+        return (self.labels[operand] - TEXT_BASE) // 4
+
+    def run(self, stdin=None, stdout=None, max_steps=MAX_STEPS):
+        """
+        Run the program from main with fresh registers and memory, reading
+        input from stdin and writing output to stdout (text streams,
+        sys.stdin and sys.stdout by default). Returns the number of
+        instructions executed; raises RuntimeError if the program is still
+        running after max_steps, or does something the machine would trap.
+        Either way self.pc is left at the instruction it stopped at, the one
+        that trapped if it did (see sourcemap).
+        """
+        self.stdin = sys.stdin if stdin is None else stdin
+        self.stdout = sys.stdout if stdout is None else stdout
+        self.registers[:] = [0] * 32
+        self.float_bits[:] = array.array('i', bytes(4 * 32))
+        self.hilo[:] = [0, 0]
+        self.condition[0] = False
+        self.memory[:] = self.initial_data
+
+        code = self.code
+        pc = self.entry
+        step = -1
+        try:
+            for step in range(max_steps):
+                handler, a, b, c = code[pc]
+                pc = handler(pc, a, b, c)
+        except Exit:
+            self.steps = step + 1
+            return self.steps
+        finally:
+            self.pc = pc
+            self.stdout.flush()
+        self.steps = max_steps
+        raise RuntimeError(f"Program still running after {max_steps} instructions")
+
+    def make_handlers(self):
+        """
+        The handler of every op by name, with "<op> immediate" and
+        "<op> register" for the alternative operand forms (see decode).
+        """
+        r = self.registers
+        f = self.float_registers
+        fbits = self.float_bits
+        hilo = self.hilo
+        condition = self.condition
+        memory = self.memory
+        words = self.words
+        size = len(memory)
+
+        def checked(address, alignment):
+            offset = address - DATA_BASE
+            if not 0 <= offset < size:
+                raise RuntimeError(f"Address out of range: {address:#x}")
+            if offset % alignment:
+                raise RuntimeError(f"Unaligned address: {address:#x}")
+            return offset
+
+        def nop(pc, a, b, c):
+            return pc + 1
+
+        def li(pc, a, b, c):
+            r[a] = b
+            return pc + 1
+
+        def move(pc, a, b, c):
+            r[a] = r[b]
+            return pc + 1
+
+        def add(pc, a, b, c):
+            r[a] = (r[b] + r[c] + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def addi(pc, a, b, c):
+            r[a] = (r[b] + c + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def sub(pc, a, b, c):
+            r[a] = (r[b] - r[c] + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def subi(pc, a, b, c):
+            r[a] = (r[b] - c + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def mul(pc, a, b, c):
+            r[a] = (r[b] * r[c] + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def muli(pc, a, b, c):
+            r[a] = (r[b] * c + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def div(pc, a, b, c):
+            r[a] = quotient(r[b], r[c])
+            return pc + 1
+
+        def divi(pc, a, b, c):
+            r[a] = quotient(r[b], c)
+            return pc + 1
+
+        def div_hilo(pc, a, b, c):
+            # A zero divisor leaves hi and lo as they were
+            if r[b]:
+                dividend, divisor = r[a], r[b]
+                result = abs(dividend) // abs(divisor)
+                if (dividend < 0) != (divisor < 0):
+                    result = -result
+                hilo[0] = dividend - result * divisor
+                hilo[1] = wrap(result)
+            return pc + 1
+
+        def mult(pc, a, b, c):
+            product = r[a] * r[b]
+            hilo[0] = product >> 32
+            hilo[1] = (product + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def mfhi(pc, a, b, c):
+            r[a] = hilo[0]
+            return pc + 1
+
+        def mflo(pc, a, b, c):
+            r[a] = hilo[1]
+            return pc + 1
+
+        def and_(pc, a, b, c):
+            r[a] = r[b] & r[c]
+            return pc + 1
+
+        def andi(pc, a, b, c):
+            r[a] = r[b] & c
+            return pc + 1
+
+        def or_(pc, a, b, c):
+            r[a] = r[b] | r[c]
+            return pc + 1
+
+        def ori(pc, a, b, c):
+            r[a] = r[b] | c
+            return pc + 1
+
+        def xor(pc, a, b, c):
+            r[a] = r[b] ^ r[c]
+            return pc + 1
+
+        def xori(pc, a, b, c):
+            r[a] = r[b] ^ c
+            return pc + 1
+
+        def nor(pc, a, b, c):
+            r[a] = ~(r[b] | r[c])
+            return pc + 1
+
+        def slt(pc, a, b, c):
+            r[a] = 1 if r[b] < r[c] else 0
+            return pc + 1
+
+        def slti(pc, a, b, c):
+            r[a] = 1 if r[b] < c else 0
+            return pc + 1
+
+        def sgt(pc, a, b, c):
+            r[a] = 1 if r[b] > r[c] else 0
+            return pc + 1
+
+        def sgti(pc, a, b, c):
+            r[a] = 1 if r[b] > c else 0
+            return pc + 1
+
+        def sle(pc, a, b, c):
+            r[a] = 1 if r[b] <= r[c] else 0
+            return pc + 1
+
+        def slei(pc, a, b, c):
+            r[a] = 1 if r[b] <= c else 0
+            return pc + 1
+
+        def sge(pc, a, b, c):
+            r[a] = 1 if r[b] >= r[c] else 0
+            return pc + 1
+
+        def sgei(pc, a, b, c):
+            r[a] = 1 if r[b] >= c else 0
+            return pc + 1
+
+        def seq(pc, a, b, c):
+            r[a] = 1 if r[b] == r[c] else 0
+            return pc + 1
+
+        def seqi(pc, a, b, c):
+            r[a] = 1 if r[b] == c else 0
+            return pc + 1
+
+        def sne(pc, a, b, c):
+            r[a] = 1 if r[b] != r[c] else 0
+            return pc + 1
+
+        def snei(pc, a, b, c):
+            r[a] = 1 if r[b] != c else 0
+            return pc + 1
+
+        def sll(pc, a, b, c):
+            r[a] = ((r[b] << (c & 31)) + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def sllv(pc, a, b, c):
+            r[a] = ((r[b] << (r[c] & 31)) + SIGN & MASK) - SIGN
+            return pc + 1
+
+        def sra(pc, a, b, c):
+            r[a] = r[b] >> (c & 31)
+            return pc + 1
+
+        def srav(pc, a, b, c):
+            r[a] = r[b] >> (r[c] & 31)
+            return pc + 1
+
+        def srl(pc, a, b, c):
+            r[a] = ((r[b] & MASK) >> (c & 31) ^ SIGN) - SIGN
+            return pc + 1
+
+        def srlv(pc, a, b, c):
+            r[a] = ((r[b] & MASK) >> (r[c] & 31) ^ SIGN) - SIGN
+            return pc + 1
+
+        def lw(pc, a, b, c):
+            r[a] = words[b >> 2]
+            return pc + 1
+
+        def lw_register(pc, a, b, c):
+            r[a] = words[checked(r[b] + c, 4) >> 2]
+            return pc + 1
+
+        def sw(pc, a, b, c):
+            words[b >> 2] = r[a]
+            return pc + 1
+
+        def sw_register(pc, a, b, c):
+            words[checked(r[b] + c, 4) >> 2] = r[a]
+            return pc + 1
+
+        def lb(pc, a, b, c):
+            r[a] = (memory[b] ^ 0x80) - 0x80
+            return pc + 1
+
+        def lb_register(pc, a, b, c):
+            r[a] = (memory[checked(r[b] + c, 1)] ^ 0x80) - 0x80
+            return pc + 1
+
+        def sb(pc, a, b, c):
+            memory[b] = r[a] & 0xFF
+            return pc + 1
+
+        def sb_register(pc, a, b, c):
+            memory[checked(r[b] + c, 1)] = r[a] & 0xFF
+            return pc + 1
+
+        def l_s(pc, a, b, c):
+            fbits[a] = words[b >> 2]
+            return pc + 1
+
+        def l_s_register(pc, a, b, c):
+            fbits[a] = words[checked(r[b] + c, 4) >> 2]
+            return pc + 1
+
+        def s_s(pc, a, b, c):
+            words[b >> 2] = fbits[a]
+            return pc + 1
+
+        def s_s_register(pc, a, b, c):
+            words[checked(r[b] + c, 4) >> 2] = fbits[a]
+            return pc + 1
+
+        def mov_s(pc, a, b, c):
+            fbits[a] = fbits[b]
+            return pc + 1
+
+        def mtc1(pc, a, b, c):
+            fbits[b] = r[a]
+            return pc + 1
+
+        def mfc1(pc, a, b, c):
+            r[a] = fbits[b]
+            return pc + 1
+
+        def cvt_s_w(pc, a, b, c):
+            f[a] = fbits[b]
+            return pc + 1
+
+        def add_s(pc, a, b, c):
+            f[a] = f[b] + f[c]
+            return pc + 1
+
+        def sub_s(pc, a, b, c):
+            f[a] = f[b] - f[c]
+            return pc + 1
+
+        def mul_s(pc, a, b, c):
+            f[a] = f[b] * f[c]
+            return pc + 1
+
+        def div_s(pc, a, b, c):
+            f[a] = f[b] / f[c] if f[c] else divide_by_zero(f[b], f[c])
+            return pc + 1
+
+        def c_lt_s(pc, a, b, c):
+            condition[0] = f[a] < f[b]
+            return pc + 1
+
+        def c_le_s(pc, a, b, c):
+            condition[0] = f[a] <= f[b]
+            return pc + 1
+
+        def c_eq_s(pc, a, b, c):
+            condition[0] = f[a] == f[b]
+            return pc + 1
+
+        def movf(pc, a, b, c):
+            if not condition[0]:
+                r[a] = r[b]
+            return pc + 1
+
+        def movt(pc, a, b, c):
+            if condition[0]:
+                r[a] = r[b]
+            return pc + 1
+
+        def bc1t(pc, a, b, c):
+            return a if condition[0] else pc + 1
+
+        def bc1f(pc, a, b, c):
+            return pc + 1 if condition[0] else a
+
+        def beq(pc, a, b, c):
+            return c if r[a] == r[b] else pc + 1
+
+        def beqi(pc, a, b, c):
+            return c if r[a] == b else pc + 1
+
+        def bne(pc, a, b, c):
+            return c if r[a] != r[b] else pc + 1
+
+        def bnei(pc, a, b, c):
+            return c if r[a] != b else pc + 1
+
+        def blt(pc, a, b, c):
+            return c if r[a] < r[b] else pc + 1
+
+        def blti(pc, a, b, c):
+            return c if r[a] < b else pc + 1
+
+        def bgt(pc, a, b, c):
+            return c if r[a] > r[b] else pc + 1
+
+        def bgti(pc, a, b, c):
+            return c if r[a] > b else pc + 1
+
+        def ble(pc, a, b, c):
+            return c if r[a] <= r[b] else pc + 1
+
+        def blei(pc, a, b, c):
+            return c if r[a] <= b else pc + 1
+
+        def bge(pc, a, b, c):
+            return c if r[a] >= r[b] else pc + 1
+
+        def bgei(pc, a, b, c):
+            return c if r[a] >= b else pc + 1
+
+        def teq(pc, a, b, c):
+            # The generator puts one before every div whose divisor may be zero
+            if r[a] == r[b]:
+                raise RuntimeError(TRAP_MESSAGE)
+            return pc + 1
+
+        def beqz(pc, a, b, c):
+            return b if r[a] == 0 else pc + 1
+
+        def bnez(pc, a, b, c):
+            return b if r[a] != 0 else pc + 1
+
+        def j(pc, a, b, c):
+            return a
+
+        def jal(pc, a, b, c):
+            r[31] = TEXT_BASE + 4 * (pc + 1)
+            return a
+
+        def jr(pc, a, b, c):
+            return (r[a] - TEXT_BASE) >> 2
+
+        def exit(pc, a, b, c):
+            raise Exit()
+
+        services = {
+            1: self.print_int,
+            2: self.print_float,
+            4: self.print_string,
+            5: self.read_int,
+            6: self.read_float,
+            8: self.read_string,
+            10: self.exit,
+            11: self.print_char,
+        }
+
+        def syscall(pc, a, b, c):
+            service = services.get(r[2])
+            if service is None:
+                raise RuntimeError(f"Unsupported syscall: {r[2]}")
+            service()
+            return pc + 1
+
+        handlers = {
+            'nop': nop, 'li': li, 'la': li, 'move': move,
+            'add': add, 'add immediate': addi, 'addu': add, 'addu immediate': addi,
+            'addi': addi, 'addiu': addi,
+            'sub': sub, 'sub immediate': subi, 'subu': sub, 'subu immediate': subi,
+            'mul': mul, 'mul immediate': muli, 'div': div, 'div immediate': divi,
+            'div hilo': div_hilo, 'mult': mult, 'mfhi': mfhi, 'mflo': mflo,
+            'and': and_, 'and immediate': andi, 'andi': andi,
+            'or': or_, 'or immediate': ori, 'ori': ori,
+            'xor': xor, 'xor immediate': xori, 'xori': xori, 'nor': nor,
+            'slt': slt, 'slt immediate': slti, 'slti': slti,
+            'sgt': sgt, 'sgt immediate': sgti, 'sle': sle, 'sle immediate': slei,
+            'sge': sge, 'sge immediate': sgei, 'seq': seq, 'seq immediate': seqi,
+            'sne': sne, 'sne immediate': snei,
+            'sll': sll, 'sllv': sllv, 'sra': sra, 'srav': srav, 'srl': srl, 'srlv': srlv,
+            'lw': lw, 'lw register': lw_register, 'sw': sw, 'sw register': sw_register,
+            'lb': lb, 'lb register': lb_register, 'sb': sb, 'sb register': sb_register,
+            'l.s': l_s, 'l.s register': l_s_register, 's.s': s_s, 's.s register': s_s_register,
+            'mov.s': mov_s, 'mtc1': mtc1, 'mfc1': mfc1, 'cvt.s.w': cvt_s_w,
+            'add.s': add_s, 'sub.s': sub_s, 'mul.s': mul_s, 'div.s': div_s,
+            'c.lt.s': c_lt_s, 'c.le.s': c_le_s, 'c.eq.s': c_eq_s,
+            'movf': movf, 'movt': movt, 'bc1t': bc1t, 'bc1f': bc1f,
+            'beq': beq, 'beq immediate': beqi, 'bne': bne, 'bne immediate': bnei,
+            'blt': blt, 'blt immediate': blti, 'bgt': bgt, 'bgt immediate': bgti,
+            'ble': ble, 'ble immediate': blei, 'bge': bge, 'bge immediate': bgei,
+            'beqz': beqz, 'bnez': bnez, 'j': j, 'jal': jal, 'jr': jr,
+            'teq': teq, 'syscall': syscall, 'exit': exit,
+        }
+        return handlers
+
+    def print_int(self):
+        self.stdout.write(str(self.registers[4]))
+
+    def print_float(self):
+        self.stdout.write(format_float(self.float_registers[12]))
+
+    def print_string(self):
+        start = self.registers[4] - DATA_BASE
+        if not 0 <= start < len(self.memory):
+            raise RuntimeError(f"Address out of range: {self.registers[4]:#x}")
+        end = self.memory.find(0, start)
+        self.stdout.write(self.memory[start:end].decode('utf-8', 'replace'))
+
+    def print_char(self):
+        self.stdout.write(chr(self.registers[4] & 0xFF))
+
+    def read_line(self):
+        line = self.stdin.readline()
+        if not line:
+            raise RuntimeError("End of input")
+        return line
+
+    def read_int(self):
+        line = self.read_line()
+        try:
+            self.registers[2] = wrap(int(line.strip()))
+        except ValueError:
+            raise ValueError(f"Invalid integer input: {line.strip()!r}") from None
+
+    def read_float(self):
+        line = self.read_line()
+        try:
+            self.float_registers[0] = float(line.strip())
+        except ValueError:
+            raise ValueError(f"Invalid float input: {line.strip()!r}") from None
+
+    def read_string(self):
+        # Up to $a1 - 1 bytes of the line, newline included and cut between
+        # characters, then a terminator
+        buffer, length = self.registers[4], self.registers[5]
+        if length < 1:
+            return
+        text = fit_utf8(self.read_line().encode('utf-8'), length - 1) + b'\0'
+        start = buffer - DATA_BASE
+        if not 0 <= start <= len(self.memory) - len(text):
+            raise RuntimeError(f"Address out of range: {buffer:#x}")
+        self.memory[start:start + len(text)] = text
+
+    def exit(self):
+        raise Exit()
+
+# Operand kinds of each op: r register, f float register, i immediate or
+# label address, x register or immediate, m memory (label or offset($base)),
+# l code label
+OPERANDS = {
+    'nop': '', 'syscall': '', 'teq': 'rr', 'li': 'ri', 'la': 'ri', 'move': 'rr', 'div hilo': 'rr',
+    'addi': 'rri', 'addiu': 'rri', 'andi': 'rri', 'ori': 'rri', 'xori': 'rri', 'slti': 'rri',
+    'sll': 'rri', 'sra': 'rri', 'srl': 'rri', 'sllv': 'rrr', 'srav': 'rrr', 'srlv': 'rrr',
+    'nor': 'rrr', 'mult': 'rr', 'mfhi': 'r', 'mflo': 'r',
+    'lw': 'rm', 'sw': 'rm', 'lb': 'rm', 'sb': 'rm', 'l.s': 'fm', 's.s': 'fm',
+    'mov.s': 'ff', 'mtc1': 'rf', 'mfc1': 'rf', 'cvt.s.w': 'ff',
+    'add.s': 'fff', 'sub.s': 'fff', 'mul.s': 'fff', 'div.s': 'fff',
+    'c.lt.s': 'ff', 'c.le.s': 'ff', 'c.eq.s': 'ff',
+    'movf': 'rri', 'movt': 'rri', 'bc1t': 'l', 'bc1f': 'l',
+    'beqz': 'rl', 'bnez': 'rl', 'j': 'l', 'jal': 'l', 'jr': 'r',
+}
+for op in ('add', 'addu', 'sub', 'subu', 'mul', 'div', 'and', 'or', 'xor',
+           'slt', 'sgt', 'sle', 'sge', 'seq', 'sne'):
+    OPERANDS[op] = 'rrx'
+for op in ('beq', 'bne', 'blt', 'bgt', 'ble', 'bge'):
+    OPERANDS[op] = 'rxl'
+
+# Ops whose first register operand is read, not written
+READ_FIRST = frozenset((
+    'sw', 'sb', 'mult', 'div hilo', 'mtc1', 'jr', 'teq',
+    'beq', 'bne', 'blt', 'bgt', 'ble', 'bge', 'beqz', 'bnez',
+))
+
+def wrap(value):
+    """
+    value as a signed 32-bit integer.
+    """
+    return (value + SIGN & MASK) - SIGN
+
+# Storing into a float array rounds to single precision
+single_box = array.array('f', [0.0])
+
+def single(value):
+    """
+    value rounded to single precision, as a .float or a float register holds it.
+    """
+    single_box[0] = value
+    return single_box[0]
+
+def fit_utf8(data, size):
+    """
+    UTF-8 data cut to at most size bytes without splitting a character, as
+    rt.strcpy cuts it.
+    """
+    if len(data) <= size:
+        return data
+    # Back up from a continuation byte (10xxxxxx) to the lead byte of its character
+    while size > 0 and data[size] & 0xC0 == 0x80:
+        size -= 1
+    return data[:size]
+
+def divide_by_zero(dividend, divisor):
+    """
+    What IEEE 754 division by a zero divisor gives, as div.s does: an
+    infinity with the sign of the operands, or NaN for 0/0 and NaN/0.
+    """
+    if dividend and not math.isnan(dividend):
+        return math.copysign(math.inf, dividend) * math.copysign(1.0, divisor)
+    return math.nan
+
+def quotient(dividend, divisor):
+    """
+    Signed 32-bit division, truncating toward zero like div.
+    """
+    if divisor == 0:
+        raise RuntimeError("Division by zero")
+    result = abs(dividend) // abs(divisor)
+    return wrap(result if (dividend < 0) == (divisor < 0) else -result)
+
+def unescape(text):
+    characters = []
+    index = 0
+    while index < len(text):
+        character = text[index]
+        if character == '\\' and index + 1 < len(text):
+            index += 1
+            character = ESCAPES.get(text[index], '\\' + text[index])
+        characters.append(character)
+        index += 1
+    return ''.join(characters)
+
+def format_float(value):
+    """
+    A single-precision value the way MARS prints it (Java's Float.toString):
+    the fewest digits that read back as the same float, in plain notation
+    from 10^-3 up to 10^7 and as d.dddE<n> outside that.
+    """
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if value == 0:
+        return '-0.0' if math.copysign(1.0, value) < 0 else '0.0'
+    for precision in range(1, 10):
+        text = f"{value:.{precision - 1}e}"
+        if struct.unpack('f', struct.pack('f', float(text)))[0] == value:
+            break
+    mantissa, _, exponent = text.partition('e')
+    sign = '-' if mantissa.startswith('-') else ''
+    digits = mantissa.lstrip('-').replace('.', '').rstrip('0') or '0'
+    exponent = int(exponent)
+    if 1e-3 <= abs(value) < 1e7:
+        if exponent >= 0:
+            whole = digits[:exponent + 1].ljust(exponent + 1, '0')
+            fraction = digits[exponent + 1:] or '0'
+        else:
+            whole = '0'
+            fraction = '0' * (-exponent - 1) + digits
+        return f"{sign}{whole}.{fraction}"
+    return f"{sign}{digits[0]}.{digits[1:] or '0'}E{exponent}"
+
+def main():
+    import io
+    import time
+
+    import compiler
+
+    input_code = """
+    tally n;
+    summon n;
+    tally total imbue with 0;
+    tally i imbue with 0;
+    cycle (i falls below n) {
+        total imbue with total augmented by i fragmented by 3;
+        i imbue with i augmented by 1;
+    }
+    portion mean imbue with total fragmented by n;
+    cast spell total spell " " spell mean;
+    """
+    simulator = Simulator(compiler.compile_source(input_code))
+    output = io.StringIO()
+    start = time.perf_counter()
+    steps = simulator.run(io.StringIO("100000\n"), output)
+    elapsed = time.perf_counter() - start
+    print(output.getvalue())
+    print(f"{steps} instructions in {elapsed:.3f}s ({steps / elapsed / 1e6:.1f}M/s)")
+
+if __name__ == "__main__":
+    main()
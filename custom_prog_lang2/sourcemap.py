@@ -0,0 +1,115 @@
+import json
+
+# Source maps for the generated MIPS. Instructions of the text section are
+# numbered from 0 as simulator.Simulator numbers them (instruction i is at
+# TEXT_BASE + 4 * i), and the map gives the line and column of the statement
+# each one was generated from, or None for code no statement produced: the
+# registers set up on entry, the final exit and the runtime routines. Code a
+# trial or cycle tests its condition with maps to the trial or cycle itself.
+#
+# Written as JSON next to the .asm, as <name>.asm.map:
+#
+#   {"version": 1, "file": "output.asm", "mappings": [[1, 0], [1, 0], [2, 4], null]}
+
+VERSION = 1
+
+# Appended to the assembly file's name
+SUFFIX = '.map'
+
+class SourceMap:
+    def __init__(self, positions=None, file=None):
+        """
+        positions holds a (line, column) or None per instruction; file names
+        the assembly the map belongs to, if known.
+        """
+        self.positions = [] if positions is None else positions
+        self.file = file
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position):
+        """
+        Record the position of the next instruction.
+        """
+        self.positions.append(position)
+
+    def lookup(self, index):
+        """
+        (line, column) of instruction index, or None if no statement
+        produced it or there is no such instruction.
+        """
+        if 0 <= index < len(self.positions):
+            return self.positions[index]
+        return None
+
+    def instructions(self, line):
+        """
+        Indexes of the instructions generated from statements starting on line.
+        """
+        return [index for index, position in enumerate(self.positions)
+                if position is not None and position[0] == line]
+
+    def to_dict(self):
+        return {
+            'version': VERSION,
+            'file': self.file,
+            'mappings': [None if position is None else list(position) for position in self.positions],
+        }
+
+    def dumps(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.dumps())
+            file.write('\n')
+
+def loads(text):
+    """
+    The SourceMap serialized in text by SourceMap.dumps.
+    """
+    data = json.loads(text)
+    if data.get('version') != VERSION:
+        raise ValueError(f"Unsupported source map version: {data.get('version')}")
+    positions = [None if position is None else tuple(position) for position in data['mappings']]
+    return SourceMap(positions, data.get('file'))
+
+def read(path):
+    with open(path, encoding='utf-8') as file:
+        return loads(file.read())
+
+def map_path(asm_path):
+    """
+    Where the source map of the assembly at asm_path goes.
+    """
+    return asm_path + SUFFIX
+
+def main():
+    import io
+
+    import compiler
+    import simulator
+
+    input_code = """tally n;
+summon n;
+cycle (n exceeds 0) {
+    cast spell n spell " ";
+    n imbue with n diminished by 1;
+}
+tally m;
+summon m;
+"""
+    # Input runs out at the second summon, and the map finds it from where
+    # the simulator stopped
+    assembly, source_map = compiler.compile_with_map(input_code)
+    machine = simulator.Simulator(assembly)
+    try:
+        machine.run(io.StringIO("3\n"))
+    except RuntimeError as exc:
+        line, column = source_map.lookup(machine.pc)
+        print(f"\n{exc} at line {line}, column {column}: {input_code.splitlines()[line - 1]}")
+    print(source_map.dumps())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+
+# Scoped symbol table. Every declaration gets the next slot index, numbered
+# across the whole program, so a back end can keep all variables in one flat
+# list indexed by slot instead of hashing names on every access. Names are
+# interned, which makes the per-scope dict lookups compare by identity.
+
+class Symbol:
+    __slots__ = ('name', 'data_type', 'slot', 'depth')
+
+    def __init__(self, name, data_type, slot, depth):
+        self.name = name
+        self.data_type = data_type
+        self.slot = slot
+        self.depth = depth
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.data_type!r}, slot {self.slot}, depth {self.depth})"
+
+class SymbolTable:
+    """
+    A stack of scopes, innermost last. trial and cycle bodies each open a
+    scope; names declared in one are not visible after its closing `}`.
+    """
+    def __init__(self):
+        self.scopes = [{}]
+        # Every symbol ever declared, indexed by slot
+        self.symbols = []
+
+    @property
+    def depth(self):
+        return len(self.scopes) - 1
+
+    @property
+    def slot_count(self):
+        return len(self.symbols)
+
+    def push_scope(self):
+        self.scopes.append({})
+
+    def pop_scope(self):
+        if len(self.scopes) == 1:
+            raise ValueError("Cannot pop the global scope")
+        self.scopes.pop()
+
+    def declare(self, name, data_type):
+        """
+        Declare name in the innermost scope and return its new Symbol.
+        Redeclaration is reported by the caller, which can resolve() first.
+        """
+        name = sys.intern(name)
+        symbol = Symbol(name, data_type, len(self.symbols), self.depth)
+        self.symbols.append(symbol)
+        self.scopes[-1][name] = symbol
+        return symbol
+
+    def resolve(self, name):
+        """
+        The Symbol name refers to from the innermost scope, or None.
+        """
+        for scope in reversed(self.scopes):
+            symbol = scope.get(name)
+            if symbol is not None:
+                return symbol
+        return None
+
+def main():
+    table = SymbolTable()
+    table.declare('x', 'tally')
+    table.push_scope()
+    table.declare('y', 'verse')
+    print(table.resolve('x'), table.resolve('y'))
+    table.pop_scope()
+    print(table.resolve('y'), table.slot_count)
+
+if __name__ == "__main__":
+    main()
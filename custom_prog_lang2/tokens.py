@@ -0,0 +1,49 @@
+# Token kinds, reserved words and the Token class, shared by the regex lexer
+# (lexer) and the table-driven scanner (scanner) so that neither has to import
+# the other for them. lexer re-exports all of these under their old names.
+
+# Reserved words and the token kind each one lexes as
+KEYWORDS = {
+    'tally': 'DATA_TYPE',
+    'rune': 'DATA_TYPE',
+    'verse': 'DATA_TYPE',
+    'portion': 'DATA_TYPE',
+    'summon': 'INPUT',
+    'cast': 'OUTPUT',
+    'spell': 'OUTPUT_CASE',
+    'trial': 'IF_STATEMENT',
+    'cycle': 'FOR_STATEMENT',
+}
+
+# Operators; the words of multi-word operators are separated by exactly one space
+OPERATORS = (
+    'imbue with',
+    'augmented by', 'diminished by', 'amplified by', 'fragmented by',
+    'augment by', 'diminish by', 'amplify by', 'fragment by',
+    # Comparisons and logic, for trial and cycle conditions
+    'exceeds', 'falls below', 'at least', 'at most', 'mirrors', 'defies',
+    'and', 'or',
+)
+
+# Every token kind, in lexer.TOKEN_SPECIFICATION order
+TOKEN_KINDS = (
+    'DATA_TYPE', 'INPUT', 'OUTPUT', 'OUTPUT_CASE', 'NUMBER', 'STRING', 'CHAR', 'OPERATOR',
+    'IF_STATEMENT', 'FOR_STATEMENT', 'VARIABLE_NAME', 'PUNCTUATION', 'SEMI_COLON',
+    'START_IF_FOR', 'END_IF_FOR', 'SKIP', 'NEWLINE', 'SINGLE_COMMENT', 'MULTI_COMMENT', 'MISMATCH',
+)
+# Integer kind codes; the parser dispatches on these
+KIND_CODES = {name: code for code, name in enumerate(TOKEN_KINDS)}
+
+# Token class for structured storage
+class Token:
+    __slots__ = ('type', 'value', 'line', 'column', 'kind')
+
+    def __init__(self, type_, value, line, column):
+        self.type = type_
+        self.value = value
+        self.line = line
+        self.column = column
+        self.kind = KIND_CODES[type_]
+
+    def __repr__(self):
+        return f"Token({self.type}, {repr(self.value)}, Line {self.line}, Col {self.column})"
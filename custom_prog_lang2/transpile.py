@@ -0,0 +1,347 @@
+import array
+import functools
+import sys
+
+import bytecode
+import lexer
+import parser
+import semantic
+import simulator
+
+# Python backend: translates a checked AST into the source of one Python
+# function, with every variable a local of it, and compiles that once with
+# compile(). Running the program is then a call to the function, so it goes
+# at the speed of CPython bytecode however many times it is run with
+# different input. compile_source caches the result by source text.
+#
+# The semantics are those of the bytecode VM (see bytecode): wrapping 32-bit
+# tallies, single-precision portions, verses of at most VERSE_LIMIT bytes
+# of UTF-8, and and/or evaluating both operands. A tally divided by zero
+# stops the program; a portion divided by zero is an infinity or NaN.
+
+# Programs compile_source keeps compiled, least recently used dropped first
+CACHE_SIZE = 128
+
+# File name the generated code reports in tracebacks
+FILENAME = '<transpiled>'
+
+INDENT = '    '
+
+# Python operators of the arithmetic operators on tallies and portions, and of the comparisons
+ARITHMETIC_OPERATORS = {'augmented by': '+', 'diminished by': '-', 'amplified by': '*'}
+COMPARISON_OPERATORS = {'falls below': '<', 'exceeds': '>', 'at most': '<=', 'at least': '>=',
+                        'mirrors': '==', 'defies': '!='}
+# & and | evaluate both sides, as the other backends do
+LOGICAL_OPERATORS = {'and': '&', 'or': '|'}
+
+def wrap(text):
+    """
+    The source of a tally expression wrapped to 32 bits.
+    """
+    return f"((({text}) + 0x80000000 & 0xFFFFFFFF) - 0x80000000)"
+
+# Runtime helpers the generated code calls, by name
+single_box = array.array('f', [0.0])
+
+def single(value):
+    single_box[0] = value
+    return single_box[0]
+
+def divide_tally(dividend, divisor):
+    if divisor == 0:
+        raise ZeroDivisionError("Division by zero")
+    quotient = abs(dividend) // abs(divisor)
+    return simulator.wrap(quotient if (dividend < 0) == (divisor < 0) else -quotient)
+
+def divide_portion(dividend, divisor):
+    if divisor == 0:
+        return simulator.divide_by_zero(dividend, divisor)
+    return single(dividend / divisor)
+
+def read_line(stdin):
+    line = stdin.readline()
+    if not line:
+        raise EOFError("End of input")
+    return line
+
+def read_tally(stdin, name):
+    line = read_line(stdin)
+    try:
+        return simulator.wrap(int(line.strip()))
+    except ValueError:
+        raise ValueError(f"Invalid input for variable '{name}' of type 'tally'") from None
+
+def read_portion(stdin, name):
+    line = read_line(stdin)
+    try:
+        return single(float(line.strip()))
+    except ValueError:
+        raise ValueError(f"Invalid input for variable '{name}' of type 'portion'") from None
+
+def read_verse(stdin, name):
+    return bytecode.fit_verse(read_line(stdin))
+
+HELPERS = {
+    'single': single,
+    'divide_tally': divide_tally,
+    'divide_portion': divide_portion,
+    'read_tally': read_tally,
+    'read_portion': read_portion,
+    'read_verse': read_verse,
+    'fit_verse': bytecode.fit_verse,
+    'format_float': simulator.format_float,
+}
+
+class TranspiledProgram:
+    """
+    A program compiled to a Python function. source is the generated Python
+    and code its code object.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.code = compile(source, FILENAME, 'exec')
+        namespace = dict(HELPERS)
+        exec(self.code, namespace)
+        self.function = namespace['program']
+
+    def run(self, stdin=None, stdout=None):
+        """
+        Run the program, reading summon input a line at a time from stdin and
+        writing output to stdout (text streams, sys.stdin and sys.stdout by
+        default).
+        """
+        stdout = sys.stdout if stdout is None else stdout
+        try:
+            self.function(sys.stdin if stdin is None else stdin, stdout.write)
+        finally:
+            stdout.flush()
+
+class Transpiler:
+    """
+    Translates an AST built by Parser(tokens, evaluate=False) and checked by
+    semantic.SemanticAnalyzer into the source of a Python function
+    program(stdin, write).
+    """
+    def __init__(self):
+        self.lines = []
+        self.depth = 1
+        # (local name, data type) by slot; variables parsed without slots fall back to their name
+        self.locals = {}
+        self.handlers = {
+            'variable_declaration': self.translate_variable_declaration,
+            'variable_assignment': self.translate_variable_assignment,
+            'input_statement': self.translate_input_statement,
+            'output_statement': self.translate_output_statement,
+            'if_statement': self.translate_if_statement,
+            'for_statement': self.translate_for_statement,
+        }
+
+    def translate(self, ast):
+        self.lines.append("def program(stdin, write):")
+        for node in ast:
+            self.translate_statement(node)
+        self.line("return")
+        return '\n'.join(self.lines) + '\n'
+
+    def line(self, text):
+        self.lines.append(INDENT * self.depth + text)
+
+    def declare(self, node):
+        key = node['variable'] if node.get('slot') is None else node['slot']
+        name = f"{node['variable']}_{len(self.locals)}"
+        self.locals[key] = (name, node['data_type'])
+        return name
+
+    def lookup(self, slot, name):
+        """
+        The local name of a variable reference and its data type.
+        """
+        return self.locals[name if slot is None else slot]
+
+    def translate_statement(self, node):
+        handler = self.handlers.get(node['type'])
+        if handler is None:
+            raise ValueError(f"Unknown node type: {node['type']}")
+        handler(node)
+
+    def translate_body(self, body):
+        self.depth += 1
+        for statement in body:
+            self.translate_statement(statement)
+        if not body:
+            self.line("pass")
+        self.depth -= 1
+
+    def translate_variable_declaration(self, node):
+        # The initializer cannot refer to the variable, so it is translated first
+        if 'expression' in node:
+            value = self.value(node['data_type'], node['variable'], node['expression'])
+        else:
+            value = repr(bytecode.DEFAULT_VALUES[node['data_type']])
+        self.line(f"{self.declare(node)} = {value}")
+
+    def translate_variable_assignment(self, node):
+        name, data_type = self.lookup(node.get('slot'), node['variable'])
+        self.line(f"{name} = {self.value(data_type, node['variable'], node['expression'])}")
+
+    def value(self, data_type, name, expression):
+        """
+        The source of expression as a value for a variable of data_type.
+        """
+        if data_type == 'rune' and expression['type'] == 'string':
+            # Runes are written as one-character string literals
+            return repr(simulator.unescape(expression['value'][1:-1]))
+        text, value_type = self.expression(expression)
+        return self.convert(text, value_type, data_type, name)
+
+    def convert(self, text, value_type, data_type, name):
+        if data_type == 'portion' and value_type == 'tally':
+            return f"single({text})"
+        elif data_type == 'tally' and value_type == 'portion':
+            raise ValueError(f"Cannot store a portion value in tally '{name}'")
+        return text
+
+    def translate_input_statement(self, node):
+        name, data_type = self.lookup(node.get('slot'), node['variable'])
+        if data_type not in ('tally', 'portion', 'verse'):
+            raise TypeError(f"Unsupported data type: {data_type}")
+        self.line(f"{name} = read_{data_type}(stdin, {node['variable']!r})")
+
+    def translate_output_statement(self, node):
+        for expression in node['expressions']:
+            if expression['type'] == 'string':
+                self.line(f"write({simulator.unescape(expression['value'][1:-1])!r})")
+                continue
+            name, data_type = self.lookup(expression.get('slot'), expression['name'])
+            if data_type == 'portion':
+                self.line(f"write(format_float({name}))")
+            elif data_type == 'tally':
+                self.line(f"write(str({name}))")
+            else:
+                self.line(f"write({name})")
+
+    def translate_if_statement(self, node):
+        self.line(f"if {self.condition(node['condition'])}:")
+        self.translate_body(node['body'])
+
+    def translate_for_statement(self, node):
+        self.line(f"while {self.condition(node['condition'])}:")
+        self.translate_body(node['body'])
+
+    def condition(self, node):
+        """
+        The source of a trial or cycle condition. Only its truth matters, so
+        a comparison is tested directly instead of made 1 or 0 first.
+        """
+        if node['type'] == 'binary_operation':
+            return self.operation(node, truth=True)[0]
+        return self.expression(node)[0]
+
+    def expression(self, node):
+        """
+        The Python source of an expression and its type.
+        """
+        if node['type'] == 'number':
+            if isinstance(node['value'], float):
+                # Rounded as the .float the generator pools it in
+                return repr(single(node['value'])), 'portion'
+            # Wrapped as the li that loads it wraps it
+            return repr(simulator.wrap(node['value'])), 'tally'
+        elif node['type'] == 'variable':
+            return self.lookup(node.get('slot'), node['name'])
+        elif node['type'] == 'string':
+            return repr(bytecode.fit_verse(simulator.unescape(node['value'][1:-1]))), 'verse'
+        elif node['type'] == 'char':
+            return repr(simulator.unescape(node['value'])), 'rune'
+        elif node['type'] in ('binary_operation', 'compound_assignment'):
+            return self.operation(node)
+        raise ValueError(f"Unsupported expression in Python transpiler: {node['type']}")
+
+    def operation(self, node, truth=False):
+        """
+        The source of an operator node and its type. With truth=True a
+        comparison or logical operator gives the bare test, a bool.
+        """
+        operator = bytecode.PLAIN_OPERATORS.get(node['operator'], node['operator'])
+        left, left_type = self.expression(node['left'])
+        right, right_type = self.expression(node['right'])
+
+        test = None
+        if left_type == 'verse':
+            text, result = f"fit_verse({left} + {right})", 'verse'
+        elif operator in LOGICAL_OPERATORS:
+            test = f"(({left}) != 0) {LOGICAL_OPERATORS[operator]} (({right}) != 0)"
+        else:
+            # A tally mixed with a portion is converted to one
+            if left_type == 'tally' and right_type == 'portion':
+                left = f"single({left})"
+            elif left_type == 'portion' and right_type == 'tally':
+                right = f"single({right})"
+            portion = 'portion' in (left_type, right_type)
+            if operator in COMPARISON_OPERATORS:
+                test = f"({left}) {COMPARISON_OPERATORS[operator]} ({right})"
+            elif operator == 'fragmented by':
+                text = f"divide_{'portion' if portion else 'tally'}({left}, {right})"
+                result = 'portion' if portion else 'tally'
+            elif portion:
+                text, result = f"single(({left}) {ARITHMETIC_OPERATORS[operator]} ({right}))", 'portion'
+            else:
+                text, result = wrap(f"({left}) {ARITHMETIC_OPERATORS[operator]} ({right})"), 'tally'
+        if test is not None:
+            if truth and node['type'] == 'binary_operation':
+                return test, 'tally'
+            text, result = f"(1 if {test} else 0)", 'tally'
+
+        if node['type'] == 'compound_assignment' and node['left']['type'] == 'variable':
+            # `x augment by 1` also stores the result back into x
+            name, data_type = self.lookup(node['left'].get('slot'), node['left']['name'])
+            if data_type == 'portion' and result == 'tally':
+                # x gets the converted value while the expression stays a tally
+                text = f"({name} := single(compound_value := {text}), compound_value)[1]"
+            else:
+                self.convert(text, result, data_type, node['left']['name'])
+                text = f"({name} := {text})"
+        return text, result
+
+def transpile(ast):
+    """
+    The Python source of a checked AST, as TranspiledProgram compiles it.
+    """
+    return Transpiler().translate(ast)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_source(text):
+    """
+    Lex, parse, check and transpile source text to a TranspiledProgram,
+    compiled once per distinct text.
+    """
+    ast = parser.Parser(lexer.lexical_analyzer(text), evaluate=False).parse()
+    semantic.SemanticAnalyzer().analyze(ast)
+    return TranspiledProgram(transpile(ast))
+
+def main():
+    import io
+    import time
+
+    input_code = """
+    tally n;
+    summon n;
+    tally total imbue with 0;
+    tally i imbue with 0;
+    cycle (i falls below n) {
+        total imbue with total augmented by i fragmented by 3;
+        i imbue with i augmented by 1;
+    }
+    portion mean imbue with total fragmented by n;
+    cast spell total spell " " spell mean;
+    """
+    program = compile_source(input_code)
+    print(program.source)
+    for n in (10, 100000):
+        output = io.StringIO()
+        start = time.perf_counter()
+        program.run(io.StringIO(f"{n}\n"), output)
+        print(f"n = {n}: {output.getvalue()} in {time.perf_counter() - start:.3f}s")
+
+if __name__ == "__main__":
+    main()